@@ -0,0 +1,392 @@
+# 性能基准：离线生成合成的招投标 PDF 语料（文本页、扫描页、内容部分重复的投标文件），分阶段计时，结果写入 JSON
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import (
+    BENCHMARK_SIZES, BENCHMARK_OUTPUT, BENCHMARK_SEED, BENCHMARK_SCANNED_DOCS, BENCHMARK_SCANNED_PAGES,
+    BENCHMARK_MAX_PAIRS, BENCHMARK_DB_NAME, BENCHMARK_FONT_PATH, MONGO_URI,
+)
+
+# 合成文本用的词句片段（随机组合成句子，不同文档之间只有少量偶然重复）
+_SUBJECTS = ["我公司", "本项目组", "项目负责人", "技术团队", "质量管理部门", "售后服务中心", "施工队伍", "监理单位",
+             "采购人", "供应商", "安全管理小组", "设备维护人员", "培训讲师", "财务部门", "档案管理员"]
+_ACTIONS = ["严格执行", "全面落实", "认真组织", "按期完成", "持续优化", "定期检查", "统筹安排", "及时响应",
+            "逐项核对", "重点保障", "科学制定", "规范管理", "动态跟踪", "分阶段实施", "集中部署"]
+_OBJECTS = ["施工组织设计", "质量保证方案", "安全文明施工措施", "进度计划", "设备采购清单", "人员配置方案",
+            "应急预案", "售后服务承诺", "技术培训计划", "验收标准", "材料进场检验", "隐蔽工程记录",
+            "合同履约条款", "信息化管理平台", "环境保护措施", "成本控制目标", "风险评估报告"]
+_DETAILS = ["确保工程质量达到合格标准", "做到责任到人、层层落实", "响应时间不超过两小时", "每周形成书面报告",
+            "符合国家及行业现行规范", "关键节点提前三天预警", "所有记录留档备查", "出现问题立即整改",
+            "保证满足采购文件全部要求", "配备专职人员负责", "采用标准化作业流程", "接受采购人全过程监督"]
+_CITIES = ["北京", "上海", "广州", "深圳", "杭州", "南京", "武汉", "成都", "西安", "重庆", "天津", "苏州"]
+_INDUSTRIES = ["建设工程", "信息技术", "环境科技", "智能装备", "市政工程", "电力工程", "数据服务", "安防科技"]
+_PROJECT_KINDS = ["办公楼改造工程", "智慧校园建设项目", "道路维修工程", "数据中心扩容项目", "污水处理设备采购",
+                  "安防监控系统采购", "园林绿化工程", "医疗设备采购项目"]
+
+
+def _sentence(rng):
+    return (f"{rng.choice(_SUBJECTS)}{rng.choice(_ACTIONS)}{rng.choice(_OBJECTS)}，"
+            f"{rng.choice(_DETAILS)}，编号{rng.randint(100, 999)}。")
+
+
+def _paragraph(rng, sentences=6):
+    return "".join(_sentence(rng) for _ in range(sentences))
+
+
+def _perturb(rng, paragraph, edits=3):
+    """近似重复：随机替换几个字符"""
+    chars = list(paragraph)
+    for _ in range(edits):
+        chars[rng.randrange(len(chars))] = rng.choice("的了和与及在对为")
+    return "".join(chars)
+
+
+def _company(rng):
+    return f"{rng.choice(_CITIES)}{rng.choice('华宏恒信诚达远泰')}{rng.choice('瑞博中科创源')}{rng.choice(_INDUSTRIES)}有限公司"
+
+
+def build_corpus(size, seed=BENCHMARK_SEED, paragraphs=20, bids_per_project=5):
+    """生成 size 个投标文件的文本，返回 [{"file_name", "text", "project", "source", "overlap"}]
+
+    每个项目 bids_per_project 份投标文件：第一份为原创，其余各以 overlap 比例的段落抄自第一份（少量改字），
+    overlap 取 0 / 0.3 / 0.6 / 0.9，可用来检查相似度方法的区分能力
+    """
+    rng = random.Random(seed)
+    corpus = []
+    project = None
+    for index in range(size):
+        if index % bids_per_project == 0:
+            number = f"ZB{rng.randint(2020, 2026)}-{rng.randint(1000, 9999)}"
+            project = {"name": f"{rng.choice(_CITIES)}市{rng.choice(_PROJECT_KINDS)}", "number": number,
+                       "first": None}
+        company = _company(rng)
+        header = (f"投标文件\n项目名称：{project['name']}\n项目编号：{project['number']}\n"
+                  f"投标单位名称：{company}\n法定代表人：{rng.choice('王李张刘陈杨赵黄')}某\n"
+                  f"投标报价：{rng.randint(100, 9999) * 1000}元\n投标单位联系电话：0{rng.randint(10, 99)}-{rng.randint(10000000, 99999999)}\n")
+        source = project["first"]
+        overlap = 0.0 if source is None else rng.choice([0.0, 0.3, 0.6, 0.9])
+        body = []
+        for slot in range(paragraphs):
+            if source is not None and rng.random() < overlap:
+                body.append(_perturb(rng, source["paragraphs"][slot]))
+            else:
+                body.append(_paragraph(rng))
+        item = {
+            "file_name": f"{index:05d}_{company}_投标文件.pdf",
+            "text": header + "\n".join(body),
+            "paragraphs": body,
+            "project": project["number"],
+            "source": None if source is None else source["file_name"],
+            "overlap": overlap,
+        }
+        if source is None:
+            project["first"] = item
+        corpus.append(item)
+    return corpus
+
+
+def _wrap(text, chars_per_line):
+    lines = []
+    for line in text.split("\n"):
+        lines.extend(line[i:i + chars_per_line] for i in range(0, max(len(line), 1), chars_per_line))
+    return lines
+
+
+def write_text_pdf(path, text, chars_per_line=38, lines_per_page=48):
+    """生成带文本层的 PDF（reportlab 内置的 STSong-Light CID 字体，不需要字体文件）"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.pdfgen import canvas
+
+    if "STSong-Light" not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont("STSong-Light"))
+    pdf = canvas.Canvas(path, pagesize=A4)
+    width, height = A4
+    lines = _wrap(text, chars_per_line)
+    pages = 0
+    for start in range(0, len(lines), lines_per_page):
+        pdf.setFont("STSong-Light", 12)
+        y = height - 60
+        for line in lines[start:start + lines_per_page]:
+            pdf.drawString(50, y, line)
+            y -= 15
+        pdf.showPage()
+        pages += 1
+    pdf.save()
+    return pages
+
+
+def _find_cjk_font():
+    candidates = [BENCHMARK_FONT_PATH,
+                  "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+                  "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+                  "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+                  r"C:\Windows\Fonts\simsun.ttc", r"C:\Windows\Fonts\msyh.ttc",
+                  "/System/Library/Fonts/PingFang.ttc"]
+    return next((path for path in candidates if path and os.path.exists(path)), None)
+
+
+def write_scanned_pdf(path, text, pages=BENCHMARK_SCANNED_PAGES, dpi=150, chars_per_line=38, lines_per_page=48):
+    """生成只有图片的 "扫描" PDF：Pillow 把文字画到 A4 灰度图上（加少量噪点），每页一张图片，没有文本层
+
+    没有找到中文字体（BENCHMARK_FONT_PATH）时用 Pillow 默认字体，OCR 识别结果没有意义，但耗时仍可参考
+    """
+    from PIL import Image, ImageDraw, ImageFont
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    font_path = _find_cjk_font()
+    font = ImageFont.truetype(font_path, int(dpi / 6)) if font_path else ImageFont.load_default()
+    rng = random.Random(len(text))
+    size = (int(A4[0] / 72 * dpi), int(A4[1] / 72 * dpi))
+    lines = _wrap(text, chars_per_line)
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for page in range(pages):
+        image = Image.new("L", size, 255)
+        draw = ImageDraw.Draw(image)
+        y = dpi // 2
+        for line in lines[page * lines_per_page:(page + 1) * lines_per_page]:
+            draw.text((dpi // 2, y), line, fill=0, font=font)
+            y += int(dpi / 5)
+        for _ in range(size[0] * size[1] // 2000):
+            image.putpixel((rng.randrange(size[0]), rng.randrange(size[1])), rng.randint(0, 160))
+        pdf.drawImage(ImageReader(image), 0, 0, width=A4[0], height=A4[1])
+        pdf.showPage()
+    pdf.save()
+    return pages
+
+
+@contextmanager
+def _stage(results, name, items=None):
+    """记录一个阶段的耗时：results[name] = {"seconds", "items", "per_item"}；阶段内的异常记为 error 而不中断基准"""
+    entry = {"seconds": None, "items": items}
+    results[name] = entry
+    start = time.perf_counter()
+    try:
+        yield entry
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+        print(f"[错误] 阶段 {name} 失败: {e}")
+    finally:
+        entry["seconds"] = round(time.perf_counter() - start, 6)
+        if entry.get("items"):
+            entry["per_item"] = round(entry["seconds"] / entry["items"], 6)
+
+
+def _skip(results, name, reason):
+    results[name] = {"skipped": reason}
+    print(f"[跳过] {name}: {reason}")
+
+
+def _isolate_caches(workdir):
+    """语料级模型、预处理缓存和 LSH 索引改用临时目录中的新实例（冷缓存，也不覆盖正式的缓存文件），向量不写入数据库"""
+    import corpus_models
+    import doc_artifacts
+    import lsh_index
+    corpus_models._corpus_tfidf = corpus_models.CorpusTfidf(path=os.path.join(workdir, "tfidf_vectorizer.pkl"))
+    corpus_models._corpus_word2vec = corpus_models.CorpusWord2Vec(path=os.path.join(workdir, "word2vec.model"),
+                                                                  persist_vectors=False)
+    corpus_models._embedding_store = corpus_models.EmbeddingStore(persist=False)
+    doc_artifacts._artifact_store = doc_artifacts.ArtifactStore(cache_dir=os.path.join(workdir, "artifacts"))
+    lsh_index._lsh_index = lsh_index.MinHashLSH(path=os.path.join(workdir, "minhash_lsh.pkl"))
+
+
+def _ocr_available():
+    from config import get_ocr_tools
+    try:
+        poppler_path, _ = get_ocr_tools()
+    except FileNotFoundError:
+        return False
+    return bool(poppler_path or shutil.which("pdftoppm"))
+
+
+def _mongo_available():
+    from pymongo import MongoClient
+    try:
+        MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000).admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+
+def bench_extraction(results, workdir, corpus, scanned_docs=BENCHMARK_SCANNED_DOCS):
+    """PDF 文本提取：文本页和扫描页（OCR）分开计时，不使用页面文本缓存"""
+    from pdf_reader import extract_pdf_text
+
+    pdf_dir = os.path.join(workdir, "pdfs")
+    os.makedirs(pdf_dir, exist_ok=True)
+    text_pdfs, text_pages = [], 0
+    with _stage(results, "generate.text_pdfs", len(corpus)):
+        for item in corpus:
+            path = os.path.join(pdf_dir, item["file_name"])
+            text_pages += write_text_pdf(path, item["text"])
+            text_pdfs.append(path)
+    with _stage(results, "extract.text_pages", text_pages):
+        for path in text_pdfs:
+            extract_pdf_text(path, ocr_workers=1, use_cache=False)
+
+    if not scanned_docs:
+        return
+    if not _ocr_available():
+        _skip(results, "extract.ocr_pages", "未找到支持中文的 Tesseract 或 poppler")
+        return
+    scanned_pdfs, scanned_pages = [], 0
+    with _stage(results, "generate.scanned_pdfs", scanned_docs):
+        for item in corpus[:scanned_docs]:
+            path = os.path.join(pdf_dir, "scan_" + item["file_name"])
+            scanned_pages += write_scanned_pdf(path, item["text"])
+            scanned_pdfs.append(path)
+    with _stage(results, "extract.ocr_pages", scanned_pages):
+        for path in scanned_pdfs:
+            extract_pdf_text(path, use_cache=False)
+
+
+def bench_extract_info(results, corpus):
+    """UIE 信息提取（每个文档一次，模型加载单独计时）"""
+    from pdf_info_extract import PADDLENLP_AVAILABLE, extract_info_batch, ie_registry
+    if not PADDLENLP_AVAILABLE:
+        _skip(results, "extract_info", "PaddleNLP 未安装")
+        return
+    with _stage(results, "extract_info.load_model"):
+        ie_registry.predict(["预热"], ["项目名称"])
+    with _stage(results, "extract_info", len(corpus)):
+        extract_info_batch([(item["text"], "投标文件") for item in corpus])
+
+
+def bench_similarity(results, corpus, methods=None, max_pairs=BENCHMARK_MAX_PAIRS, seed=BENCHMARK_SEED):
+    """各相似度方法分别计时：prepare（语料级预计算）和逐对比较（最多 max_pairs 对，优先包含有抄袭关系的文档对）"""
+    from similarity_detect import AdvancedSimilarityDetector
+
+    detector = AdvancedSimilarityDetector()
+    methods = methods or list(detector.methods)
+    texts = [item["text"] for item in corpus]
+    index_of = {item["file_name"]: i for i, item in enumerate(corpus)}
+    related = [(index_of[item["source"]], i) for i, item in enumerate(corpus) if item["source"]]
+    rng = random.Random(seed)
+    pairs = related[:max_pairs]
+    all_pairs = len(texts) * (len(texts) - 1) // 2
+    while len(pairs) < min(max_pairs, all_pairs):
+        i, j = sorted(rng.sample(range(len(texts)), 2))
+        pairs.append((i, j))
+
+    with _stage(results, "similarity.artifacts", len(texts)):
+        from doc_artifacts import get_artifact_store
+        get_artifact_store().get_many(texts)
+    for method in methods:
+        with _stage(results, f"similarity.{method}.prepare", len(texts)) as entry:
+            if not detector.prepare_corpus(texts, [method]):
+                entry["error"] = "预计算失败"
+        if "error" in results[f"similarity.{method}.prepare"]:
+            continue
+        function = detector.methods[method]
+        with _stage(results, f"similarity.{method}", len(pairs)):
+            for i, j in pairs:
+                function(texts[i], texts[j])
+
+
+def bench_database(results, workdir, corpus):
+    """写库和导出：使用单独的 BENCHMARK_DB_NAME 数据库，结束后删除"""
+    if not _mongo_available():
+        _skip(results, "db.write", "无法连接 MongoDB")
+        return
+    import db_manager
+    from exporter import export_csv, export_parquet, export_xlsx
+
+    original_db = db_manager.DB_NAME
+    db_manager.DB_NAME = BENCHMARK_DB_NAME
+    db_manager._indexes_ready = False
+    client = db_manager.get_client()
+    client.drop_database(BENCHMARK_DB_NAME)
+    try:
+        with _stage(results, "db.write", len(corpus)):
+            with db_manager.BidWriter() as writer:
+                for index, item in enumerate(corpus):
+                    writer.add({"文件名": item["file_name"], "文件哈希": f"benchmark-{index}",
+                                "文件类型": "投标文件", "项目编号": item["project"],
+                                "原始文本": item["text"], "提取时间": datetime.now(), "文本长度": len(item["text"])})
+        with _stage(results, "db.load_texts", len(corpus)):
+            db_manager.load_texts(db_manager.get_tender_files())
+        with _stage(results, "export.csv", len(corpus)):
+            export_csv(os.path.join(workdir, "export.csv"), "投标文件")
+        with _stage(results, "export.parquet", len(corpus)):
+            export_parquet(os.path.join(workdir, "export.parquet"), "投标文件")
+        with _stage(results, "export.xlsx", len(corpus)):
+            export_xlsx(os.path.join(workdir, "export.xlsx"), ("投标文件",))
+    finally:
+        client.drop_database(BENCHMARK_DB_NAME)
+        db_manager.DB_NAME = original_db
+        db_manager._indexes_ready = False
+
+
+def run_benchmark(sizes=BENCHMARK_SIZES, output=BENCHMARK_OUTPUT, methods=None, seed=BENCHMARK_SEED,
+                  stages=("extract", "extract_info", "similarity", "database"), keep_files=False):
+    """按 sizes 中的每个语料规模依次生成语料并分阶段计时，每完成一个规模就把全部结果写入 output（JSON）"""
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "runs": [],
+    }
+    for size in sizes:
+        print(f"\n[基准] 语料规模 {size}")
+        workdir = tempfile.mkdtemp(prefix=f"bench_{size}_")
+        corpus = build_corpus(size, seed)
+        results = {}
+        try:
+            _isolate_caches(workdir)
+            if "extract" in stages:
+                bench_extraction(results, workdir, corpus)
+            if "extract_info" in stages:
+                bench_extract_info(results, corpus)
+            if "similarity" in stages:
+                bench_similarity(results, corpus, methods, seed=seed)
+            if "database" in stages:
+                bench_database(results, workdir, corpus)
+        finally:
+            if keep_files:
+                print(f"  - 临时文件保留在 {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+        report["runs"].append({"size": size, "characters": sum(len(item["text"]) for item in corpus),
+                               "stages": results})
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        for name, entry in results.items():
+            if "seconds" in entry:
+                per_item = f"，每项 {entry['per_item'] * 1000:.2f} ms" if entry.get("per_item") else ""
+                print(f"  {name}: {entry['seconds']:.3f} s{per_item}")
+    print(f"[完成] 基准结果已写入: {output}")
+    return report
+
+
+def compare_benchmarks(baseline_path, current_path, tolerance=0.2):
+    """比较两次基准结果（相同语料规模、相同阶段的每项耗时），返回变慢超过 tolerance 的阶段列表"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {run["size"]: run["stages"] for run in json.load(f)["runs"]}
+    with open(current_path, encoding="utf-8") as f:
+        current = {run["size"]: run["stages"] for run in json.load(f)["runs"]}
+    regressions = []
+    for size in sorted(set(baseline) & set(current)):
+        for name in sorted(set(baseline[size]) & set(current[size])):
+            before = baseline[size][name].get("per_item") or baseline[size][name].get("seconds")
+            after = current[size][name].get("per_item") or current[size][name].get("seconds")
+            if not before or not after:
+                continue
+            ratio = after / before
+            mark = "[!]" if ratio > 1 + tolerance else "   "
+            print(f"{mark} 规模 {size} {name}: {before:.6f} -> {after:.6f}（{ratio:.2f}x）")
+            if ratio > 1 + tolerance:
+                regressions.append({"size": size, "stage": name, "before": before, "after": after,
+                                    "ratio": round(ratio, 3)})
+    return regressions
@@ -1,14 +1,123 @@
+import json
 import os
-import pytesseract
 
 MONGO_URI = "mongodb://localhost:27017/"
 DB_NAME = "bidding_db"
 COLLECTION_NAME = "bids"
+EMBEDDING_COLLECTION_NAME = "embeddings"  # 文档向量（按文本哈希和模型名保存）
+PAIR_SCORE_COLLECTION_NAME = "pair_scores"  # 文档对各相似度方法的得分（按两个文档的文本哈希保存）
+TEXT_COLLECTION_NAME = "texts"  # 原始文本（zlib 压缩，按文本哈希保存），标书文档中只记录 "文本哈希"
+TEXT_FETCH_BATCH = 200  # 批量读取原始文本时每次查询的文档数
+DB_WRITE_BATCH = 50  # 入库时缓冲的文档数，达到后一次 bulk_write 写入
+DB_FLUSH_SECONDS = 5.0  # 缓冲中最早的文档等待超过该秒数时也会写入
+EXPORT_BATCH_SIZE = 500  # 导出时每批从数据库读取并写出的文档数
 PDF_FOLDER = "./pdfs"
 
+# UIE 信息提取配置：模型在首次推理时加载，所有 schema 共用；长文本切分为重叠窗口，按长度排序后分批送入模型
+UIE_MODEL_NAME = "uie-medium"
+NLP_WINDOW_SIZE = 400  # 每个窗口的字符数（需小于 NLP_MAX_SEQ_LEN 减去 schema 提示的长度）
+NLP_WINDOW_OVERLAP = 50  # 相邻窗口重叠的字符数
+NLP_BATCH_SIZE = 16  # 每次送入模型的窗口数（同时作为 Taskflow 的 batch_size）
+NLP_MAX_SEQ_LEN = 512  # UIE 模型的最大输入长度（token 数，schema 提示 + 窗口文本）
+
+# 为招标文件和投标文件分别定义 schema（信息提取和导出共用）
+BIDDING_SCHEMA = [
+    # 招标文件专用字段
+    "项目名称","招标编号",  "招标单位名称", "招标单位地址", "代理机构", 
+    "评分办法", "最高限价", "开标时间", "投标截止时间",
+    "项目编号", "招标单位联系人姓名", "招标单位联系电话", "公告发布时间"
+]
+
+TENDER_SCHEMA = [
+    # 投标文件专用字段
+    "项目名称", "投标单位名称", "采购代理机构", "法定代表人", "投标单位联系人姓名", 
+    "投标单位联系电话", "投标单位联系邮箱", "投标报价", "投标截止时间",
+    "投标时间", "报价时间", "项目编号", "企业资质", "项目开始时间",
+    "项目工期", "项目人数", "负责人职务", "负责人资质", "高级职称人员数量", "中级职称人员数量", "低级职称人员数量",
+    "投入设备", "投入资金"
+]
+
+# BERT 相似度配置：每个文档只编码一次，长文本按模型分词器切块（每块不超过模型的最大 token 数）编码后取平均，结果保存到 EMBEDDING_COLLECTION_NAME
+BERT_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+BERT_CHUNK_CHARS = 100  # 分词器不支持字符位置映射时按该字符数切块（模型最多 128 个 token，留出数字、英文混排的余量）
+BERT_BATCH_SIZE = 64  # 编码时每批的块数
+
+# 流水线处理配置（process_pdfs(pipelined=True)）
+PIPELINE_EXTRACT_WORKERS = os.cpu_count() or 1  # 同时提取文本的文件数（每个文件一个进程）
+PIPELINE_NLP_WORKERS = 1  # UIE 信息提取线程数
+PIPELINE_NLP_BATCH_DOCS = 4  # 信息提取阶段每次最多合并处理的文档数
+PIPELINE_DB_WORKERS = 2  # 写库线程数
+PIPELINE_QUEUE_SIZE = 8  # 阶段之间的队列容量，满了之后上游阻塞
+
+# OCR 配置
+OCR_DPI = 300
+OCR_LANG = "chi_sim"
+OCR_WORKERS = os.cpu_count() or 1  # 扫描页 OCR 进程数，设为 1 时在主进程内逐页识别
+OCR_PAGE_TIMEOUT = 120  # 单页转图片/识别的超时时间（秒），0 表示不限制
+PDF_MAX_RSS_MB = 0  # 逐页读取 PDF 时的进程内存上限（MB，需要 psutil），0 表示不限制
+OCR_BATCH_PAGES = 20  # 连续扫描页每次调用 poppler 转换的最大页数（临时图片写入磁盘，逐页识别后删除）
+
 # 项目根目录
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 
+# 页面文本缓存（按文件内容哈希和页面哈希缓存提取/OCR 结果，重跑或文件改名后无需重新识别）
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_PATH = os.path.join(PROJECT_ROOT, ".cache", "page_text.sqlite3")
+PAGE_CACHE_MAX_MB = 512
+
+# 语料级 TF-IDF 词表（在全部文档上拟合一次后保存）
+TFIDF_MODEL_PATH = os.path.join(PROJECT_ROOT, ".cache", "tfidf_vectorizer.pkl")
+
+# 语料级 Word2Vec（在全部文档上训练一次后保存，新入库文档增量训练）
+W2V_MODEL_PATH = os.path.join(PROJECT_ROOT, ".cache", "word2vec.model")
+W2V_VECTOR_SIZE = 100
+W2V_WINDOW = 5
+W2V_MIN_COUNT = 1
+W2V_WORKERS = os.cpu_count() or 1
+W2V_UPDATE_ON_INGEST = True  # 模型已存在时，入库后用新文档增量训练
+
+# 文档预处理结果缓存（分词、n-gram / shingle 哈希、结构特征，按文本哈希保存）
+ARTIFACT_CACHE_DIR = os.path.join(PROJECT_ROOT, ".cache", "artifacts")
+ARTIFACT_MEMORY_ITEMS = 2000  # 内存中最多保留的文档数
+ARTIFACT_WORKERS = os.cpu_count() or 1  # 并行分词的进程数
+ARTIFACT_NGRAM_N = 3
+ARTIFACT_SHINGLE_K = 5
+
+# MinHash-LSH 候选文档对索引（基于 5-shingle，新入库文档增量加入）
+LSH_INDEX_PATH = os.path.join(PROJECT_ROOT, ".cache", "minhash_lsh.pkl")
+LSH_NUM_PERM = 128  # 签名长度
+LSH_BANDS = 64  # 分段数（每段 LSH_NUM_PERM / LSH_BANDS 行），Jaccard 0.3 的文档对约 99.8% 概率成为候选、0.1 的约 47%
+LSH_SEED = 1
+LSH_MIN_JACCARD = 0.3  # 候选文档对的最低估计 Jaccard 相似度
+LSH_UPDATE_ON_INGEST = True
+
+# 重复段落定位（winnowing 指纹）：长度不少于 PASSAGE_WINDOW + PASSAGE_KGRAM - 1 的共同片段一定能被找到
+PASSAGE_KGRAM = 8  # 指纹的字符片段长度
+PASSAGE_WINDOW = 16  # winnowing 窗口大小
+PASSAGE_MIN_LENGTH = 50  # 报告的最短段落（字符数）
+PASSAGE_MAX_GAP = 3  # 相距不超过该字符数的片段合并为一段（容忍个别改字）
+PASSAGE_REPORT_LIMIT = 10  # 报告中每对文档最多列出的段落数
+
+# 按项目分组（只比较同一项目的投标文件）
+BLOCKING_NAME_SIMILARITY = 0.85  # 规范化项目名称的编辑距离相似度不低于该值时视为同一项目
+BLOCKING_TEXT_HEAD_CHARS = 3000  # 项目编号和名称都缺失时，在正文开头多少个字符内查找已知的编号或名称
+BLOCKING_HEAD_NUMBER_MIN_LENGTH = 6  # 在正文开头查找时，规范化后短于该长度的项目编号不参与（容易与日期、电话号码混淆）
+
+# 相似文档查询（find_similar_to_document / find_similar_to_text）使用的向量："tfidf" 或 "bert"
+VECTOR_INDEX_KIND = "tfidf"
+VECTOR_INDEX_TFIDF_PATH = os.path.join(PROJECT_ROOT, ".cache", "vector_index_tfidf.pkl")  # 索引自己的 TF-IDF 词表（在整个集合上拟合）
+VECTOR_INDEX_FULL_SYNC_SECONDS = 300  # 查询前平时只同步新入库的文档，每隔该秒数全量同步一次（移除已删除的文档）
+VECTOR_INDEX_REFIT_GROWTH = 0.2  # 全量同步时集合比拟合词表时增长超过该比例则重新拟合
+
+# 逐对相似度计算
+SIMILARITY_WORKERS = 1  # 逐对比较的进程数，大于 1 时使用进程池（见 AdvancedSimilarityDetector.score_pairs）
+SIMILARITY_CHUNK_PAIRS = 32  # 每个任务块大约包含的平均长度文档对数
+SIMILARITY_METHOD_TIMEOUT = 0  # 单个相似度方法的超时时间（秒），0 表示不限制
+PAIR_SCORE_STORE_ENABLED = True  # 保存逐对得分到 PAIR_SCORE_COLLECTION_NAME，再次检测时只计算新文档对
+
+# 外部工具（poppler / tesseract）探测结果缓存
+ENV_PROBE_CACHE_PATH = os.path.join(PROJECT_ROOT, ".cache", "env_probe.json")
+
 # Poppler 配置
 POPPLER_PATHS = [
     os.path.join(PROJECT_ROOT, "poppler", "bin"),  # 项目内 poppler
@@ -30,6 +139,7 @@ def get_poppler_path():
 def get_tesseract_path():
     """获取可用的 Tesseract 路径并检查中文语言支持"""
     import subprocess
+    import pytesseract
     
     possible_paths = [
         r"D:\Tesseract-OCR\tesseract.exe",
@@ -84,5 +194,82 @@ def get_tesseract_path():
         "3. 或在 config.py 中手动指定路径"
     )
 
-POPPLER_PATH = get_poppler_path()
-TESSERACT_PATH = get_tesseract_path()
+def _binary_fingerprint(path):
+    """工具文件的 (大小, 修改时间)，用于判断探测缓存是否过期"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _load_env_probe():
+    """读取探测缓存，缓存中的工具文件被替换、升级或删除时返回 None"""
+    try:
+        with open(ENV_PROBE_CACHE_PATH, "r", encoding="utf-8") as f:
+            probe = json.load(f)
+    except (OSError, ValueError):
+        return None
+    binaries = probe.get("binaries", {})
+    if not binaries or any(_binary_fingerprint(path) != fingerprint for path, fingerprint in binaries.items()):
+        return None
+    return probe
+
+def _save_env_probe(poppler_path, tesseract_path):
+    binaries = {tesseract_path: _binary_fingerprint(tesseract_path)}
+    # 未找到 poppler 时记录各候选目录中的 pdftoppm（指纹为 None），之后放入 poppler 时缓存随之失效
+    for path in [poppler_path] if poppler_path else POPPLER_PATHS:
+        pdftoppm = os.path.join(path, "pdftoppm.exe" if os.name == 'nt' else "pdftoppm")
+        binaries[pdftoppm] = _binary_fingerprint(pdftoppm)
+    try:
+        os.makedirs(os.path.dirname(ENV_PROBE_CACHE_PATH), exist_ok=True)
+        with open(ENV_PROBE_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"poppler_path": poppler_path, "tesseract_path": tesseract_path,
+                       "binaries": binaries}, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"[!] 探测缓存写入失败: {e}")
+
+_ocr_tools = None
+
+def get_ocr_tools(refresh=False):
+    """返回 (poppler 路径, tesseract 路径)，并设置 pytesseract 使用的 tesseract
+
+    首次调用时才探测，结果写入 ENV_PROBE_CACHE_PATH；之后只在工具文件变化时重新探测
+    （避免每次启动都运行 tesseract --list-langs）。未找到支持中文的 tesseract 时抛出 FileNotFoundError
+    """
+    import pytesseract
+
+    global _ocr_tools
+    if _ocr_tools is None or refresh:
+        probe = None if refresh else _load_env_probe()
+        if probe:
+            _ocr_tools = (probe["poppler_path"], probe["tesseract_path"])
+        else:
+            _ocr_tools = (get_poppler_path(), get_tesseract_path())
+            _save_env_probe(*_ocr_tools)
+        pytesseract.pytesseract.tesseract_cmd = _ocr_tools[1]
+    return _ocr_tools
+
+def __getattr__(name):
+    """兼容旧代码中的 POPPLER_PATH / TESSERACT_PATH，访问时才进行探测"""
+    if name == "POPPLER_PATH":
+        return get_ocr_tools()[0]
+    if name == "TESSERACT_PATH":
+        return get_ocr_tools()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# 运行指标（metrics.py）：python main.py --metrics 路径 导出，.prom 为 Prometheus 文本格式，其余为 JSON
+METRICS_OUTPUT = None  # 每次运行结束时写入指标的文件，None 时只在命令行指定 --metrics 时导出
+METRICS_EVENT_LOG = None  # 结构化事件（每页提取、每个阶段等）追加写入的 JSON 行文件，None 时不记录
+METRICS_PROFILE_STAGES = ()  # 需要 cProfile 采样的阶段，如 ("pdf_extract", "uie")，"*" 表示全部阶段
+METRICS_TRACEMALLOC = False  # 采样的阶段同时用 tracemalloc 记录内存峰值和占用最多的代码行（明显变慢）
+METRICS_PROFILE_DIR = os.path.join(PROJECT_ROOT, ".cache", "profiles")
+
+# 性能基准配置（benchmark.py / python main.py benchmark）
+BENCHMARK_SIZES = (10, 50, 200)  # 依次测试的语料规模（投标文件数）
+BENCHMARK_OUTPUT = "benchmark_results.json"
+BENCHMARK_SEED = 42  # 合成语料的随机种子，相同种子生成完全相同的语料
+BENCHMARK_SCANNED_DOCS = 2  # 每个规模额外生成的扫描件数量（OCR 耗时与语料规模无关，少量即可）
+BENCHMARK_SCANNED_PAGES = 2  # 每个扫描件的页数
+BENCHMARK_MAX_PAIRS = 500  # 每个相似度方法最多比较的文档对数
+BENCHMARK_DB_NAME = "bidding_benchmark"  # 写库/导出基准使用的临时数据库，结束后删除
+BENCHMARK_FONT_PATH = None  # 生成扫描页时使用的中文字体文件，None 时自动查找常见位置
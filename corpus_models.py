@@ -0,0 +1,443 @@
+# 语料级相似度模型：每个文档只计算一次向量，逐对比较时直接复用
+import json
+import os
+import pickle
+import threading
+
+import numpy as np
+
+from config import (
+    BERT_MODEL_NAME, BERT_CHUNK_CHARS, BERT_BATCH_SIZE, TFIDF_MODEL_PATH,
+    W2V_MODEL_PATH, W2V_VECTOR_SIZE, W2V_WINDOW, W2V_MIN_COUNT, W2V_WORKERS,
+)
+from doc_artifacts import get_artifact_store
+from utils import text_hash
+
+
+def split_chunks(text, size):
+    """按固定字符数切块（最后一块可能较短）"""
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class EmbeddingStore:
+    """文档 BERT 向量存储
+
+    长文本用模型的分词器切块，每块不超过 max_seq_length 减去特殊 token 的 token 数，不会被模型截断
+    （分词器不支持字符位置映射时退回按 chunk_chars 个字符切块）；
+    整个语料的块合并为一次批量编码，块向量按长度加权平均后归一化；
+    结果按 (文本哈希, version) 缓存在内存中，persist=True 时同时保存到 MongoDB。
+    """
+
+    # 切块方式变化后旧向量不可复用，version 随之改变
+    CHUNKING = "tokens"
+
+    def __init__(self, model_name=BERT_MODEL_NAME, chunk_chars=BERT_CHUNK_CHARS,
+                 batch_size=BERT_BATCH_SIZE, persist=True):
+        self.model_name = model_name
+        self.chunk_chars = chunk_chars
+        self.batch_size = batch_size
+        self.persist = persist
+        self._vectors = {}
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        """向量的保存标识：模型名和切块方式"""
+        return f"{self.model_name}:{self.CHUNKING}:{self.chunk_chars}"
+
+    def __getstate__(self):
+        # 传给子进程时只带已计算的向量，不带模型
+        state = self.__dict__.copy()
+        state["_model"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            print(f"  - 加载 BERT 模型 {self.model_name}...")
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _split(self, text):
+        """按分词器的字符位置映射切块，每块的 token 数留出特殊 token 和块首多出的前缀 token 的余量"""
+        model = self._get_model()
+        tokenizer = getattr(model, "tokenizer", None)
+        max_length = getattr(model, "max_seq_length", None)
+        if tokenizer is None or not getattr(tokenizer, "is_fast", False) or not max_length:
+            return split_chunks(text, self.chunk_chars)
+        limit = max(max_length - tokenizer.num_special_tokens_to_add(pair=False) - 2, 1)
+        offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                            verbose=False)["offset_mapping"]
+        if len(offsets) <= limit:
+            return [text]
+        chunks = []
+        for start in range(0, len(offsets), limit):
+            begin = 0 if start == 0 else offsets[start][0]
+            end = offsets[start + limit][0] if start + limit < len(offsets) else len(text)
+            chunks.append(text[begin:end])
+        return chunks
+
+    def _encode(self, texts):
+        """批量编码多个文档，返回 {文本哈希: 归一化向量}"""
+        chunks, owners, weights = [], [], []
+        for index, text in enumerate(texts):
+            for chunk in self._split(text):
+                chunks.append(chunk)
+                owners.append(index)
+                weights.append(max(len(chunk), 1))
+        chunk_vectors = self._get_model().encode(chunks, batch_size=self.batch_size,
+                                                 normalize_embeddings=True, show_progress_bar=False)
+        owners = np.asarray(owners)
+        weights = np.asarray(weights, dtype=np.float32)[:, None]
+        doc_vectors = np.zeros((len(texts), chunk_vectors.shape[1]), dtype=np.float32)
+        np.add.at(doc_vectors, owners, chunk_vectors * weights)
+        doc_vectors = _normalize(doc_vectors)
+        return {text_hash(text): doc_vectors[i] for i, text in enumerate(texts)}
+
+    def embed(self, texts):
+        """返回 texts 对应的归一化向量矩阵 (n, d)，只对从未编码过的文档调用模型"""
+        hashes = [text_hash(text) for text in texts]
+        with self._lock:
+            missing = {h: text for h, text in zip(hashes, texts) if h not in self._vectors}
+            if missing and self.persist:
+                from db_manager import get_embeddings
+                for h, vector in get_embeddings(missing.keys(), self.version).items():
+                    self._vectors[h] = np.frombuffer(vector, dtype=np.float32)
+                    missing.pop(h, None)
+            if missing:
+                print(f"  - BERT 编码 {len(missing)} 个文档...")
+                encoded = self._encode(list(missing.values()))
+                self._vectors.update(encoded)
+                if self.persist:
+                    from db_manager import save_embeddings
+                    save_embeddings({h: v.astype(np.float32).tobytes() for h, v in encoded.items()},
+                                    self.version)
+            return np.vstack([self._vectors[h] for h in hashes])
+
+    def similarity(self, text1, text2):
+        """两个文档的余弦相似度（向量已缓存时只是一次点积）"""
+        vectors = self.embed([text1, text2])
+        return float(vectors[0] @ vectors[1])
+
+    def similarity_matrix(self, texts):
+        """整个语料两两之间的余弦相似度矩阵，一次矩阵乘法得到"""
+        vectors = self.embed(texts)
+        return vectors @ vectors.T
+
+
+_embedding_store = None
+
+
+def get_embedding_store():
+    """获取默认的 BERT 向量存储"""
+    global _embedding_store
+    if _embedding_store is None:
+        _embedding_store = EmbeddingStore()
+    return _embedding_store
+
+
+def tokenize(text):
+    """jieba 分词，返回以空格连接的词串（与 TfidfVectorizer 默认的分词规则配合），结果来自文档预处理缓存"""
+    return get_artifact_store().get(text).tokens_text
+
+
+def tokenize_many(texts):
+    """批量分词，未缓存的文档并行处理"""
+    return [artifacts.tokens_text for artifacts in get_artifact_store().get_many(texts)]
+
+
+def corpus_fingerprint(texts):
+    """语料指纹：与文档顺序无关"""
+    return text_hash("\n".join(sorted(text_hash(text) for text in texts)))
+
+
+class CorpusTfidf:
+    """语料级 TF-IDF
+
+    在整个语料上只拟合一次（IDF 才有意义），词表持久化到 path；文档的稀疏向量（L2 归一化）按文本哈希缓存，
+    两个文档的余弦相似度就是两个稀疏行向量的点积。
+    """
+
+    def __init__(self, path=TFIDF_MODEL_PATH):
+        self.path = path
+        self.vectorizer = None
+        self.fingerprint = None
+        self.documents = 0  # 拟合时的文档数
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def fitted(self):
+        return self.vectorizer is not None
+
+    def fit(self, texts):
+        """在语料上拟合；磁盘上已有同一语料拟合的词表时直接加载"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        fingerprint = corpus_fingerprint(texts)
+        if self.fingerprint == fingerprint:
+            return self
+        if self.load() and self.fingerprint == fingerprint:
+            print("  - 使用已保存的 TF-IDF 词表")
+            return self
+        print(f"  - 在 {len(texts)} 个文档上拟合 TF-IDF...")
+        vectorizer = TfidfVectorizer()
+        matrix = vectorizer.fit_transform(tokenize_many(texts)).tocsr()
+        with self._lock:
+            self.vectorizer = vectorizer
+            self.fingerprint = fingerprint
+            self.documents = len(texts)
+            self._rows = {text_hash(text): matrix[i] for i, text in enumerate(texts)}
+        self.save()
+        return self
+
+    def load(self):
+        """从磁盘加载已保存的词表，成功返回 True"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+        except Exception as e:
+            print(f"[!] TF-IDF 词表加载失败: {e}")
+            return False
+        with self._lock:
+            self.vectorizer = saved["vectorizer"]
+            self.fingerprint = saved["fingerprint"]
+            self.documents = saved.get("documents", 0)
+            self._rows = {}
+        return True
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "wb") as f:
+                pickle.dump({"vectorizer": self.vectorizer, "fingerprint": self.fingerprint,
+                             "documents": self.documents}, f)
+        except OSError as e:
+            print(f"[!] TF-IDF 词表保存失败: {e}")
+
+    def transform(self, texts):
+        """返回 texts 对应的稀疏矩阵（CSR，每行已 L2 归一化）"""
+        from scipy.sparse import vstack
+
+        hashes = [text_hash(text) for text in texts]
+        with self._lock:
+            missing = {h: text for h, text in zip(hashes, texts) if h not in self._rows}
+            if missing:
+                matrix = self.vectorizer.transform(tokenize_many(list(missing.values()))).tocsr()
+                for i, h in enumerate(missing):
+                    self._rows[h] = matrix[i]
+            return vstack([self._rows[h] for h in hashes], format="csr")
+
+    def similarity(self, text1, text2):
+        rows = self.transform([text1, text2])
+        return float(rows[0].multiply(rows[1]).sum())
+
+    def similar_pairs(self, texts, threshold=0.0, top_k=None, block_rows=256):
+        """流式产出语料中相似的文档对 (i, j, 相似度)，i < j
+
+        按 block_rows 行分块做稀疏矩阵乘法，内存占用为 block_rows × n，不会生成稠密的 n × n 矩阵。
+        threshold 为最低余弦相似度；top_k 时每个文档只保留与其最相似的 k 个文档。
+        """
+        matrix = self.transform(texts)
+        matrix_t = matrix.T.tocsc()
+        seen = set()
+        for start in range(0, matrix.shape[0], block_rows):
+            block = (matrix[start:start + block_rows] @ matrix_t).tocsr()
+            for row in range(block.shape[0]):
+                i = start + row
+                cols = block.indices[block.indptr[row]:block.indptr[row + 1]]
+                vals = block.data[block.indptr[row]:block.indptr[row + 1]]
+                keep = (cols != i) & (vals >= threshold)
+                cols, vals = cols[keep], vals[keep]
+                if top_k is not None and len(cols) > top_k:
+                    best = np.argpartition(-vals, top_k - 1)[:top_k]
+                    cols, vals = cols[best], vals[best]
+                for j, score in sorted(zip(cols.tolist(), vals.tolist())):
+                    pair = (min(i, j), max(i, j))
+                    if top_k is None and j < i:
+                        continue  # 无 top_k 时矩阵对称，只取上三角
+                    if pair in seen:
+                        continue
+                    if top_k is not None:
+                        seen.add(pair)
+                    yield pair[0], pair[1], score
+
+
+_corpus_tfidf = None
+
+
+def get_corpus_tfidf():
+    """获取默认的语料级 TF-IDF"""
+    global _corpus_tfidf
+    if _corpus_tfidf is None:
+        _corpus_tfidf = CorpusTfidf()
+    return _corpus_tfidf
+
+
+def split_sentences(text, max_tokens=1000):
+    """分词后按句末标点切分为句子（gensim 会截断超过 10000 词的句子，所以不能整篇作为一句）"""
+    return get_artifact_store().get(text).sentences(max_tokens)
+
+
+class CorpusWord2Vec:
+    """语料级 Word2Vec
+
+    在整个语料上训练一个模型并保存到 path，之后只对新文档增量训练；
+    文档向量（词向量平均）按文本哈希缓存，并以 "word2vec:版本" 为模型名保存到向量集合，
+    模型每次更新后版本号改变，旧的文档向量自然失效。
+    """
+
+    def __init__(self, path=W2V_MODEL_PATH, persist_vectors=True):
+        self.path = path
+        self.persist_vectors = persist_vectors
+        self.model = None
+        self.trained = set()
+        self.version = None
+        self._vectors = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # 传给子进程时只带已计算的文档向量
+        state = self.__dict__.copy()
+        state["model"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def fitted(self):
+        return self.model is not None or os.path.exists(self.path)
+
+    @property
+    def vector_key(self):
+        return f"word2vec:{self.version}"
+
+    def _docs_path(self):
+        return self.path + ".docs.json"
+
+    def load(self):
+        """从磁盘加载模型和已训练文档列表，成功返回 True"""
+        if self.model is not None:
+            return True
+        if not os.path.exists(self.path):
+            return False
+        from gensim.models import Word2Vec
+        try:
+            self.model = Word2Vec.load(self.path)
+            with open(self._docs_path(), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except Exception as e:
+            print(f"[!] Word2Vec 模型加载失败: {e}")
+            self.model = None
+            return False
+        self.trained = set(saved["documents"])
+        self.version = saved["version"]
+        return True
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.model.save(self.path)
+            with open(self._docs_path(), "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "documents": sorted(self.trained)}, f)
+        except OSError as e:
+            print(f"[!] Word2Vec 模型保存失败: {e}")
+
+    def update(self, texts):
+        """用尚未训练过的文档训练（首次）或增量训练（之后）模型"""
+        from gensim.models import Word2Vec
+
+        with self._lock:
+            self.load()
+            new_docs = {}
+            for text in texts:
+                h = text_hash(text)
+                if h not in self.trained:
+                    new_docs[h] = text
+            if not new_docs:
+                return self
+            sentences = [sentence for artifacts in get_artifact_store().get_many(list(new_docs.values()))
+                         for sentence in artifacts.sentences()]
+            if self.model is None:
+                print(f"  - 在 {len(new_docs)} 个文档上训练 Word2Vec...")
+                self.model = Word2Vec(sentences, vector_size=W2V_VECTOR_SIZE, window=W2V_WINDOW,
+                                      min_count=W2V_MIN_COUNT, workers=W2V_WORKERS)
+            else:
+                print(f"  - Word2Vec 增量训练 {len(new_docs)} 个新文档...")
+                self.model.build_vocab(sentences, update=True)
+                self.model.train(sentences, total_examples=len(sentences), epochs=self.model.epochs)
+            self.trained.update(new_docs)
+            self.version = text_hash("\n".join(sorted(self.trained)))[:16]
+            self._vectors = {}
+            self.save()
+        return self
+
+    def _mean_vector(self, artifacts):
+        wv = self.model.wv
+        vectors = [wv[word] for word in artifacts.tokens if word in wv]
+        if not vectors:
+            return np.zeros(wv.vector_size, dtype=np.float32)
+        return _normalize(np.mean(vectors, axis=0).astype(np.float32))
+
+    def vectors(self, texts):
+        """返回 texts 对应的归一化文档向量矩阵，每个文档只计算一次"""
+        hashes = [text_hash(text) for text in texts]
+        with self._lock:
+            missing = {h: text for h, text in zip(hashes, texts) if h not in self._vectors}
+            if missing:
+                # 向量都已缓存时（如传给子进程的副本）不需要加载模型
+                self.load()
+            if missing and self.persist_vectors:
+                from db_manager import get_embeddings
+                for h, vector in get_embeddings(missing.keys(), self.vector_key).items():
+                    self._vectors[h] = np.frombuffer(vector, dtype=np.float32)
+                    missing.pop(h, None)
+            if missing:
+                artifacts = get_artifact_store().get_many(list(missing.values()))
+                computed = {h: self._mean_vector(a) for h, a in zip(missing, artifacts)}
+                self._vectors.update(computed)
+                if self.persist_vectors:
+                    from db_manager import save_embeddings
+                    save_embeddings({h: v.tobytes() for h, v in computed.items()}, self.vector_key)
+            return np.vstack([self._vectors[h] for h in hashes])
+
+    def similarity(self, text1, text2):
+        vectors = self.vectors([text1, text2])
+        return float(vectors[0] @ vectors[1])
+
+
+_corpus_word2vec = None
+
+
+def get_corpus_word2vec():
+    """获取默认的语料级 Word2Vec"""
+    global _corpus_word2vec
+    if _corpus_word2vec is None:
+        _corpus_word2vec = CorpusWord2Vec()
+    return _corpus_word2vec
@@ -1,56 +1,323 @@
-from pymongo import MongoClient
-from config import MONGO_URI, DB_NAME, COLLECTION_NAME
-import pandas as pd
+import re
+import threading
+import time
+import zlib
 
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
-collection = db[COLLECTION_NAME]
+import metrics
+from config import (
+    MONGO_URI, DB_NAME, COLLECTION_NAME, EMBEDDING_COLLECTION_NAME, PAIR_SCORE_COLLECTION_NAME,
+    TEXT_COLLECTION_NAME, TEXT_FETCH_BATCH, DB_WRITE_BATCH, DB_FLUSH_SECONDS,
+)
+
+# 元数据查询默认不返回原始文本（原始文本单独压缩保存在 TEXT_COLLECTION_NAME，按需用 load_texts 批量读取）和公司名称索引片段
+METADATA_PROJECTION = {"原始文本": 0, "单位名称片段": 0}
+
+# 按公司名称查询的字段：写入时规范化后保存到 "单位名称"，其 n-gram 保存到 "单位名称片段"（均建索引）
+COMPANY_NAME_FIELDS = ("投标单位名称", "招标单位名称", "采购人名称")
+
+_client = None
+
+def get_client():
+    """获取 MongoClient（首次使用时才连接）"""
+    global _client
+    if _client is None:
+        from pymongo import MongoClient
+        _client = MongoClient(MONGO_URI)
+    return _client
+
+_indexes_ready = False
+
+def get_collection():
+    """获取标书数据集合（首次使用时创建索引）"""
+    collection = get_client()[DB_NAME][COLLECTION_NAME]
+    if not _indexes_ready:
+        ensure_indexes(collection)
+    return collection
+
+def ensure_indexes(collection=None):
+    """创建标书集合的索引：文件名 + 文件哈希唯一（旧数据没有文件哈希，不参与唯一约束）"""
+    global _indexes_ready
+    _indexes_ready = True
+    collection = collection if collection is not None else get_client()[DB_NAME][COLLECTION_NAME]
+    try:
+        collection.create_index([("文件名", 1), ("文件哈希", 1)], name="file_name_hash", unique=True,
+                                partialFilterExpression={"文件哈希": {"$exists": True}})
+        collection.create_index("单位名称", name="company_name")
+        collection.create_index("单位名称片段", name="company_name_ngrams")
+    except Exception as e:
+        print(f"[警告] 创建索引失败: {e}")
+
+def company_index_fields(data):
+    """由公司名称字段生成 {"单位名称": 规范化名称列表, "单位名称片段": n-gram 列表}"""
+    from utils import normalize_company_name, company_name_ngrams
+    names = sorted({normalize_company_name(data.get(field)) for field in COMPANY_NAME_FIELDS} - {""})
+    ngrams = set()
+    for name in names:
+        ngrams |= company_name_ngrams(name)
+    return {"单位名称": names, "单位名称片段": sorted(ngrams)}
+
+def __getattr__(name):
+    """兼容直接访问模块级 client / db / collection 的旧代码"""
+    if name == "client":
+        return get_client()
+    if name == "db":
+        return get_client()[DB_NAME]
+    if name == "collection":
+        return get_collection()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _bulk_write(collection, operations):
+    """bulk_write 并把耗时和写入的文档数记入运行指标（mongo_write_seconds / mongo_documents_written_total）"""
+    start = time.perf_counter()
+    result = collection.bulk_write(operations, ordered=False)
+    metrics.observe("mongo_write_seconds", time.perf_counter() - start, collection=collection.name)
+    metrics.inc("mongo_documents_written_total", len(operations), collection=collection.name)
+    return result
+
+def get_text_collection():
+    """获取原始文本集合"""
+    return get_client()[DB_NAME][TEXT_COLLECTION_NAME]
+
+def _text_entry(text):
+    """原始文本的哈希和压缩数据"""
+    from utils import text_hash
+    return text_hash(text), {"data": zlib.compress(text.encode("utf-8"), 6), "length": len(text)}
+
+def save_text(text):
+    """压缩保存原始文本，以文本哈希为 _id（相同内容只保存一份），返回文本哈希"""
+    h, entry = _text_entry(text)
+    get_text_collection().update_one({"_id": h}, {"$setOnInsert": entry}, upsert=True)
+    return h
+
+def get_texts(text_hashes):
+    """批量读取原始文本，返回 {文本哈希: 文本}"""
+    text_hashes = list(set(text_hashes))
+    texts = {}
+    for start in range(0, len(text_hashes), TEXT_FETCH_BATCH):
+        for doc in get_text_collection().find({"_id": {"$in": text_hashes[start:start + TEXT_FETCH_BATCH]}}):
+            texts[doc["_id"]] = zlib.decompress(doc["data"]).decode("utf-8")
+    return texts
+
+def load_texts(docs):
+    """按 docs 顺序返回原始文本列表（缺失为 None），按批读取
+
+    新数据通过 "文本哈希" 字段从文本集合读取；迁移前的旧数据仍内嵌在 "原始文本" 字段中，按 _id 读取
+    """
+    texts = [doc.get("原始文本") for doc in docs]
+    hashed = {doc["文本哈希"] for doc, text in zip(docs, texts) if text is None and doc.get("文本哈希")}
+    found = get_texts(hashed) if hashed else {}
+    legacy_ids = [doc["_id"] for doc, text in zip(docs, texts)
+                  if text is None and not doc.get("文本哈希") and "_id" in doc]
+    legacy = {}
+    for start in range(0, len(legacy_ids), TEXT_FETCH_BATCH):
+        for doc in get_collection().find({"_id": {"$in": legacy_ids[start:start + TEXT_FETCH_BATCH]}},
+                                         {"原始文本": 1}):
+            legacy[doc["_id"]] = doc.get("原始文本")
+    for index, doc in enumerate(docs):
+        if texts[index] is None:
+            texts[index] = found.get(doc.get("文本哈希")) or legacy.get(doc.get("_id"))
+    return texts
+
+def _with_texts(docs, with_text):
+    if with_text:
+        for doc, text in zip(docs, load_texts(docs)):
+            doc["原始文本"] = text
+    return docs
+
+def upsert_bids(records):
+    """批量写入标书数据，返回写入的文档数
+
+    原始文本压缩后写入文本集合，标书文档中只记录文本哈希；按 文件名 + 文件哈希 upsert，同一文件重复写入结果不变；
+    同名文件内容变化后重新入库时，在同一次 bulk_write 中删除该文件名下哈希不同的旧文档，避免同一单位与自己的旧版本比对
+    """
+    from pymongo import DeleteMany, InsertOne, ReplaceOne, UpdateOne
+    if not records:
+        return 0
+    # 同一批中同名文件有多个版本时只保留最后一个（无序 bulk_write 中两个版本的删除操作会互相删掉对方）
+    latest = {}
+    for data in records:
+        key = data.get("文件名") if data.get("文件哈希") else id(data)
+        latest.pop(key, None)
+        latest[key] = data
+    text_ops = {}
+    bid_ops = []
+    for data in latest.values():
+        data = dict(data)
+        data.update(company_index_fields(data))
+        text = data.pop("原始文本", None)
+        if text is not None:
+            h, entry = _text_entry(text)
+            data["文本哈希"] = h
+            text_ops[h] = UpdateOne({"_id": h}, {"$setOnInsert": entry}, upsert=True)
+        if data.get("文件哈希"):
+            bid_ops.append(ReplaceOne({"文件名": data.get("文件名"), "文件哈希": data["文件哈希"]}, data, upsert=True))
+            bid_ops.append(DeleteMany({"文件名": data.get("文件名"), "文件哈希": {"$ne": data["文件哈希"]}}))
+        else:
+            bid_ops.append(InsertOne(data))
+    if text_ops:
+        _bulk_write(get_text_collection(), list(text_ops.values()))
+    _bulk_write(get_collection(), bid_ops)
+    return len(latest)
 
 def insert_bid_data(data):
-    """插入招标数据到 MongoDB"""
-    collection.insert_one(data)
+    """写入单个标书数据（批量写入请使用 BidWriter）"""
+    upsert_bids([data])
+
+class BidWriter:
+    """缓冲写入标书数据：缓冲满 batch_size 个文档，或最早的文档等待超过 flush_seconds 秒时一次 bulk_write
+
+    可在多个线程中共用；用 with 语句或在结束时调用 close() 写入剩余数据。
+    写入失败的文档数记录在 failed 中（不抛出异常，避免中断整个入库流程）
+    """
+
+    def __init__(self, batch_size=DB_WRITE_BATCH, flush_seconds=DB_FLUSH_SECONDS):
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.written = 0
+        self.failed = 0
+        self._buffer = []
+        self._first_added = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = None
+
+    def add(self, data):
+        with self._lock:
+            self._buffer.append(data)
+            if self._first_added is None:
+                self._first_added = time.monotonic()
+            due = len(self._buffer) >= self.batch_size
+            # 在锁内检查并启动，多个线程同时 add 时只启动一个定时写入线程
+            if self._timer is None and self.flush_seconds:
+                self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+                self._timer.start()
+        if due:
+            self.flush()
 
-def bid_exists(file_name):
-    """检查招标数据是否已存在"""
-    return collection.find_one({"file_name": file_name}) is not None
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_seconds / 2):
+            first_added = self._first_added
+            if first_added is not None and time.monotonic() - first_added >= self.flush_seconds:
+                self.flush()
 
-def get_all_data():
-    """获取所有数据"""
-    return list(collection.find())
+    def flush(self):
+        with self._lock:
+            records, self._buffer, self._first_added = self._buffer, [], None
+            if not records:
+                return 0
+            try:
+                written = upsert_bids(records)
+            except Exception as e:
+                print(f"[错误] 批量写入 {len(records)} 个文档失败: {e}")
+                self.failed += len(records)
+                return 0
+            self.written += written
+            return written
 
-def get_unique_data():
-    """获取文件名不重复的数据"""
+    def close(self):
+        self._closed.set()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def migrate_inline_texts(batch_size=TEXT_FETCH_BATCH):
+    """把旧数据中内嵌的原始文本迁移到文本集合，返回迁移的文档数"""
+    from pymongo import UpdateOne
+    collection = get_collection()
+    migrated = 0
+    while True:
+        batch = list(collection.find({"原始文本": {"$exists": True}}, {"原始文本": 1}).limit(batch_size))
+        if not batch:
+            break
+        updates = []
+        for doc in batch:
+            text = doc.get("原始文本") or ""
+            updates.append(UpdateOne({"_id": doc["_id"]},
+                                     {"$set": {"文本哈希": save_text(text), "文本长度": len(text)},
+                                      "$unset": {"原始文本": ""}}))
+        _bulk_write(collection, updates)
+        migrated += len(updates)
+        print(f"  - 已迁移 {migrated} 个文档的原始文本")
+    return migrated
+
+def backfill_company_names(batch_size=TEXT_FETCH_BATCH):
+    """为旧数据补充公司名称索引字段，返回更新的文档数"""
+    from pymongo import UpdateOne
+    collection = get_collection()
+    projection = {field: 1 for field in COMPANY_NAME_FIELDS}
+    updated = 0
+    while True:
+        batch = list(collection.find({"单位名称": {"$exists": False}}, projection).limit(batch_size))
+        if not batch:
+            break
+        _bulk_write(collection, [UpdateOne({"_id": doc["_id"]}, {"$set": company_index_fields(doc)}) for doc in batch])
+        updated += len(batch)
+        print(f"  - 已更新 {updated} 个文档的公司名称索引")
+    return updated
+
+def bid_exists(file_name, file_hash=None):
+    """检查招标数据是否已存在（给出 file_hash 时还要求文件内容相同）"""
+    query = {"文件名": file_name}
+    if file_hash is not None:
+        query["文件哈希"] = file_hash
+    return get_collection().find_one(query, {"_id": 1}) is not None
+
+def get_existing_bids(file_names):
+    """一次查询多个文件是否已入库，返回 {文件名: {文件哈希, ...}}（旧数据没有文件哈希，记为 None）"""
+    existing = {}
+    file_names = list(file_names)
+    for start in range(0, len(file_names), TEXT_FETCH_BATCH):
+        cursor = get_collection().find({"文件名": {"$in": file_names[start:start + TEXT_FETCH_BATCH]}},
+                                       {"文件名": 1, "文件哈希": 1})
+        for doc in cursor:
+            existing.setdefault(doc["文件名"], set()).add(doc.get("文件哈希"))
+    return existing
+
+def get_all_data(with_text=False):
+    """获取所有数据（with_text=True 时附带原始文本）"""
+    return _with_texts(list(get_collection().find({}, METADATA_PROJECTION)), with_text)
+
+def get_unique_data(with_text=False):
+    """获取文件名不重复的数据（with_text=True 时附带原始文本）"""
     pipeline = [
+        {"$project": METADATA_PROJECTION},  # 先去掉原始文本，分组时不再携带整篇文本
+        {"$sort": {"提取时间": -1}},  # 同名文件保留最近一次提取的文档
         {
             "$group": {
                 "_id": "$文件名",  # 按文件名分组
-                "doc": {"$first": "$$ROOT"}  # 取每组的第一个文档
+                "doc": {"$first": "$$ROOT"}  # 取每组的第一个（最新的）文档
             }
         },
         {
             "$replaceRoot": {"newRoot": "$doc"}  
         }
     ]
-    return list(collection.aggregate(pipeline))
+    return _with_texts(list(get_collection().aggregate(pipeline)), with_text)
 
-def get_data_by_file_type(file_type):
+def get_data_by_file_type(file_type, with_text=False):
     """根据文件类型获取数据"""
-    return list(collection.find({"文件类型": file_type}))
+    return _with_texts(list(get_collection().find({"文件类型": file_type}, METADATA_PROJECTION)), with_text)
 
-def get_data_by_file_name(file_name):
+def get_data_by_file_name(file_name, with_text=False):
     """根据文件名获取单个文档数据"""
-    return collection.find_one({"文件名": file_name})
+    doc = get_collection().find_one({"文件名": file_name}, METADATA_PROJECTION)
+    return _with_texts([doc], with_text)[0] if doc else None
 
-def get_bidding_files():
+def get_bidding_files(with_text=False):
     """获取所有招标文件"""
-    return list(collection.find({"文件类型": "招标文件"}))
+    return get_data_by_file_type("招标文件", with_text)
 
-def get_tender_files():
+def get_tender_files(with_text=False):
     """获取所有投标文件"""
-    return list(collection.find({"文件类型": "投标文件"}))
+    return get_data_by_file_type("投标文件", with_text)
 
 def export_to_pandas():
     """导出所有数据为 pandas DataFrame"""
+    import pandas as pd
     data = get_all_data()
     if data:
         # 移除 MongoDB 的 _id 字段
@@ -62,6 +329,7 @@ def export_to_pandas():
     
 def export_to_pandas_by_type(file_type):
     """根据文件类型导出数据为 pandas DataFrame"""
+    import pandas as pd
     data = get_data_by_file_type(file_type)
     if data:
         # 移除 MongoDB 的 _id 字段
@@ -73,68 +341,19 @@ def export_to_pandas_by_type(file_type):
 
       
 def export_to_csv(file_type=None, output_dir="./"):
-    """分类导出 CSV 文件"""
-    import os
-    
+    """分类导出 CSV 文件（流式写出，见 exporter.py）"""
+    from exporter import export_by_type, FILE_TYPES
     if file_type:
         # 导出指定类型
-        df = export_to_pandas_by_type(file_type)
-        if not df.empty:
-            filename = os.path.join(output_dir, f"{file_type}_data.csv")
-            df.to_csv(filename, index=False, encoding='utf-8-sig')
-            print(f"{file_type}数据已导出到: {filename}")
-            return True
-        else:
-            print(f"没有{file_type}数据可导出")
-            return False
-    else:
-        # 分别导出招标文件和投标文件
-        results = {}
-        
-        # 导出招标文件
-        bidding_df = export_to_pandas_by_type("招标文件")
-        if not bidding_df.empty:
-            bidding_filename = os.path.join(output_dir, "招标文件_data.csv")
-            bidding_df.to_csv(bidding_filename, index=False, encoding='utf-8-sig')
-            print(f"招标文件数据已导出到: {bidding_filename}")
-            results["招标文件"] = bidding_filename
-        else:
-            print("没有招标文件数据可导出")
-        
-        # 导出投标文件
-        tender_df = export_to_pandas_by_type("投标文件")
-        if not tender_df.empty:
-            tender_filename = os.path.join(output_dir, "投标文件_data.csv")
-            tender_df.to_csv(tender_filename, index=False, encoding='utf-8-sig')
-            print(f"投标文件数据已导出到: {tender_filename}")
-            results["投标文件"] = tender_filename
-        else:
-            print("没有投标文件数据可导出")
-        
-        return results
+        return bool(export_by_type("csv", output_dir, file_types=(file_type,)))
+    # 分别导出招标文件和投标文件
+    return export_by_type("csv", output_dir, file_types=FILE_TYPES)
 
 def export_to_excel(filename="all_data.xlsx"):
-    """导出到 Excel 文件，分工作表保存"""
+    """导出到 Excel 文件，分工作表保存（openpyxl 只写模式流式写出，见 exporter.py）"""
+    from exporter import export_xlsx
     try:
-        # 获取招标文件和投标文件数据
-        bidding_df = export_to_pandas_by_type("招标文件")
-        tender_df = export_to_pandas_by_type("投标文件")
-        
-        # 创建 Excel 写入器
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            if not bidding_df.empty:
-                bidding_df.to_excel(writer, sheet_name='招标文件', index=False)
-                print(f"招标文件数据已写入工作表: 招标文件")
-            
-            if not tender_df.empty:
-                tender_df.to_excel(writer, sheet_name='投标文件', index=False)
-                print(f"投标文件数据已写入工作表: 投标文件")
-            
-            # 如果两个都为空，创建一个空的汇总表
-            if bidding_df.empty and tender_df.empty:
-                empty_df = pd.DataFrame({"提示": ["没有数据可导出"]})
-                empty_df.to_excel(writer, sheet_name='汇总', index=False)
-        
+        export_xlsx(filename)
         print(f"Excel 文件已导出到: {filename}")
         return True
         
@@ -143,12 +362,63 @@ def export_to_excel(filename="all_data.xlsx"):
         return False
 
 def get_data_by_company(company_name):
-    """根据公司名称获取相关数据"""
-    query = {
-        "$or": [
-            {"采购人名称": {"$regex": company_name, "$options": "i"}},
-            {"投标单位": {"$regex": company_name, "$options": "i"}},
-            {"招标单位名称": {"$regex": company_name, "$options": "i"}}
-        ]
-    }
-    return list(collection.find(query))      
\ No newline at end of file
+    """根据公司名称获取相关数据
+
+    名称规范化后（去掉"有限公司"等后缀、标点和全半角差异）在 "单位名称" 中做子串匹配：
+    先用 n-gram 索引 "单位名称片段" 取出候选文档，再核对子串；只有一个字时按前缀匹配
+    """
+    from utils import normalize_company_name, company_name_ngrams
+    name = normalize_company_name(company_name)
+    if not name:
+        return []
+    if len(name) == 1:
+        query = {"单位名称": {"$regex": "^" + re.escape(name)}}
+    else:
+        query = {"单位名称片段": {"$all": sorted(company_name_ngrams(name, sizes=(min(len(name), 3),)))}}
+    return [doc for doc in get_collection().find(query, METADATA_PROJECTION)
+            if any(name in indexed for indexed in doc.get("单位名称", []))]
+
+def get_embeddings(text_hashes, model_name):
+    """批量读取文档向量，返回 {文本哈希: 向量字节}"""
+    embeddings = get_client()[DB_NAME][EMBEDDING_COLLECTION_NAME]
+    ids = [f"{model_name}:{h}" for h in text_hashes]
+    cursor = embeddings.find({"_id": {"$in": ids}}, {"text_hash": 1, "vector": 1})
+    return {doc["text_hash"]: doc["vector"] for doc in cursor}
+
+def save_embeddings(vectors, model_name):
+    """批量保存文档向量，vectors 为 {文本哈希: 向量字节}"""
+    from pymongo import UpdateOne
+    if not vectors:
+        return
+    embeddings = get_client()[DB_NAME][EMBEDDING_COLLECTION_NAME]
+    _bulk_write(embeddings, [
+        UpdateOne({"_id": f"{model_name}:{h}"},
+                  {"$set": {"text_hash": h, "model": model_name, "vector": vector}},
+                  upsert=True)
+        for h, vector in vectors.items()
+    ])
+
+def pair_score_key(text_hash1, text_hash2):
+    """文档对的键：两个文本哈希排序后拼接，与比较顺序无关"""
+    return ":".join(sorted((text_hash1, text_hash2)))
+
+def get_pair_scores(keys):
+    """批量读取文档对的各方法得分，返回 {键: {方法: {"score", "version"}}}"""
+    if not keys:
+        return {}
+    pair_scores = get_client()[DB_NAME][PAIR_SCORE_COLLECTION_NAME]
+    cursor = pair_scores.find({"_id": {"$in": list(set(keys))}}, {"scores": 1})
+    return {doc["_id"]: doc.get("scores", {}) for doc in cursor}
+
+def save_pair_scores(entries):
+    """批量保存文档对的各方法得分，entries 为 {键: {方法: {"score", "version"}}}，只覆盖给出的方法"""
+    from pymongo import UpdateOne
+    if not entries:
+        return
+    pair_scores = get_client()[DB_NAME][PAIR_SCORE_COLLECTION_NAME]
+    _bulk_write(pair_scores, [
+        UpdateOne({"_id": key},
+                  {"$set": {f"scores.{method}": item for method, item in scores.items()}},
+                  upsert=True)
+        for key, scores in entries.items()
+    ])
@@ -0,0 +1,221 @@
+# 文档级预处理结果缓存：分词、n-gram / shingle 哈希集合、结构特征，每个文档（按内容哈希）只计算一次
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import (
+    ARTIFACT_CACHE_DIR, ARTIFACT_MEMORY_ITEMS, ARTIFACT_WORKERS, ARTIFACT_NGRAM_N, ARTIFACT_SHINGLE_K,
+)
+from utils import text_hash
+
+# 缓存格式版本：分词/哈希/特征的计算方式变化时修改，旧缓存自动失效
+ARTIFACT_VERSION = 1
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+_SENTENCE_ENDS = {'。', '！', '？', '；', '\n'}
+
+
+def _mix64(values):
+    """splitmix64 终结函数，让 n-gram 哈希在 64 位空间内均匀分布（MinHash 需要）"""
+    with np.errstate(over="ignore"):
+        values = values ^ (values >> np.uint64(30))
+        values = values * np.uint64(0xBF58476D1CE4E5B9)
+        values = values ^ (values >> np.uint64(27))
+        values = values * np.uint64(0x94D049BB133111EB)
+        values = values ^ (values >> np.uint64(31))
+    return values & _MASK64
+
+
+def char_ngram_hashes(text, n):
+    """文本中每个位置开始的长度为 n 的字符片段的 64 位哈希（按位置排列，长度 len(text) - n + 1）
+
+    与 Python 内置 hash() 不同，结果跨进程稳定，可以持久化
+    """
+    if len(text) < n:
+        return np.empty(0, dtype=np.uint64)
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    hashes = np.zeros(len(codes) - n + 1, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for k in range(n):
+            hashes = hashes * np.uint64(1000003) + codes[k:len(codes) - n + 1 + k]
+    return _mix64(hashes)
+
+
+def hash_char_ngrams(text, n):
+    """文本中所有长度为 n 的字符片段的哈希集合，返回排序去重后的 uint64 数组"""
+    return np.unique(char_ngram_hashes(text, n))
+
+
+def extract_structure_features(text):
+    """文档结构特征：段落数、句子数、数字个数、标点个数"""
+    return np.array([
+        len(text.split('\n\n')),
+        len(re.split(r'[。！？]', text)),
+        len(re.findall(r'\d+', text)),
+        len(re.findall(r'[，。；：！？]', text)),
+    ], dtype=np.float64)
+
+
+def jaccard_sorted(a, b):
+    """两个排序去重的哈希数组的 Jaccard 相似度"""
+    if not len(a) and not len(b):
+        return 0
+    intersection = len(np.intersect1d(a, b, assume_unique=True))
+    return intersection / (len(a) + len(b) - intersection)
+
+
+class DocumentArtifacts:
+    """单个文档的预处理结果"""
+
+    def __init__(self, text_hash, tokens_text, ngrams, shingles, structure):
+        self.text_hash = text_hash
+        self.tokens_text = tokens_text  # 以空格连接的 jieba 分词结果（比 list 更省内存），换行保留为 "\n"
+        self.ngrams = ngrams  # 3-gram 哈希（排序去重）
+        self.shingles = shingles  # 5-shingle 哈希（排序去重）
+        self.structure = structure  # 结构特征向量
+
+    @property
+    def tokens(self):
+        """分词结果（不含换行标记）"""
+        return [token for token in self.tokens_text.split(' ') if token and token != '\n']
+
+    def sentences(self, max_tokens=1000):
+        """按句末标点和换行切分的词列表（gensim 会截断超过 10000 词的句子，所以不能整篇作为一句）"""
+        sentences, current = [], []
+        for token in self.tokens_text.split(' '):
+            if token in _SENTENCE_ENDS:
+                sentences.append(current)
+                current = []
+            elif token:
+                current.append(token)
+        sentences.append(current)
+        return [sentence[start:start + max_tokens]
+                for sentence in sentences for start in range(0, len(sentence), max_tokens)]
+
+
+def _tokenize(text):
+    """jieba 分词，去掉空白词，含换行的空白词保留为 "\n" 作为句子边界"""
+    import jieba
+    tokens = []
+    for token in jieba.cut(text):
+        if token.strip():
+            tokens.append(token.replace(' ', ''))
+        elif '\n' in token:
+            tokens.append('\n')
+    return tokens
+
+
+def compute_artifacts(text):
+    """计算单个文档的全部预处理结果（可在子进程中执行）"""
+    tokens = _tokenize(text)
+    return DocumentArtifacts(
+        text_hash(text),
+        ' '.join(tokens),
+        hash_char_ngrams(text, ARTIFACT_NGRAM_N),
+        hash_char_ngrams(text, ARTIFACT_SHINGLE_K),
+        extract_structure_features(text),
+    )
+
+
+class ArtifactStore:
+    """文档预处理结果存储：内存中按 LRU 保留最近使用的文档，磁盘上每个文档一个 pickle 文件"""
+
+    def __init__(self, cache_dir=ARTIFACT_CACHE_DIR, memory_items=ARTIFACT_MEMORY_ITEMS, workers=ARTIFACT_WORKERS):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.workers = workers
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _path(self, h):
+        return os.path.join(self.cache_dir, f"v{ARTIFACT_VERSION}", h[:2], f"{h}.pkl")
+
+    def _remember(self, artifacts):
+        with self._lock:
+            self._memory[artifacts.text_hash] = artifacts
+            self._memory.move_to_end(artifacts.text_hash)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, h):
+        with self._lock:
+            artifacts = self._memory.get(h)
+            if artifacts is not None:
+                self._memory.move_to_end(h)
+                return artifacts
+        path = self._path(h)
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    artifacts = pickle.load(f)
+            except Exception:
+                return None
+            self._remember(artifacts)
+            return artifacts
+        return None
+
+    def _save(self, artifacts):
+        path = self._path(artifacts.text_hash)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(artifacts, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[!] 文档预处理缓存写入失败: {e}")
+
+    def get(self, text):
+        """获取单个文档的预处理结果"""
+        return self.get_many([text])[0]
+
+    def get_many(self, texts):
+        """批量获取预处理结果；缺失的文档较多时用进程池并行分词"""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h in found or h in missing:
+                continue
+            artifacts = self._lookup(h)
+            if artifacts is None:
+                missing[h] = text
+            else:
+                found[h] = artifacts
+        if missing:
+            if self.workers > 1 and len(missing) > 1:
+                print(f"  - 并行预处理 {len(missing)} 个文档（分词 / n-gram / 结构特征）...")
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(missing))) as pool:
+                    computed = list(pool.map(compute_artifacts, missing.values(), chunksize=1))
+            else:
+                computed = [compute_artifacts(text) for text in missing.values()]
+            for artifacts in computed:
+                self._save(artifacts)
+                self._remember(artifacts)
+                found[artifacts.text_hash] = artifacts
+        return [found[h] for h in hashes]
+
+
+_artifact_store = None
+
+
+def get_artifact_store():
+    """获取默认的文档预处理结果存储"""
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore()
+    return _artifact_store
@@ -0,0 +1,153 @@
+# 流式导出：按批读取投影后的游标，逐批写入 CSV / Parquet / XLSX（openpyxl 只写模式），不把整个集合读入内存
+import csv
+import os
+from datetime import datetime
+
+from config import EXPORT_BATCH_SIZE, BIDDING_SCHEMA, TENDER_SCHEMA
+from db_manager import get_collection
+
+FILE_TYPES = ("招标文件", "投标文件")
+
+# schema 字段之外导出的元数据列
+_LEADING_COLUMNS = ["文件名", "文件类型"]
+_TRAILING_COLUMNS = ["数据完整性", "缺失字段", "提取时间", "文本长度", "文件哈希", "文本哈希"]
+
+# Excel 单元格最多 32767 个字符
+_XLSX_CELL_LIMIT = 32767
+
+
+def export_columns(file_type=None):
+    """导出的列：文件名、文件类型、该文件类型 schema 中的字段（按 schema 顺序）、元数据；file_type 为 None 时包含两种 schema"""
+    if file_type == "招标文件":
+        schema = BIDDING_SCHEMA
+    elif file_type == "投标文件":
+        schema = TENDER_SCHEMA
+    else:
+        schema = BIDDING_SCHEMA + TENDER_SCHEMA
+    columns = []
+    for column in _LEADING_COLUMNS + schema + _TRAILING_COLUMNS:
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def _cell(value):
+    """列表（如缺失字段）合并为一个字符串，其余原样返回"""
+    if isinstance(value, (list, tuple)):
+        return "、".join(str(item) for item in value)
+    return value
+
+
+def iter_row_batches(file_type=None, columns=None, batch_size=EXPORT_BATCH_SIZE):
+    """按批产出 [[列值, ...], ...]；只读取 columns 中的字段，游标每次从数据库取 batch_size 个文档"""
+    columns = columns or export_columns(file_type)
+    projection = {column: 1 for column in columns}
+    projection["_id"] = 0
+    query = {"文件类型": file_type} if file_type else {}
+    batch = []
+    for doc in get_collection().find(query, projection, batch_size=batch_size):
+        batch.append([_cell(doc.get(column)) for column in columns])
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_csv(path, file_type=None, batch_size=EXPORT_BATCH_SIZE):
+    """流式导出为 CSV（utf-8-sig，Excel 可直接打开），返回导出的行数"""
+    columns = export_columns(file_type)
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for batch in iter_row_batches(file_type, columns, batch_size):
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+
+def _arrow_schema(columns):
+    import pyarrow as pa
+    types = {"提取时间": pa.timestamp("us"), "文本长度": pa.int64()}
+    return pa.schema([(column, types.get(column, pa.string())) for column in columns])
+
+
+def _arrow_value(column, value):
+    if value is None or column in ("提取时间", "文本长度"):
+        return value
+    return value if isinstance(value, str) else str(value)
+
+
+def export_parquet(path, file_type=None, batch_size=EXPORT_BATCH_SIZE):
+    """流式导出为 Parquet（每批一个 row group），返回导出的行数；未安装 pyarrow 时返回 None
+
+    提取时间为时间戳、文本长度为整数，其余列统一为字符串（金额字段未能转换为数字时保留原文）
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("[错误] 未安装 pyarrow，无法导出 Parquet")
+        return None
+    columns = export_columns(file_type)
+    schema = _arrow_schema(columns)
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in iter_row_batches(file_type, columns, batch_size):
+            arrays = {column: [_arrow_value(column, row[index]) for row in batch]
+                      for index, column in enumerate(columns)}
+            writer.write_table(pa.Table.from_pydict(arrays, schema=schema))
+            rows += len(batch)
+    return rows
+
+
+def _xlsx_value(value):
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub("", value)[:_XLSX_CELL_LIMIT]
+    if value is None or isinstance(value, (int, float, datetime)):
+        return value
+    return str(value)
+
+
+def export_xlsx(path, file_types=FILE_TYPES, batch_size=EXPORT_BATCH_SIZE):
+    """流式导出为 Excel，每种文件类型一个工作表（openpyxl 只写模式，逐行写出），返回 {文件类型: 行数}"""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    counts = {}
+    for file_type in file_types:
+        columns = export_columns(file_type)
+        sheet = None
+        for batch in iter_row_batches(file_type, columns, batch_size):
+            if sheet is None:
+                sheet = workbook.create_sheet(title=file_type)
+                sheet.append(columns)
+            for row in batch:
+                sheet.append([_xlsx_value(value) for value in row])
+            counts[file_type] = counts.get(file_type, 0) + len(batch)
+        if sheet is not None:
+            print(f"{file_type}数据已写入工作表: {file_type}（{counts[file_type]} 行）")
+    if not counts:
+        sheet = workbook.create_sheet(title="汇总")
+        sheet.append(["提示"])
+        sheet.append(["没有数据可导出"])
+    workbook.save(path)
+    return counts
+
+
+def export_by_type(fmt, output_dir="./", file_types=FILE_TYPES, batch_size=EXPORT_BATCH_SIZE):
+    """按文件类型分别导出为 CSV 或 Parquet 文件，返回 {文件类型: 文件路径}"""
+    export = {"csv": export_csv, "parquet": export_parquet}[fmt]
+    results = {}
+    for file_type in file_types:
+        path = os.path.join(output_dir, f"{file_type}_data.{fmt}")
+        rows = export(path, file_type, batch_size)
+        if not rows:
+            if rows == 0:
+                os.remove(path)
+                print(f"没有{file_type}数据可导出")
+            continue
+        print(f"{file_type}数据已导出到: {path}（{rows} 行）")
+        results[file_type] = path
+    return results
@@ -0,0 +1,195 @@
+# MinHash-LSH 候选文档对索引：只有估计 Jaccard 相似度足够高的文档对才进入逐对综合比较
+import os
+import pickle
+import threading
+
+import numpy as np
+
+from config import LSH_INDEX_PATH, LSH_NUM_PERM, LSH_BANDS, LSH_SEED
+from doc_artifacts import ARTIFACT_VERSION, get_artifact_store
+from utils import text_hash
+
+_MAX_HASH = np.iinfo(np.uint64).max
+
+
+def minhash_permutations(num_perm=LSH_NUM_PERM, seed=LSH_SEED):
+    """生成 num_perm 组哈希函数参数 (a, b)，h(x) = a * x + b (mod 2^64)，a 为奇数"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MAX_HASH, size=num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+    b = rng.integers(0, _MAX_HASH, size=num_perm, dtype=np.uint64, endpoint=True)
+    return a, b
+
+
+def minhash_signature(shingles, permutations, chunk_size=4096):
+    """由 shingle 哈希数组计算 MinHash 签名（分块计算，内存占用为 chunk_size × num_perm）"""
+    a, b = permutations
+    signature = np.full(len(a), _MAX_HASH, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for start in range(0, len(shingles), chunk_size):
+            chunk = shingles[start:start + chunk_size, None]
+            np.minimum(signature, (chunk * a + b).min(axis=0), out=signature)
+    return signature
+
+
+def estimate_jaccard(signature1, signature2):
+    """两个 MinHash 签名相同位置相等的比例，即 Jaccard 相似度的无偏估计"""
+    return float(np.mean(signature1 == signature2))
+
+
+class MinHashLSH:
+    """MinHash 签名 + LSH 分桶索引
+
+    签名分为 bands 段，任意一段完全相同的两个文档成为候选对；
+    估计 Jaccard 为 s 的文档对成为候选的概率为 1 - (1 - s^rows)^bands。
+    签名和分桶按文本哈希保存，新文档只需计算自己的签名并加入分桶，索引持久化到 path。
+    """
+
+    def __init__(self, path=LSH_INDEX_PATH, num_perm=LSH_NUM_PERM, bands=LSH_BANDS, seed=LSH_SEED):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) 必须是 bands ({bands}) 的整数倍")
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.seed = seed
+        self.permutations = minhash_permutations(num_perm, seed)
+        self.signatures = {}
+        self.buckets = [{} for _ in range(bands)]
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _settings(self):
+        # 参数或 shingle 计算方式变化后，已保存的签名不能再用
+        return (self.num_perm, self.bands, self.seed, ARTIFACT_VERSION)
+
+    def load(self):
+        """从磁盘加载已保存的签名（参数一致时），成功返回 True"""
+        if self._loaded:
+            return True
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+        except Exception as e:
+            print(f"[!] LSH 索引加载失败: {e}")
+            return False
+        if saved.get("settings") != self._settings():
+            print("[!] LSH 索引参数已变化，重新建立索引")
+            return False
+        for h, signature in saved["signatures"].items():
+            self._insert(h, signature)
+        return True
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"settings": self._settings(), "signatures": self.signatures}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[!] LSH 索引保存失败: {e}")
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _insert(self, h, signature):
+        self.signatures[h] = signature
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(key, set()).add(h)
+
+    def update(self, texts):
+        """把尚未建立索引的文档加入索引（增量），有新文档时保存到磁盘"""
+        with self._lock:
+            self.load()
+            missing = {}
+            for text in texts:
+                h = text_hash(text)
+                if h not in self.signatures:
+                    missing[h] = text
+            if not missing:
+                return self
+            print(f"  - 计算 {len(missing)} 个文档的 MinHash 签名...")
+            for artifacts in get_artifact_store().get_many(list(missing.values())):
+                if len(artifacts.shingles):
+                    self._insert(artifacts.text_hash, minhash_signature(artifacts.shingles, self.permutations))
+            self.save()
+        return self
+
+    def query(self, text, min_jaccard=0.0):
+        """返回与 text 同桶且估计 Jaccard 不低于 min_jaccard 的已索引文档 {文本哈希: 估计 Jaccard}
+
+        text 不会加入索引（只计算签名），新文档入库时才用 update 加入
+        """
+        with self._lock:
+            self.load()
+        h = text_hash(text)
+        signature = self.signatures.get(h)
+        if signature is None:
+            artifacts = get_artifact_store().get(text)
+            if not len(artifacts.shingles):
+                return {}
+            signature = minhash_signature(artifacts.shingles, self.permutations)
+        matches = {}
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            for other in bucket.get(key, ()):
+                if other != h and other not in matches:
+                    matches[other] = estimate_jaccard(signature, self.signatures[other])
+        return {other: score for other, score in matches.items() if score >= min_jaccard}
+
+    def candidate_pairs(self, texts, min_jaccard=0.0):
+        """产出 texts 中的候选文档对 (i, j, 估计 Jaccard)，i < j，按 (i, j) 排序
+
+        只在 texts 内部配对（索引中的其他文档不参与）；内容完全相同的文档总是成对产出
+        """
+        self.update(texts)
+        positions = {}
+        for index, text in enumerate(texts):
+            positions.setdefault(text_hash(text), []).append(index)
+
+        pair_scores = {}
+        for h, indexes in positions.items():
+            for a in range(len(indexes)):
+                for b in range(a + 1, len(indexes)):
+                    pair_scores[(indexes[a], indexes[b])] = 1.0
+        checked = set()
+        for bucket in self.buckets:
+            for members in bucket.values():
+                members = [h for h in members if h in positions]
+                for a in range(len(members)):
+                    for b in range(a + 1, len(members)):
+                        key = tuple(sorted((members[a], members[b])))
+                        if key in checked:
+                            continue
+                        checked.add(key)
+                        score = estimate_jaccard(self.signatures[key[0]], self.signatures[key[1]])
+                        if score < min_jaccard:
+                            continue
+                        for i in positions[key[0]]:
+                            for j in positions[key[1]]:
+                                pair_scores[(min(i, j), max(i, j))] = score
+        for (i, j), score in sorted(pair_scores.items()):
+            yield i, j, score
+
+
+_lsh_index = None
+
+
+def get_lsh_index():
+    """获取默认的 MinHash-LSH 索引"""
+    global _lsh_index
+    if _lsh_index is None:
+        _lsh_index = MinHashLSH()
+    return _lsh_index
@@ -1,6 +1,84 @@
-from pdf_info_extract import process_pdfs
+import argparse
 
-if __name__ == "__main__":
+# 各子命令只在执行时导入对应模块，避免启动时加载 OCR / NLP / 相似度模型等用不到的子系统
+
+
+def run_ingest(args):
+    """处理 pdfs 文件夹中的 PDF 并写入数据库"""
+    import pdf_info_extract
+    pdf_info_extract.process_pdfs(pipelined=args.pipelined, folder=args.folder)
+
+
+def run_export(args):
+    """导出数据库中的数据"""
+    from db_manager import export_to_excel, export_to_csv
+    if args.format == "csv":
+        export_to_csv(output_dir=args.output or "./")
+    elif args.format == "parquet":
+        from exporter import export_by_type
+        export_by_type("parquet", args.output or "./")
+    else:
+        export_to_excel(args.output or "标书数据.xlsx")
+
+
+def run_similarity(args):
+    """检测投标文件相似度并打印结果（默认先用 MinHash-LSH 筛选候选文档对）"""
+    from config import LSH_MIN_JACCARD
+    from similarity_detect import AdvancedSimilarityDetector
+    if args.all_pairs:
+        lsh_min_jaccard = None
+    else:
+        lsh_min_jaccard = LSH_MIN_JACCARD if args.lsh_min_jaccard is None else args.lsh_min_jaccard
+    results = AdvancedSimilarityDetector().detect_bidding_documents(threshold=args.threshold,
+                                                                    lsh_min_jaccard=lsh_min_jaccard,
+                                                                    cascade=args.cascade,
+                                                                    workers=args.workers,
+                                                                    method_timeout=args.method_timeout,
+                                                                    block_by_project=args.block_by_project)
+    if isinstance(results, dict):
+        print(results.get("message"))
+        return
+    print(f"发现 {len(results)} 对相似度超过 {args.threshold} 的投标文件")
+    for result in results:
+        print(f"  {result['file1']} <-> {result['file2']}: {result['similarity_score']:.4f}")
+
+
+def run_report(args):
+    """生成相似度检测报告"""
+    from similarity_detect import create_similarity_detect_report
+    create_similarity_detect_report(args.output or "similarity_report.txt", block_by_project=args.block_by_project)
+
+
+def run_migrate_texts(args):
+    """把旧数据中内嵌的原始文本迁移到单独的文本集合"""
+    from db_manager import migrate_inline_texts
+    migrated = migrate_inline_texts()
+    print(f"[完成] 共迁移 {migrated} 个文档的原始文本")
+
+
+def run_backfill_companies(args):
+    """为旧数据补充公司名称索引字段"""
+    from db_manager import backfill_company_names
+    updated = backfill_company_names()
+    print(f"[完成] 共更新 {updated} 个文档的公司名称索引")
+
+
+def run_benchmark(args):
+    """用合成语料分阶段测试性能，结果写入 JSON；给出 --compare 时与之前的结果比较"""
+    from benchmark import run_benchmark, compare_benchmarks
+    from config import BENCHMARK_SIZES, BENCHMARK_OUTPUT
+    output = args.output or BENCHMARK_OUTPUT
+    run_benchmark(args.sizes or BENCHMARK_SIZES, output, methods=args.methods,
+                  stages=args.stages or ("extract", "extract_info", "similarity", "database"),
+                  keep_files=args.keep_files)
+    if args.compare:
+        regressions = compare_benchmarks(args.compare, output)
+        print(f"[完成] 共 {len(regressions)} 个阶段比基准变慢")
+
+
+def run_all(args):
+    """依次执行：处理 PDF、导出 Excel、生成相似度检测报告"""
+    from pdf_info_extract import process_pdfs
     process_pdfs()
     # 处理完成后，可以在数据库中查看提取结果, 也可以导出为 Excel 文件
     from db_manager import export_to_excel
@@ -8,4 +86,83 @@ if __name__ == "__main__":
 
     # 创立相似度检测报告
     from similarity_detect import create_similarity_detect_report
-    create_similarity_detect_report("similarity_report.xlsx")
\ No newline at end of file
+    create_similarity_detect_report("similarity_report.txt")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="标书 PDF 信息提取与相似度检测")
+    parser.add_argument("--metrics", help="运行结束时导出运行指标（.prom 为 Prometheus 文本格式，其余为 JSON），"
+                                          "默认使用 config.METRICS_OUTPUT")
+    parser.add_argument("--event-log", help="把结构化事件追加写入该文件（JSON 行），默认使用 config.METRICS_EVENT_LOG")
+    parser.add_argument("--profile", nargs="+", metavar="STAGE",
+                        help="对这些阶段做 cProfile 采样（如 ingest pdf_extract uie similarity，* 表示全部）")
+    parser.add_argument("--tracemalloc", action="store_true", help="采样的阶段同时记录内存峰值和占用最多的代码行")
+    subparsers = parser.add_subparsers(dest="command")
+
+    ingest = subparsers.add_parser("ingest", help="处理 PDF 并写入数据库")
+    ingest.add_argument("--folder", help="PDF 文件夹，默认使用 config.PDF_FOLDER")
+    ingest.add_argument("--pipelined", action="store_true", help="使用流水线模式并发处理")
+    ingest.set_defaults(func=run_ingest)
+
+    export = subparsers.add_parser("export", help="导出数据库中的数据")
+    export.add_argument("--format", choices=["xlsx", "csv", "parquet"], default="xlsx")
+    export.add_argument("--output", help="输出文件（xlsx）或输出目录（csv / parquet）")
+    export.set_defaults(func=run_export)
+
+    similarity = subparsers.add_parser("similarity", help="检测投标文件相似度")
+    similarity.add_argument("--threshold", type=float, default=0.7)
+    similarity.add_argument("--lsh-min-jaccard", type=float,
+                            help="MinHash-LSH 候选文档对的最低估计 Jaccard 相似度，默认使用 config.LSH_MIN_JACCARD")
+    similarity.add_argument("--all-pairs", action="store_true", help="不用 LSH 筛选，比较所有文档对")
+    similarity.add_argument("--cascade", action="store_true",
+                            help="按耗时从低到高计算各方法，得分确定超过或不会超过阈值时提前停止")
+    similarity.add_argument("--workers", type=int, help="逐对比较的进程数，默认使用 config.SIMILARITY_WORKERS")
+    similarity.add_argument("--method-timeout", type=float,
+                            help="单个相似度方法的超时时间（秒），默认使用 config.SIMILARITY_METHOD_TIMEOUT")
+    similarity.add_argument("--block-by-project", action="store_true", help="只比较同一项目的投标文件")
+    similarity.set_defaults(func=run_similarity)
+
+    report = subparsers.add_parser("report", help="生成相似度检测报告")
+    report.add_argument("--output", help="报告文件路径")
+    report.add_argument("--block-by-project", action="store_true", help="只比较同一项目的投标文件")
+    report.set_defaults(func=run_report)
+
+    migrate_texts = subparsers.add_parser("migrate-texts", help="把旧数据中内嵌的原始文本迁移到文本集合")
+    migrate_texts.set_defaults(func=run_migrate_texts)
+
+    backfill_companies = subparsers.add_parser("backfill-companies", help="为旧数据补充公司名称索引字段")
+    backfill_companies.set_defaults(func=run_backfill_companies)
+
+    benchmark = subparsers.add_parser("benchmark", help="用合成语料分阶段测试性能")
+    benchmark.add_argument("--sizes", type=int, nargs="+", help="语料规模（投标文件数），默认使用 config.BENCHMARK_SIZES")
+    benchmark.add_argument("--output", help="结果 JSON 文件，默认使用 config.BENCHMARK_OUTPUT")
+    benchmark.add_argument("--methods", nargs="+", help="只测试这些相似度方法（默认全部）")
+    benchmark.add_argument("--stages", nargs="+", choices=["extract", "extract_info", "similarity", "database"],
+                           help="只测试这些阶段（默认全部）")
+    benchmark.add_argument("--compare", help="与之前的结果 JSON 比较，列出变慢的阶段")
+    benchmark.add_argument("--keep-files", action="store_true", help="保留生成的 PDF 等临时文件")
+    benchmark.set_defaults(func=run_benchmark)
+
+    parser.set_defaults(func=run_all)
+    return parser
+
+
+def run_with_metrics(args):
+    """执行子命令，整个命令作为一个阶段计时；结束时（包括出错时）导出运行指标和采样结果"""
+    import metrics
+    from config import METRICS_OUTPUT
+    registry = metrics.get_metrics()
+    registry.configure(event_log=args.event_log, profile_stages=args.profile,
+                       trace_memory=True if args.tracemalloc else None)
+    try:
+        with metrics.stage(args.command or "all"):
+            args.func(args)
+    finally:
+        output = args.metrics or METRICS_OUTPUT
+        if output:
+            registry.write(output)
+        registry.dump_profiles()
+
+
+if __name__ == "__main__":
+    run_with_metrics(build_parser().parse_args())
@@ -0,0 +1,310 @@
+# 运行指标：计数器、直方图、结构化事件，按阶段计时（可选 cProfile / tracemalloc），运行结束时导出为 Prometheus 文本或 JSON
+import bisect
+import cProfile
+import json
+import math
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import METRICS_EVENT_LOG, METRICS_PROFILE_STAGES, METRICS_TRACEMALLOC, METRICS_PROFILE_DIR
+
+# 直方图的桶上界（秒），覆盖单页文本提取（毫秒级）到整本 OCR（分钟级）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, data):
+        for index, count in enumerate(data["counts"]):
+            self.counts[index] += count
+        self.count += data["count"]
+        self.sum += data["sum"]
+        if data["count"]:
+            self.min = min(self.min, data["min"])
+            self.max = max(self.max, data["max"])
+
+    def to_dict(self):
+        return {
+            "count": self.count, "sum": self.sum,
+            "min": self.min if self.count else None, "max": self.max if self.count else None,
+            "mean": self.sum / self.count if self.count else None,
+            "buckets": list(self.buckets), "counts": list(self.counts),
+        }
+
+
+class MetricsRegistry:
+    """进程内的指标汇总（线程安全）
+
+    - 计数器 inc(name, value, **labels)，直方图 observe(name, value, **labels)，仪表 set_gauge(name, value, **labels)
+    - event(name, **fields) 写一行 JSON 到 event_log（未设置时不记录）
+    - stage(name) 计时一个阶段（记入 stage_seconds 直方图），阶段在 profile_stages 中时同时用 cProfile 采样、
+      tracemalloc 记录内存峰值；同一阶段多次进入时累计到同一个 cProfile 结果
+    - 子进程中记录的指标用 drain() 取出、随结果传回，在主进程 merge()
+    """
+
+    def __init__(self, event_log=METRICS_EVENT_LOG, profile_stages=METRICS_PROFILE_STAGES,
+                 trace_memory=METRICS_TRACEMALLOC, profile_dir=METRICS_PROFILE_DIR):
+        self.event_log = event_log
+        self.profile_stages = set(profile_stages or ())
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._profiles = {}
+        self._memory = {}  # 阶段 -> tracemalloc 快照
+        self._lock = threading.Lock()
+
+    def configure(self, event_log=None, profile_stages=None, trace_memory=None, profile_dir=None):
+        """修改事件日志、需要采样的阶段等设置（参数为 None 时保持不变）"""
+        if event_log is not None:
+            self.event_log = event_log
+        if profile_stages is not None:
+            self.profile_stages = set(profile_stages)
+        if trace_memory is not None:
+            self.trace_memory = trace_memory
+        if profile_dir is not None:
+            self.profile_dir = profile_dir
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """把 with 块的耗时（秒）记入直方图 name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def event(self, name, **fields):
+        """记录一条结构化事件（JSON 行）"""
+        if not self.event_log:
+            return
+        line = json.dumps({"time": datetime.now().isoformat(timespec="milliseconds"), "event": name, **fields},
+                          ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.event_log, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _profiled(self, name):
+        return name in self.profile_stages or "*" in self.profile_stages
+
+    @contextmanager
+    def stage(self, name):
+        """计时一个阶段；name 在 profile_stages 中（或其中有 "*"）时同时采样 cProfile，trace_memory 时记录内存峰值"""
+        profiler = None
+        traced = False
+        if self._profiled(name):
+            profiler = self._profiles.setdefault(name, cProfile.Profile())
+            try:
+                profiler.enable()
+            except ValueError:
+                profiler = None  # 当前线程已有其他阶段在采样，只计时
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                traced = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            if traced:
+                _, peak = tracemalloc.get_traced_memory()
+                self._memory[name] = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                with self._lock:
+                    key = ("stage_peak_memory_bytes", _label_key({"stage": name}))
+                    self._gauges[key] = max(self._gauges.get(key, 0), peak)
+            self.observe("stage_seconds", seconds, stage=name)
+            self.event("stage", stage=name, seconds=round(seconds, 6))
+
+    def snapshot(self):
+        """当前全部指标：{"counters": [...], "gauges": [...], "histograms": [...]}"""
+        with self._lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self._counters.items())],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                           for (name, labels), value in sorted(self._gauges.items())],
+                "histograms": [dict(name=name, labels=dict(labels), **histogram.to_dict())
+                               for (name, labels), histogram in sorted(self._histograms.items())],
+            }
+
+    def drain(self):
+        """取出并清空计数器和直方图（子进程把增量传回主进程用）"""
+        data = self.snapshot()
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+        return data
+
+    def merge(self, data):
+        """合并 snapshot() / drain() 的结果"""
+        if not data:
+            return
+        with self._lock:
+            for item in data.get("counters", []):
+                key = (item["name"], _label_key(item["labels"]))
+                self._counters[key] = self._counters.get(key, 0) + item["value"]
+            for item in data.get("gauges", []):
+                self._gauges[(item["name"], _label_key(item["labels"]))] = item["value"]
+            for item in data.get("histograms", []):
+                key = (item["name"], _label_key(item["labels"]))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = _Histogram(tuple(item["buckets"]))
+                histogram.merge(item)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self._profiles.clear()
+            self._memory.clear()
+
+    def to_prometheus(self):
+        """Prometheus 文本格式（直方图的桶为累计计数）"""
+        def labels_text(labels, extra=None):
+            items = list(labels.items()) + (extra or [])
+            if not items:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                       for _, value in items)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+        data = self.snapshot()
+        lines = []
+        for kind, items in (("counter", data["counters"]), ("gauge", data["gauges"])):
+            declared = set()
+            for item in items:
+                if item["name"] not in declared:
+                    lines.append(f"# TYPE {item['name']} {kind}")
+                    declared.add(item["name"])
+                lines.append(f"{item['name']}{labels_text(item['labels'])} {item['value']}")
+        declared = set()
+        for item in data["histograms"]:
+            name = item["name"]
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            cumulative = 0
+            for bound, count in zip(list(item["buckets"]) + ["+Inf"], item["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{labels_text(item['labels'], [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{labels_text(item['labels'])} {item['sum']}")
+            lines.append(f"{name}_count{labels_text(item['labels'])} {item['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """导出全部指标：.prom / .txt 为 Prometheus 文本格式，其余为 JSON"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(dict(created=datetime.now().isoformat(timespec="seconds"), **self.snapshot()),
+                          f, ensure_ascii=False, indent=2)
+        print(f"[√] 运行指标已导出到: {path}")
+
+    def dump_profiles(self, directory=None, top=30):
+        """保存各阶段的 cProfile 结果（.prof，可用 python -m pstats 或 snakeviz 查看）和内存占用最多的代码行，返回文件列表"""
+        if not self._profiles and not self._memory:
+            return []
+        directory = directory or self.profile_dir
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        files = []
+        for name, profiler in self._profiles.items():
+            path = os.path.join(directory, f"{name}_{stamp}.prof")
+            profiler.dump_stats(path)
+            files.append(path)
+        for name, snapshot in self._memory.items():
+            path = os.path.join(directory, f"{name}_{stamp}_memory.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                for stat in snapshot.statistics("lineno")[:top]:
+                    f.write(f"{stat}\n")
+            files.append(path)
+        for path in files:
+            print(f"[√] 已保存性能采样结果: {path}")
+        return files
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """获取默认的指标汇总"""
+    return _registry
+
+
+# 模块级快捷函数，均作用于默认的指标汇总
+def inc(name, value=1, **labels):
+    _registry.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    _registry.observe(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    _registry.set_gauge(name, value, **labels)
+
+
+def timer(name, **labels):
+    return _registry.timer(name, **labels)
+
+
+def event(name, **fields):
+    _registry.event(name, **fields)
+
+
+def stage(name):
+    return _registry.stage(name)
+
+
+def reset():
+    """清空默认的指标汇总（也用作子进程的初始化函数：fork 出的子进程会继承主进程已记录的指标）"""
+    _registry.reset()
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from pdfminer.pdftypes import PDFStream, resolve1
+
+from config import OCR_DPI, OCR_LANG, PAGE_CACHE_PATH, PAGE_CACHE_MAX_MB
+from utils import clean_ocr_text
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """计算文件内容的 sha256（与文件名无关，重命名后不变）"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stream_bytes(obj):
+    obj = resolve1(obj)
+    if isinstance(obj, PDFStream):
+        data = obj.get_rawdata()
+        return data if data is not None else obj.get_data()
+    return b""
+
+
+def _hash_resources(h, resources, depth=0):
+    """把页面引用的图片、表单和字体计入哈希（表单对象递归一层）"""
+    resources = resolve1(resources) or {}
+    xobjects = resolve1(resources.get("XObject")) or {}
+    for name in sorted(xobjects, key=str):
+        xobject = resolve1(xobjects[name])
+        h.update(_stream_bytes(xobject))
+        if depth < 2 and isinstance(xobject, PDFStream) and "Resources" in xobject.attrs:
+            _hash_resources(h, xobject.attrs["Resources"], depth + 1)
+    fonts = resolve1(resources.get("Font")) or {}
+    for name in sorted(fonts, key=str):
+        font = resolve1(fonts[name]) or {}
+        h.update(repr(resolve1(font.get("BaseFont"))).encode())
+        h.update(_stream_bytes(font.get("ToUnicode")))
+
+
+def page_fingerprint(page):
+    """计算页面内容哈希：页面尺寸 + 内容流 + 引用的图片/字体
+
+    不同文件中完全相同的页面（如复制的资质证书扫描页）得到相同的哈希
+    """
+    h = hashlib.sha256()
+    h.update(repr((round(float(page.width), 2), round(float(page.height), 2),
+                   getattr(page, "rotation", 0))).encode())
+    page_obj = page.page_obj
+    for stream in page_obj.contents or []:
+        h.update(_stream_bytes(stream))
+    _hash_resources(h, page_obj.resources)
+    return h.hexdigest()
+
+
+def ocr_settings_key(dpi=OCR_DPI, lang=OCR_LANG, clean_func=clean_ocr_text):
+    """OCR 参数版本号：DPI、语言或清理函数实现变化后，旧缓存自动失效"""
+    code = clean_func.__code__
+    parts = [str(dpi), lang, f"{clean_func.__module__}.{clean_func.__qualname__}",
+             code.co_code.hex(), repr(code.co_consts)]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class PageTextCache:
+    """按文件哈希和页面哈希持久化每页文本及其提取方式（sqlite），超出容量时按 LRU 淘汰"""
+
+    def __init__(self, path=PAGE_CACHE_PATH, max_bytes=PAGE_CACHE_MAX_MB * 1024 * 1024, settings_key=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.settings_key = settings_key or ocr_settings_key()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                page_hash TEXT, settings TEXT, text TEXT, method TEXT,
+                size INTEGER, last_used REAL, PRIMARY KEY (page_hash, settings));
+            CREATE INDEX IF NOT EXISTS idx_pages_last_used ON pages (last_used);
+            CREATE TABLE IF NOT EXISTS files (
+                file_hash TEXT, settings TEXT, page_hashes TEXT,
+                last_used REAL, PRIMARY KEY (file_hash, settings));
+        """)
+        self._conn.commit()
+
+    def get_page(self, page_hash):
+        """返回 (文本, 提取方式)，未命中返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, method FROM pages WHERE page_hash = ? AND settings = ?",
+                (page_hash, self.settings_key)).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE pages SET last_used = ? WHERE page_hash = ? AND settings = ?",
+                    (time.time(), page_hash, self.settings_key))
+                self._conn.commit()
+        return tuple(row) if row else None
+
+    def put_page(self, page_hash, text, method):
+        """写入单页文本，method 为 "text"（文本层）或 "ocr" """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (page_hash, self.settings_key, text, method, len(text.encode("utf-8")), time.time()))
+            self._conn.commit()
+            self._evict()
+
+    def get_file(self, file_hash):
+        """返回整个文件按页排列的 [(页面哈希, 文本, 提取方式)]；任一页已被淘汰则视为未命中"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_hashes FROM files WHERE file_hash = ? AND settings = ?",
+                (file_hash, self.settings_key)).fetchone()
+        if not row:
+            return None
+        pages = []
+        for page_hash in json.loads(row[0]):
+            cached = self.get_page(page_hash)
+            if cached is None:
+                return None
+            pages.append((page_hash, *cached))
+        return pages
+
+    def put_file(self, file_hash, page_hashes):
+        """记录文件由哪些页面组成"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (file_hash, self.settings_key, json.dumps(page_hashes), time.time()))
+            self._conn.commit()
+
+    def _evict(self):
+        """总大小超过上限时淘汰最久未使用的页面，直到降到上限的 90%"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for page_hash, settings, size in self._conn.execute(
+                "SELECT page_hash, settings, size FROM pages ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM pages WHERE page_hash = ? AND settings = ?", (page_hash, settings))
+            total -= size
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+
+
+def get_page_cache():
+    """获取默认的页面文本缓存"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PageTextCache()
+    return _default_cache
@@ -0,0 +1,141 @@
+# 重复段落定位：winnowing 指纹找到两个文档共有的片段，向两侧扩展为完整段落，返回字符位置和原文
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from config import PASSAGE_KGRAM, PASSAGE_WINDOW, PASSAGE_MIN_LENGTH, PASSAGE_MAX_GAP
+from doc_artifacts import char_ngram_hashes
+
+# 同一个指纹在文档 1 中出现次数超过该值时（多为页眉、表格、重复条款），文档 2 中的每次出现只与文档 1 中
+# 顺序相近的这么多次出现配对，避免候选数量按出现次数的平方增长，又不会丢掉整段重复内容
+_MAX_OCCURRENCES = 50
+
+
+def winnow(text, k=PASSAGE_KGRAM, window=PASSAGE_WINDOW):
+    """winnowing 指纹：每 window 个相邻 k-gram 哈希中取最小值，返回 (哈希数组, 位置数组)
+
+    长度不小于 window + k - 1 的共同片段一定会产生至少一个相同的指纹
+    """
+    hashes = char_ngram_hashes(text, k)
+    if len(hashes) == 0:
+        return hashes, np.empty(0, dtype=np.int64)
+    if len(hashes) <= window:
+        positions = np.array([int(np.argmin(hashes))])
+    else:
+        windows = sliding_window_view(hashes, window)
+        positions = np.unique(np.arange(len(windows)) + windows.argmin(axis=1))
+    return hashes[positions], positions
+
+
+def _extend_forward(text1, text2, i, j, step=64):
+    """text1[i:] 与 text2[j:] 的公共前缀长度（先按块比较，再逐字符）"""
+    length = 0
+    limit = min(len(text1) - i, len(text2) - j)
+    while length + step <= limit and text1[i + length:i + length + step] == text2[j + length:j + length + step]:
+        length += step
+    while length < limit and text1[i + length] == text2[j + length]:
+        length += 1
+    return length
+
+
+def _extend_backward(text1, text2, i, j):
+    """text1[:i] 与 text2[:j] 的公共后缀长度"""
+    length = 0
+    while i - length > 0 and j - length > 0 and text1[i - length - 1] == text2[j - length - 1]:
+        length += 1
+    return length
+
+
+def _exact_matches(text1, text2, k, window):
+    """由相同指纹出发，沿对角线向两侧扩展得到的完全相同片段 [(start1, start2, 长度)]"""
+    hashes1, positions1 = winnow(text1, k, window)
+    hashes2, positions2 = winnow(text2, k, window)
+    index1, index2 = {}, {}
+    for index, hashes, positions in ((index1, hashes1, positions1), (index2, hashes2, positions2)):
+        for h, position in zip(hashes.tolist(), positions.tolist()):
+            index.setdefault(h, []).append(position)  # 位置递增
+
+    seeds = []
+    for h, occurrences2 in index2.items():
+        occurrences1 = index1.get(h)
+        if not occurrences1:
+            continue
+        if len(occurrences1) <= _MAX_OCCURRENCES:
+            seeds.extend((i - j, i, j) for j in occurrences2 for i in occurrences1)
+            continue
+        # 高频指纹：第 t 次出现只与文档 1 中排序位置相近的出现配对（整段抄袭时对应的出现顺序一致）
+        half = _MAX_OCCURRENCES // 2
+        for rank, j in enumerate(occurrences2):
+            center = rank * len(occurrences1) // len(occurrences2)
+            for i in occurrences1[max(0, center - half):center + half + 1]:
+                seeds.append((i - j, i, j))
+    seeds.sort()
+
+    matches = []
+    covered = {}  # 对角线 (i - j) -> 已扩展到的 text1 位置，落在已有片段内的种子直接跳过
+    for diagonal, i, j in seeds:
+        if i < covered.get(diagonal, -1):
+            continue
+        if text1[i:i + k] != text2[j:j + k]:
+            continue  # 哈希碰撞
+        back = _extend_backward(text1, text2, i, j)
+        forward = _extend_forward(text1, text2, i, j)
+        matches.append((i - back, j - back, back + forward))
+        covered[diagonal] = i + forward
+    return matches
+
+
+def _merge_matches(matches, max_gap):
+    """按 text1 位置排序，把两个文档中间隔都不超过 max_gap 的相邻片段合并（容忍少量改字）"""
+    merged = []
+    for start1, start2, length in sorted(matches):
+        if merged:
+            last = merged[-1]
+            gap1 = start1 - last[1]
+            gap2 = start2 - last[3]
+            if -length < gap1 <= max_gap and -length < gap2 <= max_gap:
+                last[1] = max(last[1], start1 + length)
+                last[3] = max(last[3], start2 + length)
+                continue
+        merged.append([start1, start1 + length, start2, start2 + length])
+    return merged
+
+
+def find_shared_passages(text1, text2, min_length=PASSAGE_MIN_LENGTH, max_gap=PASSAGE_MAX_GAP,
+                         k=PASSAGE_KGRAM, window=PASSAGE_WINDOW):
+    """找出两个文档中长度不少于 min_length 的共同段落
+
+    返回按 text1 位置排序的列表，每项为
+    {"start1", "end1", "start2", "end2", "length", "text1", "text2"}（字符偏移，左闭右开）；
+    max_gap > 0 时相距不超过 max_gap 个字符的片段合并为一段，此时 text1 与 text2 可能有个别字不同。
+    指纹和扩展的总开销与文本长度和共同内容长度近似线性
+    """
+    if not text1 or not text2:
+        return []
+    # 共同片段短于 window + k - 1 时不保证被找到，min_length 不应小于它
+    window = max(1, min(window, min_length - k + 1))
+    passages = []
+    for start1, end1, start2, end2 in _merge_matches(_exact_matches(text1, text2, k, window), max_gap):
+        length = max(end1 - start1, end2 - start2)
+        if length < min_length:
+            continue
+        if passages and start1 >= passages[-1]["start1"] and end1 <= passages[-1]["end1"]:
+            continue  # 被上一段完全包含
+        passages.append({
+            "start1": start1, "end1": end1, "start2": start2, "end2": end2, "length": length,
+            "text1": text1[start1:end1], "text2": text2[start2:end2],
+        })
+    return passages
+
+
+def passage_coverage(passages, text_length, key="1"):
+    """共同段落覆盖了文档多大比例（key 为 "1" 或 "2"，重叠部分只计一次）"""
+    if not text_length:
+        return 0
+    covered = 0
+    current_end = 0
+    for start, end in sorted((p[f"start{key}"], p[f"end{key}"]) for p in passages):
+        start = max(start, current_end)
+        if end > start:
+            covered += end - start
+            current_end = end
+    return covered / text_length
@@ -1,72 +1,97 @@
+import importlib.util
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from config import PDF_FOLDER
-from pdf_reader import extract_pdf_text
-from db_manager import insert_bid_data, bid_exists
+from itertools import chain
+from config import (
+    PDF_FOLDER, PIPELINE_EXTRACT_WORKERS, PIPELINE_NLP_WORKERS, PIPELINE_DB_WORKERS, PIPELINE_QUEUE_SIZE,
+    PIPELINE_NLP_BATCH_DOCS, NLP_WINDOW_SIZE, NLP_WINDOW_OVERLAP, NLP_BATCH_SIZE, NLP_MAX_SEQ_LEN, UIE_MODEL_NAME,
+    W2V_UPDATE_ON_INGEST, LSH_UPDATE_ON_INGEST, BIDDING_SCHEMA, TENDER_SCHEMA,
+)
+from pdf_reader import iter_pdf_pages
+from db_manager import BidWriter, get_existing_bids
+from page_cache import hash_file
+import metrics
 import re
 
 from utils import (
-    extract_amount, preprocess_text_for_nlp, 
+    extract_amount, clean_text, iter_text_windows, get_rss_mb,
 )
 
 # 忽略 FutureWarning 警告
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-# PaddleNLP 实体识别相关
-try:
-    from paddlenlp import Taskflow
-    PADDLENLP_AVAILABLE = True
-except ImportError as e:
-    print(f"[错误] PaddleNLP 未安装，请确保已安装 PaddleNLP 库: {e}")
-    PADDLENLP_AVAILABLE = False
-
-
-# 为招标文件和投标文件分别定义 schema
-BIDDING_SCHEMA = [
-    # 招标文件专用字段
-    "项目名称","招标编号",  "招标单位名称", "招标单位地址", "代理机构", 
-    "评分办法", "最高限价", "开标时间", "投标截止时间",
-    "项目编号", "招标单位联系人姓名", "招标单位联系电话", "公告发布时间"
-]
-
-TENDER_SCHEMA = [
-    # 投标文件专用字段
-    "项目名称", "投标单位名称", "采购代理机构", "法定代表人", "投标单位联系人姓名", 
-    "投标单位联系电话", "投标单位联系邮箱", "投标报价", "投标截止时间",
-    "投标时间", "报价时间", "项目编号", "企业资质", "项目开始时间",
-    "项目工期", "项目人数", "负责人职务", "负责人资质", "高级职称人员数量", "中级职称人员数量", "低级职称人员数量",
-    "投入设备", "投入资金"
-]
+# PaddleNLP 实体识别相关（只检查是否安装，模型在首次推理时才加载）
+PADDLENLP_AVAILABLE = importlib.util.find_spec("paddlenlp") is not None
+if not PADDLENLP_AVAILABLE:
+    print("[错误] PaddleNLP 未安装，请确保已安装 PaddleNLP 库")
+
 
 # 全量字段（合并所有 schema, 通用）
 ALL_SCHEMA = list(set(BIDDING_SCHEMA + TENDER_SCHEMA))
 
-ie_models = {}
+class UIEModelRegistry:
+    """UIE 模型注册表
 
-# 初始化 PaddleNLP 实体识别器
-if PADDLENLP_AVAILABLE:
-    try:
-        # 为不同文件类型初始化不同的模型
-        ie_models["招标文件"] = Taskflow("information_extraction", 
-                                       schema=BIDDING_SCHEMA, 
-                                       model='uie-medium', 
-                                       schema_lang='zh')
-        
-        tender_full_schema = TENDER_SCHEMA
-        ie_models["投标文件"] = Taskflow("information_extraction", 
-                                       schema=tender_full_schema, 
-                                       model='uie-medium', 
-                                       schema_lang='zh')
-        ie_models["通用"] = Taskflow("information_extraction", 
-                                       schema=ALL_SCHEMA, 
-                                       model='uie-medium', 
-                                       schema_lang='zh')
-        
-        print("PaddleNLP 实体识别器初始化成功")
-    except Exception as e:
-        print(f"[警告] PaddleNLP 初始化失败: {e}")
-        PADDLENLP_AVAILABLE = False
+    首次推理时才加载模型；招标文件/投标文件/通用三种 schema 共用一份权重，
+    每次调用前按需切换 schema。加锁保证切换 schema 与推理之间不被其他线程打断。
+    """
+
+    def __init__(self, model_name=UIE_MODEL_NAME, batch_size=NLP_BATCH_SIZE, max_seq_len=NLP_MAX_SEQ_LEN):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_seq_len = max_seq_len
+        self._model = None
+        self._schema = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return PADDLENLP_AVAILABLE and not self._failed
+
+    def _load(self):
+        from paddlenlp import Taskflow
+
+        print(f"  - 加载 UIE 模型 {self.model_name}...")
+        start = time.time()
+        rss_before = get_rss_mb()
+        self._model = Taskflow("information_extraction",
+                               schema=ALL_SCHEMA,
+                               model=self.model_name,
+                               batch_size=self.batch_size,
+                               max_seq_len=self.max_seq_len,
+                               schema_lang='zh')
+        self._schema = ALL_SCHEMA
+        metrics.set_gauge("uie_model_load_seconds", time.time() - start)
+        rss_after = get_rss_mb()
+        memory = f"，内存增加 {rss_after - rss_before:.0f}MB" if rss_before is not None else ""
+        print(f"PaddleNLP 实体识别器初始化成功，用时 {time.time() - start:.1f}s{memory}")
+
+    def predict(self, texts, schema):
+        """使用指定 schema 对一批文本进行实体识别"""
+        with self._lock:
+            if self._failed:
+                # 加载失败后不再重复尝试（避免每批都重新下载模型）
+                raise RuntimeError(f"UIE 模型 {self.model_name} 加载失败")
+            if self._model is None:
+                try:
+                    self._load()
+                except Exception as e:
+                    print(f"[警告] PaddleNLP 初始化失败: {e}")
+                    self._failed = True
+                    raise
+            if self._schema != schema:
+                self._model.set_schema(schema)
+                self._schema = schema
+            return self._model(texts)
+
+
+ie_registry = UIEModelRegistry()
 
 # 根据文件类型获取对应的 schema
 def get_schema_by_file_type(file_type):
@@ -76,46 +101,79 @@ def get_schema_by_file_type(file_type):
     }
     return schema_mapping.get(file_type, ALL_SCHEMA)
   
-# 使用 PaddleNLP 进行实体识别
-def extract_entities_with_nlp(text, file_type="通用"):
-    if not PADDLENLP_AVAILABLE:
-        return None
-    
-    try:
-        # 选择对应的模型
-        ie_model = ie_models.get(file_type, ie_models.get("通用"))
-        if not ie_model:
-            print(f"[警告] 未找到 {file_type} 对应的模型，使用通用模型")
-            ie_model = ie_models.get("通用")
-        
-        # 预处理文本
-        processed_text = preprocess_text_for_nlp(text)
-        
-        # 获取对应的 schema
-        current_schema = get_schema_by_file_type(file_type)
-        
-        # 执行实体识别
-        result = ie_model(processed_text)
-        
-        if isinstance(result, list):
-            # 如果返回列表，取第一个元素
-            result = result[0] if result else {}
-        elif not isinstance(result, dict):
-            # 如果既不是字典也不是列表，返回空字典
-            result = {}
-        
-        record_dict = {}
-        
+# 使用 PaddleNLP 进行实体识别（单个文档）
+def extract_entities_with_nlp(text, file_type="通用", windows=None):
+    return extract_entities_batch([text], file_type, doc_windows=None if windows is None else [windows])[0]
+
+# 批量实体识别：多个文档切分为重叠窗口，按长度排序后分批推理，再按文档和字段合并
+def extract_entities_batch(texts, file_type="通用", window=NLP_WINDOW_SIZE,
+                           overlap=NLP_WINDOW_OVERLAP, batch_size=NLP_BATCH_SIZE, doc_windows=None):
+    """返回与 texts 顺序一致的结果列表，每个字段保留概率最高的片段
+
+    结果格式与原 extract_entities_with_nlp 一致: {"records": {字段: [{"span", "probability"}]}, "file_type"}
+    doc_windows 为各文档已切好的窗口（读取 PDF 时逐页切分，见 read_pdf），为 None 的文档从 texts 切分
+    """
+    if not ie_registry.available:
+        return [None] * len(texts)
+
+    # 获取对应的 schema
+    current_schema = get_schema_by_file_type(file_type)
+
+    # 预处理并切分窗口（不再截断长文本）
+    doc_windows = doc_windows or [None] * len(texts)
+    windows = []
+    for doc_index, (text, chunks) in enumerate(zip(texts, doc_windows)):
+        if chunks is None:
+            chunks = iter_text_windows([text], window, overlap)
+        windows.extend((doc_index, chunk) for chunk in chunks)
+    # 长度相近的窗口放在同一批，减少 padding
+    windows.sort(key=lambda item: len(item[1]))
+
+    best = [{} for _ in texts]
+    failed = set()
+    began = time.perf_counter()
+    with metrics.stage("uie"):
+        for start in range(0, len(windows), batch_size):
+            batch = windows[start:start + batch_size]
+            try:
+                # 执行实体识别
+                with metrics.timer("uie_batch_seconds", file_type=file_type):
+                    results = ie_registry.predict([chunk for _, chunk in batch], current_schema)
+            except Exception as e:
+                print(f"[错误] NLP 实体识别失败: {e}")
+                if not ie_registry.available:
+                    # 模型无法加载，剩余的批次不再尝试
+                    failed.update(doc_index for doc_index, _ in windows[start:])
+                    break
+                failed.update(doc_index for doc_index, _ in batch)
+                continue
+            for (doc_index, _), result in zip(batch, results):
+                if not isinstance(result, dict):
+                    continue
+                for key in current_schema:
+                    for item in result.get(key, []):
+                        probability = item.get("probability", 0)
+                        current = best[doc_index].get(key)
+                        if current is None or probability > current["probability"]:
+                            best[doc_index][key] = {"span": item["text"], "probability": probability}
+
+    # 多个文档的窗口混合成批推理，单个文档的耗时按平均值记录
+    seconds = time.perf_counter() - began
+    metrics.inc("uie_documents_total", len(texts), file_type=file_type)
+    metrics.inc("uie_windows_total", len(windows), file_type=file_type)
+    for _ in texts:
+        metrics.observe("uie_document_seconds", seconds / len(texts), file_type=file_type)
+
+    outputs = []
+    for doc_index in range(len(texts)):
+        if doc_index in failed and not best[doc_index]:
+            outputs.append(None)
+            continue
         # 格式化结果
-        for key in current_schema:
-            spans = result.get(key, [])
-            # 简单字段保持原有逻辑
-            record_dict[key] = [{"span": item["text"]} for item in spans] if spans else []
-        
-        return {"records": record_dict, "file_type": file_type}
-    except Exception as e:
-        print(f"[错误] NLP 实体识别失败: {e}")
-        return None
+        record_dict = {key: [best[doc_index][key]] if key in best[doc_index] else []
+                       for key in current_schema}
+        outputs.append({"records": record_dict, "file_type": file_type})
+    return outputs
 
 
 # 创建一个和 schema 顺序一致的有序结果
@@ -128,11 +186,29 @@ def create_ordered_result(data, schema):
     
     return ordered_result
 
-# nlp 信息提取
-def extract_info(text, file_type):
+# nlp 信息提取（windows 为已切好的 NLP 窗口，见 read_pdf）
+def extract_info(text, file_type, windows=None):
     # 使用 NLP 方法
-    nlp_result = extract_entities_with_nlp(text, file_type)
-    
+    nlp_result = extract_entities_with_nlp(text, file_type, windows)
+    return build_info_from_nlp(nlp_result, file_type)
+
+# 批量 nlp 信息提取：items 为 [(文本, 文件类型)]，windows 为对应的已切好的窗口列表（可选），
+# 同类型文档合并推理，返回顺序与 items 一致
+def extract_info_batch(items, windows=None):
+    windows = windows or [None] * len(items)
+    infos = [None] * len(items)
+    by_type = {}
+    for index, (_, file_type) in enumerate(items):
+        by_type.setdefault(file_type, []).append(index)
+    for file_type, indexes in by_type.items():
+        nlp_results = extract_entities_batch([items[i][0] for i in indexes], file_type,
+                                             doc_windows=[windows[i] for i in indexes])
+        for index, nlp_result in zip(indexes, nlp_results):
+            infos[index] = build_info_from_nlp(nlp_result, file_type)
+    return infos
+
+# 把 NLP 结果整理为按 schema 排列的字段
+def build_info_from_nlp(nlp_result, file_type):
     # 获取当前文件类型对应的 schema
     current_schema = get_schema_by_file_type(file_type)
     
@@ -177,7 +253,18 @@ def standardize_amounts_in_result(info):
     
     return info
 
-# 判断文件类型
+# 从逐页记录中截取前 limit 个字符作为内容预览，只消费所需的页面
+def take_text_preview(pages, limit=10000):
+    parts = []
+    length = 0
+    for record in pages:
+        parts.append(record["text"])
+        length += record["chars"]
+        if length >= limit:
+            break
+    return "\n".join(parts)[:limit]
+
+# 判断文件类型，text_preview 可以是文本，也可以是 iter_pdf_pages 产出的页面记录
 def determine_file_type(file_name, text_preview=""):
     file_name_lower = file_name.lower()
     
@@ -189,6 +276,8 @@ def determine_file_type(file_name, text_preview=""):
 
     
     # 基于内容判断（如果文件名不明确）
+    if text_preview and not isinstance(text_preview, str):
+        text_preview = take_text_preview(text_preview)
     if text_preview:
         if any(keyword in text_preview[:10000] for keyword in ["招标文件", "招标公告", "采购公告", "最高限价"]):
             return "招标文件"
@@ -210,94 +299,329 @@ def validate_extracted_info(info, file_type):
     
     return len(missing_fields) == 0, missing_fields
   
-# pdf的主处理函数：遍历 PDF 文件夹，提取信息并存入数据库
-def process_pdfs():
-    """处理 PDF 文件的主函数"""
-    # 统计信息
-    stats = {
-        "总文件数": 0,
+# 新建处理统计
+def _new_stats(total):
+    return {
+        "总文件数": total,
         "处理成功": 0,
         "跳过文件": 0,
         "处理失败": 0,
         "字段缺失": 0
     }
-    
-    pdf_files = [f for f in os.listdir(PDF_FOLDER) if f.lower().endswith(".pdf")]
-    stats["总文件数"] = len(pdf_files)
-    
+
+# 打印统计结果
+def _print_stats(stats):
+    print("\n" + "="*50)
+    print("处理完成! 统计结果:")
+    print(f"总文件数: {stats['总文件数']}")
+    print(f"处理成功: {stats['处理成功']}")
+    print(f"跳过文件: {stats['跳过文件']}")
+    print(f"字段缺失: {stats['字段缺失']}")
+    print(f"处理失败: {stats['处理失败']}")
+    print(f"成功率: {stats['处理成功']/max(stats['总文件数']-stats['跳过文件'], 1)*100:.1f}%")
+
+# 写入结束后把写库失败的文档从成功数中扣除
+def _count_write_failures(stats, writer):
+    if writer.failed:
+        stats["处理成功"] -= writer.failed
+        stats["处理失败"] += writer.failed
+
+# 判断文件是否已入库，返回 (是否已入库, 文件哈希)：existing 为 get_existing_bids 的查询结果，
+# 同名文件再比较内容哈希（旧数据没有文件哈希，只按文件名判断）；文件哈希只在这里计算一次，之后传给页面缓存和入库记录
+# folder 为 PDF 所在文件夹（默认 PDF_FOLDER），以参数传入而不是修改模块变量，spawn 方式启动的子进程也能拿到
+def is_stored(file_name, existing, folder=None):
+    hashes = existing.get(file_name)
+    if hashes and None in hashes:
+        return True, None
+    file_hash = hash_file(os.path.join(folder or PDF_FOLDER, file_name))
+    return bool(hashes) and file_hash in hashes, file_hash
+
+# 检查提取出的文本是否足够进行后续处理
+def has_enough_text(file_name, text):
+    if not text or len(text.strip()) < 50:
+        print(f"[警告] {file_name} 提取的文本内容过少，可能是扫描质量问题")
+        return False
+    return True
+
+# 逐页读取 PDF：页面产出时即用于判断文件类型（文件名无法判断时只读取开头几页）和切分 NLP 窗口，
+# 不再先拼接全文再切分；返回 (全文, 文件类型, NLP 窗口列表)，file_hash / folder 见 is_stored
+def stream_pdf(file_name, ocr_workers=None, file_hash=None, folder=None):
+    pages = []
+
+    def recorded(records):
+        for record in records:
+            pages.append(record["text"])
+            yield record
+
+    with metrics.stage("pdf_extract"):
+        stream = recorded(iter_pdf_pages(os.path.join(folder or PDF_FOLDER, file_name), ocr_workers=ocr_workers,
+                                         file_hash=file_hash))
+        file_type = determine_file_type(file_name, stream)
+        # 判断类型时已读取的页面先切分，之后的页面边读边切分
+        windows = list(iter_text_windows(chain(list(pages), (record["text"] for record in stream)),
+                                         NLP_WINDOW_SIZE, NLP_WINDOW_OVERLAP))
+    return clean_text("\n".join(pages)), file_type, windows
+
+# 提取阶段：读取 PDF 文本、判断文件类型并切分 NLP 窗口，文本过少时返回 None
+def read_pdf(file_name, ocr_workers=None, file_hash=None, folder=None):
+    text, file_type, windows = stream_pdf(file_name, ocr_workers, file_hash, folder)
+    if not has_enough_text(file_name, text):
+        return None
+    return text, file_type, windows
+
+# 在子进程中读取 PDF，返回 (stream_pdf 的结果, 子进程中记录的运行指标)，由主进程合并
+def stream_pdf_with_metrics(file_name, ocr_workers=None, file_hash=None, folder=None):
+    return stream_pdf(file_name, ocr_workers, file_hash, folder), metrics.get_metrics().drain()
+
+# 信息提取阶段：提取结构化信息、校验必要字段并补充元数据
+# 返回 (记录, 是否缺失字段)，提取失败时记录为 None；info 已批量提取时直接传入，windows 见 read_pdf，file_hash / folder 见 is_stored
+def build_record(file_name, text, file_type, info=None, windows=None, file_hash=None, folder=None):
+    if info is None:
+        info = extract_info(text, file_type, windows)
+    if not info:
+        print(f"[错误] {file_name} 信息提取失败")
+        return None, False
+
+    # 验证关键字段
+    is_valid, missing_fields = validate_extracted_info(info, file_type)
+    if not is_valid:
+        print(f"[警告] {file_name} 缺少必要字段: {missing_fields}")
+        # 继续处理，但标记为不完整
+        info["数据完整性"] = "不完整"
+        info["缺失字段"] = missing_fields
+    else:
+        info["数据完整性"] = "完整"
+
+    # 补充元数据
+    info.update({
+        "文件名": file_name,
+        "文件哈希": file_hash or hash_file(os.path.join(folder or PDF_FOLDER, file_name)),
+        "原始文本": text,
+        "文件类型": file_type,
+        "提取时间": datetime.now(),
+        "文本长度": len(text),
+    })
+    return info, not is_valid
+
+# 入库后用新文档增量更新已有的语料级模型（模型尚未训练时留给第一次相似度检测在全部文档上训练）和 MinHash-LSH 索引
+def update_corpus_models(texts):
+    if not texts:
+        return
+    if W2V_UPDATE_ON_INGEST:
+        from corpus_models import get_corpus_word2vec
+        corpus_word2vec = get_corpus_word2vec()
+        if corpus_word2vec.fitted:
+            try:
+                corpus_word2vec.update(texts)
+            except Exception as e:
+                print(f"[警告] Word2Vec 增量训练失败: {e}")
+    if LSH_UPDATE_ON_INGEST:
+        from lsh_index import get_lsh_index
+        try:
+            get_lsh_index().update(texts)
+        except Exception as e:
+            print(f"[警告] LSH 索引更新失败: {e}")
+
+# pdf的主处理函数：遍历 PDF 文件夹，提取信息并存入数据库
+def process_pdfs(pipelined=False, folder=None, **pipeline_options):
+    """处理 PDF 文件的主函数
+
+    folder 为 PDF 所在文件夹（默认 PDF_FOLDER）；
+    pipelined=True 时使用流水线模式（见 process_pdfs_pipelined），pipeline_options 透传给它
+    """
+    if pipelined:
+        return process_pdfs_pipelined(folder=folder, **pipeline_options)
+
+    folder = folder or PDF_FOLDER
+    pdf_files = [f for f in os.listdir(folder) if f.lower().endswith(".pdf")]
+    # 统计信息
+    stats = _new_stats(len(pdf_files))
+
+    new_texts = []
+    # 一次查询所有文件是否已入库；写库经过缓冲，按数量或时间批量写入
+    existing = get_existing_bids(pdf_files)
+    writer = BidWriter()
+
     print(f"开始处理 {stats['总文件数']} 个 PDF 文件...")
     
     for i, file_name in enumerate(pdf_files, 1):
         print(f"\n[{i}/{stats['总文件数']}] 处理中: {file_name}")
         
         # 检查是否已存在
-        if bid_exists(file_name):
+        stored, file_hash = is_stored(file_name, existing, folder)
+        if stored:
             print(f"[跳过] {file_name} 已存在于数据库中")
             stats["跳过文件"] += 1
             continue
 
-        file_path = os.path.join(PDF_FOLDER, file_name)
-
         try:
             # 提取文本
             print("  - 提取PDF文本...")
-            text = extract_pdf_text(file_path)
-            
-            if not text or len(text.strip()) < 50:
-                print(f"[警告] {file_name} 提取的文本内容过少，可能是扫描质量问题")
+            extracted = read_pdf(file_name, file_hash=file_hash, folder=folder)
+            if not extracted:
                 stats["处理失败"] += 1
                 continue
-            
-            # 智能判断文件类型
-            file_type = determine_file_type(file_name, text)
+            text, file_type, windows = extracted
             print(f"  - 文件类型: {file_type}")
 
             # 进行信息提取
             print("  - 提取结构化信息... 提取时间可能较长")
-            info = extract_info(text, file_type)
-            
+            info, incomplete = build_record(file_name, text, file_type, windows=windows, file_hash=file_hash,
+                                            folder=folder)
             if not info:
-                print(f"[错误] {file_name} 信息提取失败")
                 stats["处理失败"] += 1
                 continue
-
-            # 验证关键字段
-            is_valid, missing_fields = validate_extracted_info(info, file_type)
-            if not is_valid:
-                print(f"[警告] {file_name} 缺少必要字段: {missing_fields}")
+            if incomplete:
                 stats["字段缺失"] += 1
-                # 继续处理，但标记为不完整
-                info["数据完整性"] = "不完整"
-                info["缺失字段"] = missing_fields
-            else:
-                info["数据完整性"] = "完整"
-
-            # 补充元数据
-            info.update({
-                "文件名": file_name,
-                "原始文本": text,
-                "文件类型": file_type,
-                "提取时间": datetime.now(),
-                "文本长度": len(text),
-            })
-
-            # 写入数据库
+
+            # 写入数据库（缓冲后批量写入）
             print("  - 写入数据库...")
-            insert_bid_data(info)
+            writer.add(info)
             print(f"[完成] 成功处理: {file_name}")
             stats["处理成功"] += 1
+            new_texts.append(text)
 
         except Exception as e:
             print(f"[错误] 处理 {file_name} 时出错: {str(e)}")
             stats["处理失败"] += 1
-            
-    # 打印统计结果
-    print("\n" + "="*50)
-    print("处理完成! 统计结果:")
-    print(f"总文件数: {stats['总文件数']}")
-    print(f"处理成功: {stats['处理成功']}")
-    print(f"跳过文件: {stats['跳过文件']}")
-    print(f"字段缺失: {stats['字段缺失']}")
-    print(f"处理失败: {stats['处理失败']}")
-    print(f"成功率: {stats['处理成功']/max(stats['总文件数']-stats['跳过文件'], 1)*100:.1f}%")
 
+    writer.close()
+    _count_write_failures(stats, writer)
+    update_corpus_models(new_texts)
+    _print_stats(stats)
+    return stats
+
+# 流水线模式：提取 / 信息提取 / 写库 三个阶段并发执行
+def process_pdfs_pipelined(extract_workers=None, nlp_workers=None, db_workers=None, queue_size=None, folder=None):
+    """流水线处理 PDF 文件
+
+    - 提取阶段：extract_workers 个线程，各自把 PDF 交给进程池提取文本（每个文件内部不再并行 OCR）
+    - 信息提取阶段：nlp_workers 个线程执行 UIE 抽取，队列中已就绪的文档合并为一批推理
+    - 写库阶段：db_workers 个线程把记录交给 BidWriter，按数量或时间批量写入 MongoDB
+    阶段之间使用容量为 queue_size 的有界队列，下游处理不过来时上游自动阻塞。
+    folder 为 PDF 所在文件夹（默认 PDF_FOLDER），随任务传给提取进程。
+    """
+    extract_workers = extract_workers or PIPELINE_EXTRACT_WORKERS
+    nlp_workers = nlp_workers or PIPELINE_NLP_WORKERS
+    db_workers = db_workers or PIPELINE_DB_WORKERS
+    queue_size = queue_size or PIPELINE_QUEUE_SIZE
+    folder = folder or PDF_FOLDER
+
+    pdf_files = [f for f in os.listdir(folder) if f.lower().endswith(".pdf")]
+    stats = _new_stats(len(pdf_files))
+    stats_lock = threading.Lock()
+    new_texts = []
+    writer = BidWriter()
+
+    def count(key):
+        with stats_lock:
+            stats[key] += 1
+
+    print(f"开始流水线处理 {stats['总文件数']} 个 PDF 文件... "
+          f"(提取 {extract_workers} / 信息提取 {nlp_workers} / 写库 {db_workers})")
+
+    file_queue = queue.Queue(maxsize=queue_size)
+    text_queue = queue.Queue(maxsize=queue_size)
+    record_queue = queue.Queue(maxsize=queue_size)
+    done = object()  # 结束标记
+
+    def run_stage(worker, in_queue, workers, out_queue=None, out_workers=0, batch=1):
+        """启动一个阶段的线程；全部线程结束后向下游发送结束标记
+
+        batch > 1 时每次从队列中取出已就绪的最多 batch 项，一起交给 worker（参数为列表）
+        """
+        def loop():
+            finished = False
+            while not finished:
+                item = in_queue.get()
+                if item is done:
+                    break
+                items = [item]
+                while len(items) < batch:
+                    try:
+                        item = in_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is done:
+                        finished = True
+                        break
+                    items.append(item)
+                try:
+                    results = worker(items) if batch > 1 else [worker(*items[0])]
+                except Exception as e:
+                    for failed_item in items:
+                        print(f"[错误] 处理 {failed_item[0]} 时出错: {str(e)}")
+                        count("处理失败")
+                    continue
+                for result in results:
+                    if result is not None and out_queue is not None:
+                        out_queue.put(result)
+
+        threads = [threading.Thread(target=loop, daemon=True) for _ in range(workers)]
+        for t in threads:
+            t.start()
+
+        def finish():
+            for t in threads:
+                t.join()
+            for _ in range(out_workers):
+                out_queue.put(done)
+
+        closer = threading.Thread(target=finish, daemon=True)
+        closer.start()
+        return closer
+
+    with ProcessPoolExecutor(max_workers=extract_workers, initializer=metrics.reset) as pool:
+        def extract(file_name, file_hash):
+            print(f"[提取] {file_name}")
+            (text, file_type, windows), worker_metrics = pool.submit(stream_pdf_with_metrics, file_name, 1,
+                                                                     file_hash, folder).result()
+            metrics.get_metrics().merge(worker_metrics)
+            if not has_enough_text(file_name, text):
+                count("处理失败")
+                return None
+            return file_name, text, file_type, windows, file_hash
+
+        def extract_fields(items):
+            print(f"[信息提取] {', '.join(item[0] for item in items)}")
+            infos = extract_info_batch([(text, file_type) for _, text, file_type, _, _ in items],
+                                       [windows for _, _, _, windows, _ in items])
+            results = []
+            for (file_name, text, file_type, _, file_hash), info in zip(items, infos):
+                record, incomplete = build_record(file_name, text, file_type, info, file_hash=file_hash, folder=folder)
+                if not record:
+                    count("处理失败")
+                    continue
+                if incomplete:
+                    count("字段缺失")
+                results.append((file_name, record))
+            return results
+
+        def write(file_name, info):
+            writer.add(info)
+            print(f"[完成] 成功处理: {file_name}")
+            count("处理成功")
+            with stats_lock:
+                new_texts.append(info["原始文本"])
+
+        run_stage(extract, file_queue, extract_workers, text_queue, nlp_workers)
+        run_stage(extract_fields, text_queue, nlp_workers, record_queue, db_workers, batch=PIPELINE_NLP_BATCH_DOCS)
+        last = run_stage(write, record_queue, db_workers)
+
+        existing = get_existing_bids(pdf_files)
+        for file_name in pdf_files:
+            stored, file_hash = is_stored(file_name, existing, folder)
+            if stored:
+                print(f"[跳过] {file_name} 已存在于数据库中")
+                count("跳过文件")
+                continue
+            file_queue.put((file_name, file_hash))
+        for _ in range(extract_workers):
+            file_queue.put(done)
+        last.join()
+    writer.close()
+    _count_write_failures(stats, writer)
+
+    update_corpus_models(new_texts)
+    _print_stats(stats)
+    return stats
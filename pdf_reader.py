@@ -1,24 +1,330 @@
+import atexit
+import gc
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import pdfplumber
+import pytesseract
 from pdf2image import convert_from_path
 from pytesseract import image_to_string
-from utils import clean_text, clean_ocr_text
-from config import POPPLER_PATH
-
-def extract_pdf_text(file_path):
-    text = ""
-    with pdfplumber.open(file_path) as pdf:
-        for i, page in enumerate(pdf.pages):
-            page_text = page.extract_text()
-            if page_text and len(page_text.strip()) > 10:
-                # 直接提取文本型页面内容
-                print(f"第{i+1}页：使用文本提取")
-                text += page_text + "\n"
+from utils import clean_text, clean_ocr_text, get_rss_mb
+from config import (
+    get_ocr_tools, OCR_DPI, OCR_LANG, OCR_WORKERS, OCR_PAGE_TIMEOUT, OCR_BATCH_PAGES,
+    PAGE_CACHE_ENABLED, PDF_MAX_RSS_MB,
+)
+from page_cache import get_page_cache, hash_file, page_fingerprint
+import metrics
+
+# 扫描页 OCR 进程池（按需创建，多个文件之间复用）
+_ocr_pool = None
+_ocr_pool_workers = 0
+
+
+def _init_ocr_worker(tesseract_cmd):
+    """子进程初始化：沿用主进程检测到的 tesseract 路径"""
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _get_ocr_pool(workers):
+    """获取（必要时创建）OCR 进程池"""
+    global _ocr_pool, _ocr_pool_workers
+    if _ocr_pool is None or _ocr_pool_workers != workers:
+        shutdown_ocr_pool()
+        _ocr_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_ocr_worker,
+            initargs=(get_ocr_tools()[1],),
+        )
+        _ocr_pool_workers = workers
+    return _ocr_pool
+
+
+def shutdown_ocr_pool():
+    """关闭 OCR 进程池"""
+    global _ocr_pool, _ocr_pool_workers
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(wait=True, cancel_futures=True)
+        _ocr_pool = None
+        _ocr_pool_workers = 0
+
+
+atexit.register(shutdown_ocr_pool)
+
+
+def is_text_page(page_text):
+    """判断页面是否有可用的文本层"""
+    return bool(page_text) and len(page_text.strip()) > 10
+
+
+def find_page_runs(page_numbers, max_run=OCR_BATCH_PAGES):
+    """把页码分组为连续页段，每段最多 max_run 页"""
+    runs = []
+    for page_number in sorted(page_numbers):
+        if runs and page_number == runs[-1][-1] + 1 and len(runs[-1]) < max_run:
+            runs[-1].append(page_number)
+        else:
+            runs.append([page_number])
+    return runs
+
+
+def rasterize_run(file_path, run, dpi=OCR_DPI, timeout=OCR_PAGE_TIMEOUT):
+    """一次 poppler 调用把一段连续页面转为临时目录中的图片
+
+    返回 (临时目录, 按页码排列的图片路径列表)，临时目录由调用方负责删除
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="pdf_ocr_")
+    start = time.perf_counter()
+    try:
+        paths = convert_from_path(file_path, dpi=dpi, first_page=run[0], last_page=run[-1],
+                                  poppler_path=get_ocr_tools()[0], output_folder=tmp_dir,
+                                  paths_only=True, fmt="png",
+                                  timeout=(timeout * len(run)) or None)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    # 一次调用转换整段，按页平均记入指标
+    metrics.observe("pdf_rasterize_page_seconds", (time.perf_counter() - start) / len(run))
+    return tmp_dir, paths
+
+
+def iter_scanned_pages(file_path, page_numbers, dpi=OCR_DPI, batch_pages=OCR_BATCH_PAGES,
+                       timeout=OCR_PAGE_TIMEOUT):
+    """按连续页段批量转图片，逐页产出 (页码, 图片路径)
+
+    每段图片只在磁盘上保留到该段被消费完，转换失败的页面产出 (页码, None)
+    """
+    for run in find_page_runs(page_numbers, batch_pages):
+        try:
+            tmp_dir, paths = rasterize_run(file_path, run, dpi, timeout)
+        except Exception as e:
+            print(f"[警告] 第{run[0]}-{run[-1]}页转换图片失败: {e}")
+            for page_number in run:
+                yield page_number, None
+            continue
+        try:
+            for page_number, path in zip(run, paths):
+                yield page_number, path
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def ocr_image(image_path, lang=OCR_LANG, timeout=OCR_PAGE_TIMEOUT):
+    """对单张页面图片进行 OCR，返回清理后的文本（可在子进程中执行）"""
+    ocr_text = image_to_string(image_path, lang=lang, timeout=timeout)
+    return clean_ocr_text(ocr_text)
+
+
+def timed_ocr_image(image_path, lang=OCR_LANG, timeout=OCR_PAGE_TIMEOUT):
+    """OCR 并返回 (文本, 识别耗时秒数)，耗时在执行识别的进程内测量，不含排队等待"""
+    start = time.perf_counter()
+    text = ocr_image(image_path, lang, timeout)
+    return text, time.perf_counter() - start
+
+
+def _enforce_rss_limit(pdf, max_rss_mb):
+    """超过内存上限时先释放 pdfplumber/pdfminer 缓存，仍超限则抛出 MemoryError"""
+    if not max_rss_mb:
+        return
+    rss = get_rss_mb()
+    if rss is None or rss <= max_rss_mb:
+        return
+    pdf.flush_cache()
+    cached_objs = getattr(pdf.doc, "_cached_objs", None)
+    if cached_objs is not None:
+        cached_objs.clear()
+    gc.collect()
+    rss = get_rss_mb()
+    if rss > max_rss_mb:
+        raise MemoryError(f"内存占用 {rss:.0f}MB 超过上限 {max_rss_mb}MB")
+
+
+def _page_record(page_number, text, method, cached=False, seconds=None):
+    return {"page": page_number, "text": text, "method": method, "chars": len(text), "cached": cached,
+            "seconds": seconds}
+
+
+def iter_pdf_pages(file_path, ocr_workers=None, page_timeout=None, use_cache=PAGE_CACHE_ENABLED,
+                   max_rss_mb=PDF_MAX_RSS_MB, file_hash=None):
+    """按页码顺序逐页产出页面记录，适合超大 PDF
+
+    记录格式: {"page": 页码, "text": 文本, "method": "text"/"ocr"/"failed", "chars": 字数, "cached": 是否来自缓存,
+              "seconds": 文本提取或 OCR 识别耗时（来自缓存或失败时为 None）}
+    每页的提取方式和耗时同时记入运行指标（pdf_pages_total / pdf_page_seconds，OCR 页另记 ocr_page_seconds）
+    并产生一条 pdf_page 事件。
+    每页处理完立即释放 pdfplumber 的页面缓存；扫描页按连续页段批量转图片，
+    ocr_workers > 1 时并行识别，同时在途的页段最多两段。
+    max_rss_mb 为进程内存上限（需要 psutil），超限且释放缓存后仍超限时抛出 MemoryError。
+    file_hash 为调用方已计算的文件哈希（见 page_cache.hash_file），给出时页面缓存不再重新读取整个文件计算。
+    """
+    for record in _iter_pdf_pages(file_path, ocr_workers, page_timeout, use_cache, max_rss_mb, file_hash):
+        metrics.inc("pdf_pages_total", method=record["method"], cached=str(record["cached"]).lower())
+        if record["seconds"] is not None:
+            metrics.observe("pdf_page_seconds", record["seconds"], method=record["method"])
+            if record["method"] == "ocr":
+                metrics.observe("ocr_page_seconds", record["seconds"])
+        metrics.event("pdf_page", file=os.path.basename(file_path), page=record["page"], method=record["method"],
+                      cached=record["cached"], chars=record["chars"], seconds=record["seconds"])
+        yield record
+
+
+def _iter_pdf_pages(file_path, ocr_workers, page_timeout, use_cache, max_rss_mb, file_hash=None):
+    ocr_workers = OCR_WORKERS if ocr_workers is None else ocr_workers
+    page_timeout = OCR_PAGE_TIMEOUT if page_timeout is None else page_timeout
+    cache = get_page_cache() if use_cache else None
+
+    if cache:
+        file_hash = file_hash or hash_file(file_path)
+        cached_pages = cache.get_file(file_hash)
+        if cached_pages is not None:
+            print(f"[缓存] 命中文件缓存，共{len(cached_pages)}页")
+            for page_number, (_, text, method) in enumerate(cached_pages, 1):
+                yield _page_record(page_number, text, method, cached=True)
+            return
+
+    parallel = ocr_workers > 1
+    buffer = deque()  # 按页码排列、尚未产出的页面
+    run = []  # 当前连续扫描页段
+    run_dirs = {}  # 在途页段的临时目录 -> 未产出页数
+    page_hashes = []
+    seen_scanned = set()
+    all_ok = True
+
+    def dispatch_run():
+        """转换并提交当前页段"""
+        if not run:
+            return
+        if not parallel:
+            get_ocr_tools()  # 设置 tesseract 路径（只有遇到扫描页时才需要探测）
+            for page_number, path in iter_scanned_pages(file_path, [e["page"] for e in run], timeout=page_timeout):
+                entry = next(e for e in run if e["page"] == page_number)
+                if path is None:
+                    continue
+                try:
+                    text, seconds = timed_ocr_image(path, timeout=page_timeout)
+                    entry["record"] = _page_record(page_number, text, "ocr", seconds=seconds)
+                except Exception as e:
+                    print(f"[警告] 第{page_number}页 OCR 失败: {e}")
+            for entry in run:
+                entry.setdefault("record", _page_record(entry["page"], "", "failed"))
+        else:
+            try:
+                tmp_dir, paths = rasterize_run(file_path, [e["page"] for e in run], timeout=page_timeout)
+            except Exception as e:
+                print(f"[警告] 第{run[0]['page']}-{run[-1]['page']}页转换图片失败: {e}")
+                for entry in run:
+                    entry["record"] = _page_record(entry["page"], "", "failed")
             else:
-                # 使用 OCR 提取扫描页内容
-                print(f"第{i+1}页: 使用OCR识别")
-                images = convert_from_path(file_path, dpi=300, first_page=i+1, last_page=i+1, poppler_path=POPPLER_PATH)
-                if images:
-                    ocr_text = image_to_string(images[0], lang="chi_sim")
-                    cleaned_ocr = clean_ocr_text(ocr_text)
-                    text += cleaned_ocr + "\n"
-    return clean_text(text)
\ No newline at end of file
+                run_dirs[tmp_dir] = len(run)
+                pool = _get_ocr_pool(ocr_workers)
+                for entry, path in zip(run, paths):
+                    entry["future"] = pool.submit(timed_ocr_image, path, OCR_LANG, page_timeout)
+                    entry["tmp_dir"] = tmp_dir
+        run.clear()
+
+    def resolve(entry):
+        """取得页面记录（必要时等待 OCR 结果），并写入缓存"""
+        if "future" in entry:
+            try:
+                text, seconds = entry["future"].result()
+                entry["record"] = _page_record(entry["page"], text, "ocr", seconds=seconds)
+            except Exception as e:
+                print(f"[警告] 第{entry['page']}页 OCR 失败: {e}")
+                entry["record"] = _page_record(entry["page"], "", "failed")
+            tmp_dir = entry["tmp_dir"]
+            run_dirs[tmp_dir] -= 1
+            if not run_dirs[tmp_dir]:
+                del run_dirs[tmp_dir]
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        elif "dup_of" in entry:
+            # 同一文件中此前出现过的扫描页，前一页已按顺序产出并写入缓存
+            cached = cache.get_page(entry["dup_of"])
+            text, method = cached if cached else ("", "failed")
+            entry["record"] = _page_record(entry["page"], text, method, cached=bool(cached))
+        record = entry["record"]
+        if cache and record["method"] == "ocr" and not record["cached"]:
+            cache.put_page(entry["hash"], record["text"], "ocr")
+        return record
+
+    def is_ready(entry):
+        return "record" in entry or "dup_of" in entry or ("future" in entry and entry["future"].done())
+
+    def drain(block=False):
+        """按顺序产出队首已就绪的页面；在途页段或缓冲页过多时等待队首的 OCR 结果"""
+        while buffer:
+            head = buffer[0]
+            if not is_ready(head):
+                must_wait = block or len(run_dirs) > 1 or len(buffer) > 4 * OCR_BATCH_PAGES
+                if "future" not in head or not must_wait:
+                    break
+            yield resolve(buffer.popleft())
+
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            for i, page in enumerate(pdf.pages):
+                page_number = i + 1
+                entry = {"page": page_number}
+                if cache:
+                    entry["hash"] = page_fingerprint(page)
+                    page_hashes.append(entry["hash"])
+                    cached = cache.get_page(entry["hash"])
+                    if cached is not None:
+                        print(f"第{page_number}页：使用缓存（{cached[1]}）")
+                        entry["record"] = _page_record(page_number, cached[0], cached[1], cached=True)
+                if "record" not in entry:
+                    start = time.perf_counter()
+                    page_text = page.extract_text()
+                    seconds = time.perf_counter() - start
+                    if is_text_page(page_text):
+                        # 直接提取文本型页面内容
+                        print(f"第{page_number}页：使用文本提取")
+                        entry["record"] = _page_record(page_number, page_text, "text", seconds=seconds)
+                        if cache:
+                            cache.put_page(entry["hash"], page_text, "text")
+                    elif cache and entry["hash"] in seen_scanned:
+                        print(f"第{page_number}页：与前面的扫描页相同，复用识别结果")
+                        entry["dup_of"] = entry["hash"]
+                    else:
+                        print(f"第{page_number}页: 使用OCR识别")
+                        if cache:
+                            seen_scanned.add(entry["hash"])
+                        run.append(entry)
+
+                # 释放该页的布局缓存
+                getattr(page, "close", page.flush_cache)()
+                if run and (run[-1] is not entry or len(run) >= OCR_BATCH_PAGES):
+                    dispatch_run()
+                buffer.append(entry)
+                _enforce_rss_limit(pdf, max_rss_mb)
+                for record in drain():
+                    all_ok = all_ok and record["method"] != "failed"
+                    yield record
+
+            dispatch_run()
+            for record in drain(block=True):
+                all_ok = all_ok and record["method"] != "failed"
+                yield record
+    finally:
+        # 调用方提前停止迭代时清理在途页段的临时图片
+        for tmp_dir in run_dirs:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if cache and all_ok:
+        # 所有页面都成功提取时才记录整文件缓存，避免把失败页固化下来
+        cache.put_file(file_hash, page_hashes)
+
+
+def extract_pdf_text(file_path, ocr_workers=None, page_timeout=None, use_cache=PAGE_CACHE_ENABLED):
+    """提取 PDF 全文
+
+    文本型页面在主进程内直接提取；扫描页按连续页段批量转图片后识别，
+    ocr_workers > 1 时提交到进程池并行识别，结果仍按页码顺序拼接。
+    单页超时或识别失败时该页记为空文本。
+    use_cache 时按文件哈希/页面哈希读写页面文本缓存，相同内容的页面只识别一次。
+    """
+    pages = iter_pdf_pages(file_path, ocr_workers, page_timeout, use_cache)
+    return clean_text("\n".join(record["text"] for record in pages))
@@ -0,0 +1,137 @@
+# 按项目分组（blocking）：串标/抄袭只需在同一项目的投标文件之间比较
+import re
+import unicodedata
+
+import Levenshtein
+
+from config import BLOCKING_NAME_SIMILARITY, BLOCKING_TEXT_HEAD_CHARS, BLOCKING_HEAD_NUMBER_MIN_LENGTH
+
+# 项目名称末尾常见的、不区分项目的后缀
+_NAME_SUFFIXES = ("投标文件", "招标文件", "招标公告", "采购公告", "采购项目", "招标项目", "项目")
+
+
+def _nfkc(value):
+    """全角转半角、统一兼容字符"""
+    return unicodedata.normalize("NFKC", str(value))
+
+
+def normalize_project_number(value):
+    """项目编号规范化：全角转半角、去掉空白和分隔符、字母转大写"""
+    if not value:
+        return None
+    number = re.sub(r"[^0-9A-Za-z]", "", _nfkc(value)).upper()
+    return number if len(number) >= 4 else None  # 太短的编号区分度不够
+
+
+def normalize_project_name(value):
+    """项目名称规范化：全角转半角、去掉空白和标点、去掉括号中的次数说明和"项目"等后缀"""
+    if not value:
+        return None
+    name = _nfkc(value)
+    name = re.sub(r"[(\[（【][^)\]）】]*(?:次|包|标段)[)\]）】]", "", name)
+    name = re.sub(r"[\s\W_]+", "", name)
+    for suffix in _NAME_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name or None
+
+
+def _number_pattern(forms):
+    """在正文中查找项目编号的正则：编号的原始写法或规范化写法，前后不能紧接字母或数字（避免日期、电话号码拼出编号）"""
+    alternatives = sorted(forms, key=len, reverse=True)
+    body = "|".join(re.escape(form).replace(r"\ ", r"\s*") for form in alternatives)
+    return re.compile(rf"(?<![0-9A-Z])(?:{body})(?![0-9A-Z])")
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def block_documents(docs, texts=None, name_similarity=BLOCKING_NAME_SIMILARITY,
+                    text_head_chars=BLOCKING_TEXT_HEAD_CHARS, head_number_min_length=BLOCKING_HEAD_NUMBER_MIN_LENGTH):
+    """按项目把文档分组，返回 (block_ids, unblocked)
+
+    texts 为与 docs 对应的原始文本（不给出时使用文档中的 "原始文本" 字段）。
+    block_ids[i] 为第 i 个文档所在分组的编号（无法分组时为 None），unblocked 为无法分组的文档下标。
+    分组规则依次为：
+    1. 项目编号（规范化后）相同，或项目名称（规范化后）相同的文档属于同一组；
+    2. 规范化项目名称的编辑距离相似度不低于 name_similarity 的组合并（模糊匹配）；
+    3. 两个字段都缺失的文档，在正文开头 text_head_chars 个字符中查找已知的项目编号或项目名称；
+       编号按原始写法或规范化写法完整匹配（前后不能紧接字母或数字），规范化后短于 head_number_min_length 的编号不参与。
+    """
+    numbers = [normalize_project_number(doc.get("项目编号")) for doc in docs]
+    names = [normalize_project_name(doc.get("项目名称")) for doc in docs]
+    union = _UnionFind(len(docs))
+
+    first_by_key = {}
+    for index, (number, name) in enumerate(zip(numbers, names)):
+        for key in (("number", number), ("name", name)):
+            if key[1] is None:
+                continue
+            if key in first_by_key:
+                union.union(first_by_key[key], index)
+            else:
+                first_by_key[key] = index
+
+    # 模糊匹配项目名称（只在不同名称之间比较一次）
+    distinct_names = sorted({name for name in names if name})
+    if name_similarity is not None and name_similarity < 1:
+        for a in range(len(distinct_names)):
+            for b in range(a + 1, len(distinct_names)):
+                if Levenshtein.ratio(distinct_names[a], distinct_names[b]) >= name_similarity:
+                    union.union(first_by_key[("name", distinct_names[a])],
+                                first_by_key[("name", distinct_names[b])])
+
+    # 字段缺失的文档：在正文开头查找已知的项目编号 / 项目名称
+    number_forms = set()  # 正文中可能出现的编号写法（大写），规范化后即为已知编号
+    for number, doc in zip(numbers, docs):
+        if number and len(number) >= head_number_min_length:
+            number_forms.add(number)
+            number_forms.add(re.sub(r"\s+", " ", _nfkc(doc.get("项目编号"))).strip().upper())
+    number_pattern = _number_pattern(number_forms) if number_forms else None
+    known_names = sorted(distinct_names, key=len, reverse=True)
+    keyed = [number is not None or name is not None for number, name in zip(numbers, names)]
+    for index, doc in enumerate(docs):
+        if keyed[index]:
+            continue
+        text = texts[index] if texts is not None else doc.get("原始文本")
+        head = _nfkc(text or "")[:text_head_chars]
+        head_name = re.sub(r"[\s\W_]+", "", head)
+        match = None
+        if number_pattern is not None:
+            found = number_pattern.search(head.upper())
+            if found:
+                match = ("number", normalize_project_number(found.group(0)))
+        if match is None:
+            match = next((("name", name) for name in known_names if len(name) >= 4 and name in head_name), None)
+        if match is not None:
+            union.union(first_by_key[match], index)
+            keyed[index] = True
+
+    block_ids = [union.find(index) if keyed[index] else None for index in range(len(docs))]
+    unblocked = [index for index, block_id in enumerate(block_ids) if block_id is None]
+    return block_ids, unblocked
+
+
+def pairs_within_blocks(block_ids):
+    """只在同一分组内生成文档对 (i, j)，i < j，按 (i, j) 排序"""
+    members = {}
+    for index, block_id in enumerate(block_ids):
+        if block_id is not None:
+            members.setdefault(block_id, []).append(index)
+    pairs = [(group[a], group[b]) for group in members.values()
+             for a in range(len(group)) for b in range(a + 1, len(group))]
+    return sorted(pairs)
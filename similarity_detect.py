@@ -1,14 +1,25 @@
-import jieba
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+# jieba / sklearn / gensim / sentence_transformers 较重，在用到的函数内才导入
 import numpy as np
-from gensim.models import Word2Vec
 from difflib import SequenceMatcher
 import Levenshtein
-from sentence_transformers import SentenceTransformer
-import torch
 import os
+import threading
+import time
 import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from corpus_models import get_embedding_store, get_corpus_tfidf, get_corpus_word2vec
+from doc_artifacts import ARTIFACT_VERSION, get_artifact_store, jaccard_sorted, hash_char_ngrams
+from lsh_index import get_lsh_index
+from passage_finder import find_shared_passages, passage_coverage
+from project_blocking import block_documents, pairs_within_blocks
+from vector_index import get_vector_index
+from config import (
+    ARTIFACT_NGRAM_N, ARTIFACT_SHINGLE_K, PASSAGE_REPORT_LIMIT, SIMILARITY_WORKERS, SIMILARITY_CHUNK_PAIRS,
+    SIMILARITY_METHOD_TIMEOUT, PAIR_SCORE_STORE_ENABLED, VECTOR_INDEX_KIND,
+)
+from utils import text_hash
+import metrics
 
 # 禁用特定警告
 warnings.filterwarnings("ignore", category=UserWarning, module="huggingface_hub")
@@ -19,10 +30,21 @@ os.environ['HF_HUB_DISABLE_SYMLINKS_WARNING'] = '1'
 
 
 def tfidf_similarity(text1, text2):
-    """使用TF-IDF向量计算余弦相似度"""
-    # 中文分词
-    words1 = ' '.join(jieba.cut(text1))
-    words2 = ' '.join(jieba.cut(text2))
+    """使用TF-IDF向量计算余弦相似度
+
+    已在语料上拟合（见 AdvancedSimilarityDetector.prepare_corpus）时使用语料级 IDF，否则只用这两个文档拟合
+    """
+    corpus_tfidf = get_corpus_tfidf()
+    if corpus_tfidf.fitted:
+        return corpus_tfidf.similarity(text1, text2)
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    # 中文分词（来自文档预处理缓存）
+    artifacts1, artifacts2 = get_artifact_store().get_many([text1, text2])
+    words1 = artifacts1.tokens_text
+    words2 = artifacts2.tokens_text
     
     vectorizer = TfidfVectorizer()
     tfidf_matrix = vectorizer.fit_transform([words1, words2])
@@ -30,9 +52,20 @@ def tfidf_similarity(text1, text2):
     return similarity
 
 def word2vec_similarity(text1, text2):
-    """使用Word2Vec计算语义相似度"""
-    sentences1 = [list(jieba.cut(text1))]
-    sentences2 = [list(jieba.cut(text2))]
+    """使用Word2Vec计算语义相似度
+
+    已有语料级模型（见 corpus_models.CorpusWord2Vec）时直接比较缓存的文档向量，否则只用这两个文档训练
+    """
+    corpus_word2vec = get_corpus_word2vec()
+    if corpus_word2vec.fitted:
+        return corpus_word2vec.similarity(text1, text2)
+
+    from gensim.models import Word2Vec
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    artifacts1, artifacts2 = get_artifact_store().get_many([text1, text2])
+    sentences1 = [artifacts1.tokens]
+    sentences2 = [artifacts2.tokens]
     
     # 训练或加载预训练模型
     model = Word2Vec(sentences1 + sentences2, vector_size=100, window=5, min_count=1)
@@ -63,73 +96,44 @@ def jaro_winkler_similarity(text1, text2):
     """Jaro-Winkler相似度"""
     return Levenshtein.jaro_winkler(text1, text2)
   
-def ngram_similarity(text1, text2, n=3):
-    """N-gram相似度检测"""
-    def get_ngrams(text, n):
-        return set([text[i:i+n] for i in range(len(text)-n+1)])
-    
-    ngrams1 = get_ngrams(text1, n)
-    ngrams2 = get_ngrams(text2, n)
-    
-    intersection = len(ngrams1.intersection(ngrams2))
-    union = len(ngrams1.union(ngrams2))
-    
-    return intersection / union if union > 0 else 0
+def ngram_similarity(text1, text2, n=ARTIFACT_NGRAM_N):
+    """N-gram相似度检测（n-gram 集合以排序后的 64 位哈希数组缓存，求交集用 np.intersect1d）"""
+    if n == ARTIFACT_NGRAM_N:
+        artifacts1, artifacts2 = get_artifact_store().get_many([text1, text2])
+        return jaccard_sorted(artifacts1.ngrams, artifacts2.ngrams)
+    return jaccard_sorted(hash_char_ngrams(text1, n), hash_char_ngrams(text2, n))
 
-def shingling_similarity(text1, text2, k=5):
-    """Shingling算法"""
-    def get_shingles(text, k):
-        return set([text[i:i+k] for i in range(len(text)-k+1)])
-    
-    shingles1 = get_shingles(text1, k)
-    shingles2 = get_shingles(text2, k)
-    
-    jaccard = len(shingles1.intersection(shingles2)) / len(shingles1.union(shingles2))
-    return jaccard
+def shingling_similarity(text1, text2, k=ARTIFACT_SHINGLE_K):
+    """Shingling算法（shingle 集合以排序后的 64 位哈希数组缓存）"""
+    if k == ARTIFACT_SHINGLE_K:
+        artifacts1, artifacts2 = get_artifact_store().get_many([text1, text2])
+        return jaccard_sorted(artifacts1.shingles, artifacts2.shingles)
+    return jaccard_sorted(hash_char_ngrams(text1, k), hash_char_ngrams(text2, k))
   
   
   
   # 使用BERT等预训练模型
 
 def bert_similarity(text1, text2):
-    """使用BERT计算语义相似度"""
-    model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-    
-    embeddings = model.encode([text1, text2])
-    similarity = torch.nn.functional.cosine_similarity(
-        torch.tensor(embeddings[0]).unsqueeze(0),
-        torch.tensor(embeddings[1]).unsqueeze(0)
-    )
-    return similarity.item()
+    """使用BERT计算语义相似度（文档向量只编码一次并持久化，见 corpus_models.EmbeddingStore）"""
+    return get_embedding_store().similarity(text1, text2)
   
 def structure_similarity(text1, text2):
-    """基于文档结构的相似度"""
-    import re
-    
-    # 提取结构特征
-    def extract_structure(text):
-        features = {
-            'paragraphs': len(text.split('\n\n')),
-            'sentences': len(re.split(r'[。！？]', text)),
-            'numbers': len(re.findall(r'\d+', text)),
-            'punctuation': len(re.findall(r'[，。；：！？]', text))
-        }
-        return features
-    
-    struct1 = extract_structure(text1)
-    struct2 = extract_structure(text2)
-    
+    """基于文档结构的相似度（段落数、句子数、数字个数、标点个数，特征向量来自文档预处理缓存）"""
+    artifacts1, artifacts2 = get_artifact_store().get_many([text1, text2])
+    struct1, struct2 = artifacts1.structure, artifacts2.structure
+
     # 计算结构相似度
-    similarities = []
-    for key in struct1:
-        if struct1[key] + struct2[key] > 0:
-            sim = 1 - abs(struct1[key] - struct2[key]) / (struct1[key] + struct2[key])
-            similarities.append(sim)
-    
-    return np.mean(similarities) if similarities else 0
+    total = struct1 + struct2
+    present = total > 0
+    if not present.any():
+        return 0
+    return float(np.mean(1 - np.abs(struct1 - struct2)[present] / total[present]))
   
   
-from db_manager import get_unique_data, get_tender_files
+from db_manager import (
+    get_unique_data, get_tender_files, get_pair_scores, save_pair_scores, pair_score_key, load_texts,
+)
 
 
 class AdvancedSimilarityDetector:
@@ -157,100 +161,375 @@ class AdvancedSimilarityDetector:
             'bert': 0.15,
             'structure': 0.05
         }
+
+        # 各方法得分的取值范围（余弦类方法可能为负），cascade 模式据此估计加权得分的上下界
+        self.score_ranges = {
+            'word2vec': (-1, 1),
+            'bert': (-1, 1),
+        }
+
+        # 各方法单次计算耗时（秒）的初始估计，运行中按实测值更新；向量/哈希已缓存的方法很快，全文编辑距离类方法很慢
+        self.method_costs = {
+            'structure': 1e-4,
+            'ngram': 1e-3,
+            'shingling': 1e-3,
+            'tfidf': 1e-3,
+            'bert': 1e-3,
+            'word2vec': 1e-3,
+            'jaro_winkler': 0.05,
+            'levenshtein': 0.5,
+            'sequence': 2.0,
+        }
     
     def _get_current_time(self):
       """获取当前时间"""
       from datetime import datetime
       return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
   
-    def comprehensive_similarity(self, text1, text2, methods=['tfidf', 'word2vec','levenshtein', 'sequence', 'jaro_winkler', 'ngram', 'shingling', 'bert', 'structure']):
-        """综合多种方法计算相似度"""
+    def comprehensive_similarity(self, text1, text2, methods=['tfidf', 'word2vec','levenshtein', 'sequence', 'jaro_winkler', 'ngram', 'shingling', 'bert', 'structure'],
+                                 threshold=0.7, cascade=False, known_scores=None):
+        """综合多种方法计算相似度
+
+        cascade=True 时按实测耗时从低到高依次计算，每算完一种方法就更新加权得分的上下界
+        （未计算的方法按取值范围 score_ranges 取最小/最大值），一旦能确定得分不会超过 threshold 就停止，
+        剩下的方法记入 skipped_methods，overall_similarity 取上界（与 threshold 的比较结果不变）。
+        已经确定超过 threshold 的文档对仍会算完全部方法，得分、风险等级和排序使用真实得分。
+        score_bounds 为 (下界, 上界)，没有跳过方法时两者都等于 overall_similarity；
+        known_scores 为已保存的各方法得分 {方法: 得分}（见 score_pairs），直接使用而不重新计算
+        """
+        known_scores = known_scores or {}
+        methods = [method for method in methods if method in self.methods]
+        if cascade:
+            methods.sort(key=lambda method: (method not in known_scores, self.method_costs.get(method, 0)))
+        remaining_min = sum(self.weights.get(method, 0.2) * self.score_ranges.get(method, (0, 1))[0]
+                            for method in methods)
+        remaining_max = sum(self.weights.get(method, 0.2) * self.score_ranges.get(method, (0, 1))[1]
+                            for method in methods)
         scores = {}
-        for method in methods:
-            if method in self.methods:
+        failed = []
+        weighted_score = 0
+        skipped = []
+        bounds = None
+        for index, method in enumerate(methods):
+            if method in known_scores:
+                scores[method] = known_scores[method]
+            else:
+                if cascade and index > 0 and weighted_score + remaining_max <= threshold:
+                    bounds = (weighted_score + remaining_min, weighted_score + remaining_max)
+                    weighted_score += remaining_max
+                    skipped = methods[index:]
+                    break
+                start = time.perf_counter()
                 try:
                     scores[method] = self.methods[method](text1, text2)
                 except Exception as e:
                     print(f"方法 {method} 计算失败: {e}")
                     scores[method] = 0
-        
-        # 加权平均
-        weighted_score = sum(scores[method] * self.weights.get(method, 0.2) 
-                           for method in scores)
-        
+                    failed.append(method)
+                self._record_cost(method, time.perf_counter() - start)
+            # 加权平均
+            weight = self.weights.get(method, 0.2)
+            low, high = self.score_ranges.get(method, (0, 1))
+            weighted_score += scores[method] * weight
+            remaining_min -= low * weight
+            remaining_max -= high * weight
+
         return {
             'overall_similarity': weighted_score,
             'detailed_scores': scores,
-            'is_similar': weighted_score > 0.7  # 阈值可调
+            'skipped_methods': skipped,
+            'score_bounds': bounds or (weighted_score, weighted_score),
+            'failed_methods': failed,
+            'is_similar': weighted_score > threshold  # 阈值可调
+        }
+
+    def _record_cost(self, method, seconds):
+        """更新方法的实测耗时（指数滑动平均），用于 cascade 模式下的计算顺序；同时记入运行指标"""
+        metrics.observe("similarity_method_seconds", seconds, method=method)
+        previous = self.method_costs.get(method)
+        self.method_costs[method] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+    def method_versions(self, methods):
+        """各方法当前的计算配置标识；已保存的得分只有标识一致时才复用
+
+        依赖语料的方法（语料级 TF-IDF 的词表、Word2Vec 模型版本）在语料变化后标识随之改变
+        """
+        versions = {}
+        for method in methods:
+            if method == 'tfidf':
+                corpus_tfidf = get_corpus_tfidf()
+                versions[method] = f"corpus:{corpus_tfidf.fingerprint}" if corpus_tfidf.fitted else "pair"
+            elif method == 'word2vec':
+                corpus_word2vec = get_corpus_word2vec()
+                versions[method] = (corpus_word2vec.vector_key
+                                    if corpus_word2vec.fitted and corpus_word2vec.load() else "pair")
+            elif method == 'bert':
+                store = get_embedding_store()
+                versions[method] = store.version
+            elif method == 'ngram':
+                versions[method] = f"n={ARTIFACT_NGRAM_N}:v{ARTIFACT_VERSION}"
+            elif method == 'shingling':
+                versions[method] = f"k={ARTIFACT_SHINGLE_K}:v{ARTIFACT_VERSION}"
+            elif method == 'structure':
+                versions[method] = f"v{ARTIFACT_VERSION}"
+            else:
+                versions[method] = "1"
+        return versions
+
+    def _load_known_scores(self, hashes, chunk, versions):
+        """读取一块文档对已保存的、配置标识一致的各方法得分"""
+        stored = get_pair_scores([pair_score_key(hashes[i], hashes[j]) for i, j in chunk])
+        known = []
+        for i, j in chunk:
+            entry = stored.get(pair_score_key(hashes[i], hashes[j]), {})
+            known.append({method: item['score'] for method, item in entry.items()
+                          if method in versions and item.get('version') == versions[method]})
+        return known
+
+    def _save_new_scores(self, hashes, results, known, versions):
+        """保存本次新计算（且没有失败）的各方法得分"""
+        entries = {}
+        for (i, j, result), known_scores in zip(results, known):
+            new_scores = {method: {'score': float(score), 'version': versions[method]}
+                          for method, score in result['detailed_scores'].items()
+                          if method not in known_scores and method not in result['failed_methods']}
+            if new_scores:
+                entries[pair_score_key(hashes[i], hashes[j])] = new_scores
+        save_pair_scores(entries)
+
+    def score_pairs(self, documents, pairs, methods=None, threshold=0.7, cascade=False,
+                    workers=None, method_timeout=None, chunk_pairs=SIMILARITY_CHUNK_PAIRS, use_store=None):
+        """逐对计算综合相似度，按 pairs 的顺序产出 (i, j, comprehensive_similarity 结果)
+
+        workers > 1 时把文档对切分为工作量相近的块（见 iter_pair_chunks）分发给进程池，
+        同时在途的块数有上限，结果按块顺序流式返回，与单进程的输出完全一致；
+        method_timeout 为单个方法的超时时间（秒），超时按计算失败处理（该方法得 0 分）。
+        use_store=True（默认 PAIR_SCORE_STORE_ENABLED）时各方法得分按两个文档的文本哈希保存到数据库，
+        之后只计算新文档对或配置变化的方法；权重不参与保存，修改 self.weights 后直接用已保存的得分重新加权。
+        调用前应先 prepare_corpus，子进程直接使用预计算好的向量和预处理结果
+        """
+        methods = methods or list(self.methods)
+        workers = SIMILARITY_WORKERS if workers is None else workers
+        method_timeout = SIMILARITY_METHOD_TIMEOUT if method_timeout is None else method_timeout
+        use_store = PAIR_SCORE_STORE_ENABLED if use_store is None else use_store
+        hashes = [text_hash(text) for text in documents] if use_store else None
+        versions = self.method_versions(methods) if use_store else None
+
+        def chunks_with_known():
+            for chunk in iter_pair_chunks(pairs, documents, chunk_pairs):
+                known = self._load_known_scores(hashes, chunk, versions) if use_store else [None] * len(chunk)
+                yield chunk, known
+
+        def finish(results, known):
+            if use_store:
+                self._save_new_scores(hashes, results, known, versions)
+            return results
+
+        if workers <= 1:
+            scorer = self
+            if method_timeout:
+                scorer = AdvancedSimilarityDetector()
+                scorer.weights = self.weights
+                scorer.method_costs = self.method_costs
+                scorer.methods = {name: _call_with_timeout(func, method_timeout)
+                                  for name, func in self.methods.items()}
+            for chunk, known in chunks_with_known():
+                results = [(i, j, scorer.comprehensive_similarity(documents[i], documents[j], methods,
+                                                                  threshold=threshold, cascade=cascade,
+                                                                  known_scores=known_scores))
+                           for (i, j), known_scores in zip(chunk, known)]
+                yield from finish(results, known)
+            return
+
+        stores = {
+            'tfidf': get_corpus_tfidf(),
+            'word2vec': get_corpus_word2vec(),
+            'bert': get_embedding_store(),
+            'artifacts': get_artifact_store(),
         }
+        print(f"  - 使用 {workers} 个进程逐对比较...")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pair_worker,
+                                 initargs=(documents, self.weights, stores, method_timeout)) as pool:
+            in_flight = deque()
+            for chunk, known in chunks_with_known():
+                future = pool.submit(_score_pair_chunk, chunk, known, methods, threshold, cascade)
+                in_flight.append((future, known))
+                if len(in_flight) >= workers * 2:
+                    future, known = in_flight.popleft()
+                    results, worker_metrics = future.result()
+                    metrics.get_metrics().merge(worker_metrics)
+                    yield from finish(results, known)
+            while in_flight:
+                future, known = in_flight.popleft()
+                results, worker_metrics = future.result()
+                metrics.get_metrics().merge(worker_metrics)
+                yield from finish(results, known)
+
+    def prepare_corpus(self, documents, methods=None):
+        """逐对比较之前，对整个语料批量预计算文档级数据（如 BERT 向量），避免每对文档重复计算
+
+        返回可以参与比较的方法列表：某个方法预计算失败（如 BERT 模型无法加载）时打印原因并从列表中去掉，
+        记入 self.failed_methods，其余方法照常比较（去掉的方法对加权得分的贡献与原来计算失败记 0 分相同）
+        """
+        methods = list(methods or self.methods)
+        self.failed_methods = []
+        artifact_methods = [method for method in methods
+                            if method in ('tfidf', 'word2vec', 'ngram', 'shingling', 'structure')]
+        steps = [
+            (artifact_methods, lambda: get_artifact_store().get_many(documents)),
+            (['tfidf'], lambda: get_corpus_tfidf().fit(documents)),
+            (['word2vec'], lambda: get_corpus_word2vec().update(documents).vectors(documents)),
+            (['bert'], lambda: get_embedding_store().embed(documents)),
+        ]
+        for step_methods, prepare in steps:
+            step_methods = [method for method in step_methods if method in methods]
+            if not step_methods:
+                continue
+            try:
+                prepare()
+            except Exception as e:
+                print(f"[警告] {'/'.join(step_methods)} 预计算失败，本次不参与比较: {e}")
+                self.failed_methods.extend(step_methods)
+                methods = [method for method in methods if method not in step_methods]
+        return methods
+
+    def candidate_pairs(self, documents, tfidf_min_similarity=None, tfidf_top_k=None, lsh_min_jaccard=None,
+                        block_ids=None):
+        """生成需要逐对比较的文档下标 (i, j)
+
+        默认比较所有文档对；设置 lsh_min_jaccard 时用 MinHash-LSH 索引（见 lsh_index.MinHashLSH）筛选，
+        只保留 5-shingle 估计 Jaccard 相似度不低于该值的文档对；
+        设置 tfidf_min_similarity / tfidf_top_k 时先用语料级 TF-IDF 稀疏矩阵乘法筛选，
+        只保留余弦相似度不低于阈值、或属于各文档前 k 个最相似文档的文档对；
+        给出 block_ids（见 project_blocking.block_documents）时只保留同一分组内的文档对。多个条件同时设置时取交集
+        """
+        use_tfidf = tfidf_min_similarity is not None or tfidf_top_k is not None
 
-    def detect_all_documents(self, threshold=0.5, methods=['tfidf', 'word2vec','levenshtein', 'sequence', 'jaro_winkler', 'ngram', 'shingling', 'bert', 'structure']):
-        """检测数据库中所有文档的相似度"""
+        def same_block(i, j):
+            return block_ids is None or (block_ids[i] is not None and block_ids[i] == block_ids[j])
+
+        if lsh_min_jaccard is None and not use_tfidf:
+            if block_ids is not None:
+                yield from pairs_within_blocks(block_ids)
+                return
+            for i in range(len(documents)):
+                for j in range(i+1, len(documents)):
+                    yield i, j
+            return
+        lsh_pairs = None
+        if lsh_min_jaccard is not None:
+            lsh_pairs = [(i, j) for i, j, _ in get_lsh_index().candidate_pairs(documents, lsh_min_jaccard)
+                         if same_block(i, j)]
+            print(f"  - LSH 候选文档对: {len(lsh_pairs)} / {len(documents) * (len(documents) - 1) // 2}")
+            if not use_tfidf:
+                yield from lsh_pairs
+                return
+            lsh_pairs = set(lsh_pairs)
+        corpus_tfidf = get_corpus_tfidf().fit(documents)
+        for i, j, _ in corpus_tfidf.similar_pairs(documents, threshold=tfidf_min_similarity or 0.0,
+                                                  top_k=tfidf_top_k):
+            if (lsh_pairs is None or (i, j) in lsh_pairs) and same_block(i, j):
+                yield i, j
+
+    def detect_all_documents(self, threshold=0.5, methods=['tfidf', 'word2vec','levenshtein', 'sequence', 'jaro_winkler', 'ngram', 'shingling', 'bert', 'structure'],
+                             tfidf_min_similarity=None, tfidf_top_k=None, lsh_min_jaccard=None, cascade=False,
+                             workers=None, method_timeout=None):
+        """检测数据库中所有文档的相似度
+
+        tfidf_* / lsh_min_jaccard 参数见 candidate_pairs，cascade 见 comprehensive_similarity，
+        workers / method_timeout 见 score_pairs
+        """
         all_data = get_unique_data()
         print(f"共有{len(all_data)}个文件")
         if len(all_data) < 2:
             return {"message": "数据库中文档数量不足，无法进行相似度检测"}
         
-        # 提取文本内容
+        # 提取文本内容（元数据查询不含原始文本，这里按批读取）
         documents = []
         doc_info = []
-        for doc in all_data:
-            if '原始文本' in doc and doc['原始文本']:
-                documents.append(doc['原始文本'])
+        for doc, text in zip(all_data, load_texts(all_data)):
+            if text:
+                documents.append(text)
                 doc_info.append({
                     'file_name': doc.get('文件名', 'unknown'),
                     'file_type': doc.get('文件类型', 'unknown'),
                 })
         
         # 批量检测相似度
+        methods = self.prepare_corpus(documents, methods)
         results = []
-        for i in range(len(documents)):
-            for j in range(i+1, len(documents)):
-                similarity_result = self.comprehensive_similarity(
-                    documents[i], documents[j], methods
-                )
-                print(f"Comparing {doc_info[i]['file_name']} with {doc_info[j]['file_name']} similarity: {similarity_result['overall_similarity']:.4f}")
-                
-                if similarity_result['overall_similarity'] > threshold:
-                    results.append({
-                        'doc1': doc_info[i],
-                        'doc2': doc_info[j],
-                        'similarity_score': similarity_result['overall_similarity'],
-                        'detailed_scores': similarity_result['detailed_scores'],
-                        'is_highly_similar': similarity_result['overall_similarity'] > 0.8
-                    })
+        pairs = self.candidate_pairs(documents, tfidf_min_similarity, tfidf_top_k, lsh_min_jaccard)
+        for i, j, similarity_result in self.score_pairs(documents, pairs, methods, threshold, cascade,
+                                                        workers, method_timeout):
+            print(f"Comparing {doc_info[i]['file_name']} with {doc_info[j]['file_name']} similarity: {similarity_result['overall_similarity']:.4f}")
+            
+            if similarity_result['overall_similarity'] > threshold:
+                results.append({
+                    'doc1': doc_info[i],
+                    'doc2': doc_info[j],
+                    'similarity_score': similarity_result['overall_similarity'],
+                    'detailed_scores': similarity_result['detailed_scores'],
+                    'skipped_methods': similarity_result['skipped_methods'],
+                    'is_highly_similar': similarity_result['overall_similarity'] > 0.8
+                })
         
         # 按相似度排序
         results.sort(key=lambda x: x['similarity_score'], reverse=True)
         return results
     
-    def detect_bidding_documents(self, threshold=0.7):
-        """检测投标文件间的相似度"""
+    def detect_bidding_documents(self, threshold=0.7, tfidf_min_similarity=None, tfidf_top_k=None,
+                                 lsh_min_jaccard=None, cascade=False, workers=None, method_timeout=None,
+                                 block_by_project=False):
+        """检测投标文件间的相似度
+
+        tfidf_* / lsh_min_jaccard 参数见 candidate_pairs，大语料时用于避免两两全量比较；
+        block_by_project=True 时只比较同一项目（项目编号 / 项目名称，见 project_blocking）的投标文件，
+        无法分组的文件不参与比较，记录在 self.unblocked_documents 中；
+        cascade=True 时逐对比较提前停止，见 comprehensive_similarity；workers / method_timeout 见 score_pairs；
+        超过阈值的文档对附带 copied_passages（两份文件中重复的段落及字符位置，见 passage_finder）
+        """
         tender_files = get_tender_files()
         if len(tender_files) < 2:
             return {"message": "投标文件数量不足"}
         
+        # 元数据查询不含原始文本，这里按批读取
+        texts = load_texts(tender_files)
+        tender_files = [doc for doc, text in zip(tender_files, texts) if text]
+        documents = [text for text in texts if text]
+        methods = self.prepare_corpus(documents)
+        block_ids = None
+        self.unblocked_documents = []
+        if block_by_project:
+            block_ids, unblocked = block_documents(tender_files, documents)
+            self.unblocked_documents = [tender_files[i].get('文件名', 'unknown') for i in unblocked]
+            block_sizes = {}
+            for block_id in block_ids:
+                if block_id is not None:
+                    block_sizes[block_id] = block_sizes.get(block_id, 0) + 1
+            pair_count = sum(size * (size - 1) // 2 for size in block_sizes.values())
+            print(f"  - 按项目分为 {len(block_sizes)} 组，组内文档对 {pair_count} 个"
+                  f"（全部两两比较为 {len(documents) * (len(documents) - 1) // 2} 个），{len(unblocked)} 个文件无法分组")
         results = []
-        for i in range(len(tender_files)):
-            for j in range(i+1, len(tender_files)):
-                doc1 = tender_files[i]
-                doc2 = tender_files[j]
-
-                if doc1.get('原始文本') and doc2.get('原始文本'):
-                    similarity = self.comprehensive_similarity(
-                        doc1['原始文本'], doc2['原始文本']
-                    )
-                    
-                    if similarity['overall_similarity'] > threshold:
-                        results.append({
-                            'company1': doc1.get('投标单位', 'unknown'),
-                            'company2': doc2.get('投标单位', 'unknown'),
-                            'file1': doc1.get('文件名'),
-                            'file2': doc2.get('文件名'),
-                            'similarity_score': similarity['overall_similarity'],
-                            'detailed_scores': similarity['detailed_scores'],
-                            'plagiarism_risk': 'HIGH' if similarity['overall_similarity'] > 0.8 else 'MEDIUM'
-                        })
+        pairs = self.candidate_pairs(documents, tfidf_min_similarity, tfidf_top_k, lsh_min_jaccard, block_ids)
+        for i, j, similarity in self.score_pairs(documents, pairs, methods, threshold=threshold, cascade=cascade,
+                                                 workers=workers, method_timeout=method_timeout):
+            doc1 = tender_files[i]
+            doc2 = tender_files[j]
+            
+            if similarity['overall_similarity'] > threshold:
+                passages = find_shared_passages(documents[i], documents[j])
+                results.append({
+                    'company1': doc1.get('投标单位名称') or 'unknown',
+                    'company2': doc2.get('投标单位名称') or 'unknown',
+                    'file1': doc1.get('文件名'),
+                    'file2': doc2.get('文件名'),
+                    'similarity_score': similarity['overall_similarity'],
+                    'detailed_scores': similarity['detailed_scores'],
+                    'skipped_methods': similarity['skipped_methods'],
+                    'copied_passages': passages,
+                    'copied_ratio': passage_coverage(passages, len(documents[i])),
+                    'plagiarism_risk': 'HIGH' if similarity['overall_similarity'] > 0.8 else 'MEDIUM'
+                })
         
         return sorted(results, key=lambda x: x['similarity_score'], reverse=True)
     
@@ -258,18 +537,18 @@ class AdvancedSimilarityDetector:
         """将指定文档与模板文档进行比较"""
         from db_manager import get_data_by_file_name
         
-        target_doc = get_data_by_file_name(target_file_name)
-        template_doc = get_data_by_file_name(template_file_name)
+        target_doc = get_data_by_file_name(target_file_name, with_text=True)
+        template_doc = get_data_by_file_name(template_file_name, with_text=True)
         
         if not target_doc or not template_doc:
             return {"error": "文档未找到"}
         
-        if not target_doc.get('content') or not template_doc.get('content'):
+        if not target_doc.get('原始文本') or not template_doc.get('原始文本'):
             return {"error": "文档内容为空"}
         
         similarity = self.comprehensive_similarity(
-            target_doc['content'], 
-            template_doc['content'], 
+            target_doc['原始文本'], 
+            template_doc['原始文本'], 
             methods
         )
         
@@ -280,40 +559,24 @@ class AdvancedSimilarityDetector:
             'recommendation': self._get_similarity_recommendation(similarity['overall_similarity'])
         }
     
-    def find_similar_to_document(self, file_name, threshold=0.5, top_n=5):
-        """找到与指定文档最相似的其他文档"""
-        from db_manager import get_data_by_file_name
-        
-        target_doc = get_data_by_file_name(file_name)
-        if not target_doc or not target_doc.get('content'):
+    def find_similar_to_document(self, file_name, threshold=0.5, top_n=5, file_type=None, kind=None):
+        """找到与指定文档最相似的其他文档
+
+        使用内存中的文档向量索引（见 vector_index.DocumentVectorIndex，kind 为 "tfidf" 或 "bert"），
+        threshold 为最低余弦相似度，file_type 只返回该类型的文档
+        """
+        index = get_vector_index(kind or VECTOR_INDEX_KIND).refresh()
+        if not any(meta['file_name'] == file_name for meta in index.meta):
             return {"error": "目标文档未找到或内容为空"}
-        
-        all_data = get_all_data()
-        similarities = []
-        
-        for doc in all_data:
-            if (doc.get('文件名') != file_name and 
-                doc.get('content')):
-                
-                similarity = self.comprehensive_similarity(
-                    target_doc['content'], 
-                    doc['content']
-                )
-                
-                if similarity['overall_similarity'] > threshold:
-                    similarities.append({
-                        'file_name': doc.get('文件名'),
-                        'file_type': doc.get('文件类型'),
-                        'company': doc.get('采购人名称', doc.get('投标单位')),
-                        'similarity_score': similarity['overall_similarity']
-                    })
-        
-        # 返回最相似的前N个文档
-        similarities.sort(key=lambda x: x['similarity_score'], reverse=True)
-        return similarities[:top_n]
+        return index.query(file_name=file_name, top_k=top_n, file_type=file_type, min_score=threshold)
+
+    def find_similar_to_text(self, text, threshold=0.0, top_n=5, file_type=None, kind=None):
+        """找到与一段新文本（未入库）最相似的已入库文档，参数同 find_similar_to_document"""
+        index = get_vector_index(kind or VECTOR_INDEX_KIND).refresh()
+        return index.query(text=text, top_k=top_n, file_type=file_type, min_score=threshold)
     
-    def generate_similarity_report(self, output_file='similarity_report.txt'):
-      """生成完整的相似度检测报告"""
+    def generate_similarity_report(self, output_file='similarity_report.txt', block_by_project=False):
+      """生成完整的相似度检测报告（block_by_project 见 detect_bidding_documents）"""
       report = []
       report.append("=" * 80)
       report.append("文档相似度检测报告")
@@ -321,7 +584,7 @@ class AdvancedSimilarityDetector:
       report.append("")
       
       # 投标抄袭检测
-      plagiarism = self.detect_bidding_documents(threshold=0.7)
+      plagiarism = self.detect_bidding_documents(threshold=0.7, block_by_project=block_by_project)
 
       if isinstance(plagiarism, dict) and 'message' in plagiarism:
           report.append(f"1. 投标抄袭检测 (阈值: 0.7)")
@@ -381,6 +644,23 @@ class AdvancedSimilarityDetector:
                       report.append("   各评分方法分数：")
                       for method, method_score in detailed_scores.items():
                           report.append(f"     - {method}: {method_score:.4f}")
+                  skipped_methods = result.get('skipped_methods')
+                  if skipped_methods:
+                      report.append(f"   提前停止未计算的方法: {', '.join(skipped_methods)}")
+
+                  # 重复段落
+                  passages = result.get('copied_passages') or []
+                  if passages:
+                      report.append(f"   重复段落: 共 {len(passages)} 段，占文件1 {result.get('copied_ratio', 0):.1%}")
+                      longest = sorted(passages, key=lambda p: p['length'], reverse=True)[:PASSAGE_REPORT_LIMIT]
+                      for passage in sorted(longest, key=lambda p: p['start1']):
+                          excerpt = passage['text1'].replace('\n', ' ')
+                          if len(excerpt) > 80:
+                              excerpt = excerpt[:80] + '...'
+                          report.append(f"     - 文件1[{passage['start1']}:{passage['end1']}] <-> "
+                                        f"文件2[{passage['start2']}:{passage['end2']}] ({passage['length']} 字): {excerpt}")
+                      if len(passages) > len(longest):
+                          report.append(f"     ... 另有 {len(passages) - len(longest)} 段较短的重复段落未列出")
                   report.append("")          
                           
               except Exception as e:
@@ -409,6 +689,17 @@ class AdvancedSimilarityDetector:
           report.append(f"中风险案例 (0.7-0.8): {medium_risk_count}")
           report.append(f"低风险案例 (<0.7): {low_risk_count}")
 
+      failed_methods = getattr(self, 'failed_methods', [])
+      if failed_methods:
+          report.append(f"预计算失败、未参与比较的方法: {', '.join(failed_methods)}")
+
+      if block_by_project:
+          unblocked = getattr(self, 'unblocked_documents', [])
+          report.append("")
+          report.append(f"未能按项目分组的文件（未参与比较）: {len(unblocked)}")
+          for file_name in unblocked:
+              report.append(f"  - {file_name}")
+
       report.append("")
       report.append(f"报告生成时间: {self._get_current_time()}")
       report.append("=" * 80)
@@ -457,7 +748,85 @@ class AdvancedSimilarityDetector:
         return patterns if patterns else ["一般相似"]
 
   
-def create_similarity_detect_report():
+# ---- 多进程逐对比较 ----
+# 子进程通过 initializer 收到全部文本和已预计算的语料级数据（向量、词表、预处理结果），之后只接收文档对下标
+
+_pair_worker = {}
+
+
+def _call_with_timeout(func, timeout):
+    """在单独的线程中执行 func，超过 timeout 秒抛出 TimeoutError（超时的线程无法强制结束，会在后台跑完）"""
+    def wrapper(text1, text2):
+        outcome = {}
+
+        def target():
+            try:
+                outcome['value'] = func(text1, text2)
+            except BaseException as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            raise TimeoutError(f"超过 {timeout} 秒")
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['value']
+    return wrapper
+
+
+def _init_pair_worker(documents, weights, stores, method_timeout):
+    import corpus_models
+    import doc_artifacts
+
+    metrics.reset()
+    corpus_models._corpus_tfidf = stores['tfidf']
+    corpus_models._corpus_word2vec = stores['word2vec']
+    corpus_models._embedding_store = stores['bert']
+    doc_artifacts._artifact_store = stores['artifacts']
+    doc_artifacts._artifact_store.workers = 1  # 子进程内不再开进程池
+
+    detector = AdvancedSimilarityDetector()
+    detector.weights = weights
+    if method_timeout:
+        detector.methods = {name: _call_with_timeout(func, method_timeout)
+                            for name, func in detector.methods.items()}
+    _pair_worker['documents'] = documents
+    _pair_worker['detector'] = detector
+
+
+def _score_pair_chunk(pairs, known, methods, threshold, cascade):
+    """子进程中比较一块文档对，返回 (结果列表, 本块记录的运行指标)"""
+    documents = _pair_worker['documents']
+    detector = _pair_worker['detector']
+    results = [(i, j, detector.comprehensive_similarity(documents[i], documents[j], methods,
+                                                        threshold=threshold, cascade=cascade,
+                                                        known_scores=known_scores))
+               for (i, j), known_scores in zip(pairs, known)]
+    return results, metrics.get_metrics().drain()
+
+
+def iter_pair_chunks(pairs, documents, chunk_pairs=SIMILARITY_CHUNK_PAIRS):
+    """把文档对流切分为工作量相近的块
+
+    逐对比较的耗时大致与两文本长度之积成正比（编辑距离类方法），每块的长度积之和约为 chunk_pairs 对平均长度文档的工作量
+    """
+    lengths = [max(len(text), 1) for text in documents]
+    mean_length = sum(lengths) / len(lengths) if lengths else 1
+    budget = chunk_pairs * mean_length * mean_length
+    chunk, cost = [], 0
+    for i, j in pairs:
+        chunk.append((i, j))
+        cost += lengths[i] * lengths[j]
+        if cost >= budget or len(chunk) >= chunk_pairs * 4:
+            yield chunk
+            chunk, cost = [], 0
+    if chunk:
+        yield chunk
+
+
+def create_similarity_detect_report(output_file='similarity_report.txt', block_by_project=False):
     """创建相似度检测报告"""
   
     # 创建检测器实例
@@ -465,8 +834,10 @@ def create_similarity_detect_report():
     
     # 直接生成投标文档抄袭检测报告
     print("   开始生成投标抄袭检测报告...")
-    report = detector.generate_similarity_report()
+    report = detector.generate_similarity_report(output_file, block_by_project=block_by_project)
     
     return report
 
-create_similarity_detect_report()
\ No newline at end of file
+
+if __name__ == "__main__":
+    create_similarity_detect_report()
@@ -1,7 +1,21 @@
+import hashlib
 import re
+import unicodedata
 import cn2an # 将中文大写金额转换为阿拉伯数字
 from datetime import datetime
 
+# 文本内容哈希，用于按内容缓存文档级数据（向量、分词等）
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# 当前进程常驻内存（MB），未安装 psutil 时返回 None
+def get_rss_mb():
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
 def clean_text(text):
     return re.sub(r"\s+", " ", text).strip()
 
@@ -19,8 +33,8 @@ def clean_ocr_text(text):
     return "\n".join(cleaned)
 
 # NLP 文本预处理函数
-def preprocess_text_for_nlp(text):
-    """为 NLP 处理预处理文本"""
+def preprocess_text_for_nlp(text, max_length=10000):
+    """为 NLP 处理预处理文本，max_length 为 None 时不截断"""
     # 移除多余的空白字符
     text = re.sub(r'\s+', ' ', text)
     
@@ -28,11 +42,46 @@ def preprocess_text_for_nlp(text):
     text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9，。！？；（）：\-\s]', '', text)
     
     # 限制文本长度（避免模型处理过长文本）
-    if len(text) > 10000:
-        text = text[:10000]
+    if max_length and len(text) > max_length:
+        text = text[:max_length]
     
     return text.strip()
 
+# 将长文本切分为相互重叠的窗口
+def split_text_windows(text, window=400, overlap=50):
+    """返回 [(起始位置, 窗口文本)]，相邻窗口重叠 overlap 个字符，避免实体被切断"""
+    if len(text) <= window:
+        return [(0, text)] if text else []
+    step = max(window - overlap, 1)
+    windows = []
+    for start in range(0, len(text), step):
+        windows.append((start, text[start:start + window]))
+        if start + window >= len(text):
+            break
+    return windows
+
+# 逐段（如逐页）切分重叠窗口
+def iter_text_windows(pieces, window=400, overlap=50):
+    """split_text_windows 的流式版本，pieces 为文本片段的可迭代对象（如 PDF 的逐页文本）
+
+    每段经 preprocess_text_for_nlp 预处理后以空格连接，依次产出窗口文本；
+    只在内存中保留尚未切出的末尾部分，结果与先拼接全文再切分相同
+    """
+    step = max(window - overlap, 1)
+    buffer = ""
+    for piece in pieces:
+        piece = preprocess_text_for_nlp(piece, max_length=None)
+        if not piece:
+            continue
+        buffer = f"{buffer} {piece}" if buffer else piece
+        start = 0
+        while len(buffer) - start > window:
+            yield buffer[start:start + window]
+            start += step
+        buffer = buffer[start:]
+    if buffer:
+        yield buffer
+
 # 提取第一个匹配项
 def find_first(text, pattern, group=1):
     """使用正则表达式提取第一个匹配项"""
@@ -64,6 +113,24 @@ def normalize_text(text):
     
     return '\n'.join(line for line in lines if line)
 
+# 公司名称末尾不区分公司的组织形式后缀（按长度从长到短匹配）
+COMPANY_SUFFIXES = ("股份有限公司", "有限责任公司", "集团有限公司", "有限公司", "集团公司", "公司")
+
+def normalize_company_name(name):
+    """公司名称规范化：全角转半角、字母转小写、去掉空白和标点（含括号）、去掉"有限公司"等后缀"""
+    if not name:
+        return ""
+    name = unicodedata.normalize("NFKC", str(name)).lower()
+    name = re.sub(r"[\s\W_]+", "", name)
+    for suffix in COMPANY_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def company_name_ngrams(name, sizes=(2, 3)):
+    """规范化公司名称的 n-gram 集合，用于子串查询的索引"""
+    return {name[i:i + n] for n in sizes for i in range(len(name) - n + 1)}
+
 def extract_date(text):
     match = re.search(r"(\d{4}[\-/年]\d{1,2}[\-/月]\d{1,2})", text)
     if match:
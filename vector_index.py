@@ -0,0 +1,173 @@
+# 文档向量索引：在内存中保存所有已入库文档的 TF-IDF 或 BERT 向量，按文件名或新文本查询最相似的 k 个文档
+import threading
+import time
+
+import numpy as np
+
+from config import (
+    VECTOR_INDEX_KIND, VECTOR_INDEX_TFIDF_PATH, VECTOR_INDEX_FULL_SYNC_SECONDS, VECTOR_INDEX_REFIT_GROWTH,
+)
+from corpus_models import CorpusTfidf, get_embedding_store
+
+# 索引中每个文档保存的元数据字段
+_META_FIELDS = {"文件名": 1, "文件类型": 1, "投标单位名称": 1, "招标单位名称": 1, "文本哈希": 1}
+
+
+class DocumentVectorIndex:
+    """已入库文档的向量索引
+
+    kind="tfidf" 使用索引自己的 TF-IDF 词表（在整个集合上拟合，保存到 tfidf_path，
+    与相似度检测按投标文件拟合的语料级词表互不影响），kind="bert" 使用 BERT 文档向量；
+    向量均已 L2 归一化，一次矩阵-向量乘法得到查询与所有文档的余弦相似度。
+    refresh() 平时只按 _id 水位线查询新入库的文档；每隔 full_sync_seconds 秒（或 full=True 时）
+    扫描一次全部元数据，移除已删除的文档、补上水位线之前写入的文档，
+    此时集合比上次拟合时增长超过 refit_growth 的比例则重新拟合词表并整体重建。
+    """
+
+    def __init__(self, kind=VECTOR_INDEX_KIND, tfidf_path=VECTOR_INDEX_TFIDF_PATH,
+                 full_sync_seconds=VECTOR_INDEX_FULL_SYNC_SECONDS, refit_growth=VECTOR_INDEX_REFIT_GROWTH):
+        if kind not in ("tfidf", "bert"):
+            raise ValueError(f"不支持的向量类型: {kind}")
+        self.kind = kind
+        self.full_sync_seconds = full_sync_seconds
+        self.refit_growth = refit_growth
+        self.tfidf = CorpusTfidf(path=tfidf_path) if kind == "tfidf" else None
+        self.ids = []  # 数据库 _id，与矩阵的行一一对应
+        self.meta = []  # [{"file_name", "file_type", "company"}]
+        self._rows = {}  # _id -> 向量（稀疏行或一维数组）
+        self._meta = {}
+        self._matrix = None
+        self._file_types = None
+        self._fingerprint = None
+        self._watermark = None  # 已同步的最大 _id
+        self._last_full_sync = None
+        self._lock = threading.Lock()
+
+    def _vectorize(self, texts):
+        if self.kind == "bert":
+            return list(get_embedding_store().embed(texts))
+        matrix = self.tfidf.transform(texts)
+        return [matrix[i] for i in range(matrix.shape[0])]
+
+    def _load_texts(self, docs):
+        from db_manager import load_texts
+        return {doc["_id"]: text or "" for doc, text in zip(docs, load_texts(docs))}
+
+    def refresh(self, full=False):
+        """与数据库同步：只为新增文档计算向量；全量同步时同时移除已删除的文档"""
+        from db_manager import get_collection
+
+        with self._lock:
+            full = (full or self._last_full_sync is None
+                    or time.monotonic() - self._last_full_sync >= self.full_sync_seconds)
+            if full:
+                current = {doc["_id"]: doc for doc in get_collection().find({}, _META_FIELDS)}
+            else:
+                query = {"_id": {"$gt": self._watermark}} if self._watermark is not None else {}
+                current = {doc["_id"]: doc for doc in get_collection().find(query, _META_FIELDS)}
+            if self.kind == "tfidf":
+                self._fit_tfidf(current, full)
+
+            removed = [doc_id for doc_id in self._rows if doc_id not in current] if full else []
+            for doc_id in removed:
+                del self._rows[doc_id]
+                del self._meta[doc_id]
+            added = [doc_id for doc_id in current if doc_id not in self._rows]
+            if added:
+                texts = self._load_texts([current[doc_id] for doc_id in added])
+                added = [doc_id for doc_id in added if texts.get(doc_id)]
+                if added:
+                    print(f"  - 向量索引新增 {len(added)} 个文档（{self.kind}）")
+                    for doc_id, vector in zip(added, self._vectorize([texts[doc_id] for doc_id in added])):
+                        doc = current[doc_id]
+                        self._rows[doc_id] = vector
+                        self._meta[doc_id] = {
+                            "file_name": doc.get("文件名"),
+                            "file_type": doc.get("文件类型"),
+                            "company": doc.get("投标单位名称") or doc.get("招标单位名称"),
+                        }
+            if current:
+                newest = max(current)
+                self._watermark = newest if self._watermark is None else max(self._watermark, newest)
+            if full:
+                self._last_full_sync = time.monotonic()
+            if removed or added or self._matrix is None:
+                self._rebuild()
+        return self
+
+    def _fit_tfidf(self, current, full):
+        """索引自己的词表：首次全量同步时加载或在全部文档上拟合，之后集合明显增长时重新拟合"""
+        if not full:
+            return
+        if not self.tfidf.fitted:
+            self.tfidf.load()
+        if not self.tfidf.fitted or len(current) > self.tfidf.documents * (1 + self.refit_growth):
+            texts = [text for text in self._load_texts(list(current.values())).values() if text]
+            if texts:
+                self.tfidf.fit(texts)
+        if self.tfidf.fingerprint != self._fingerprint:
+            # 词表变化后旧向量不可比，整体重建
+            self._rows, self._meta = {}, {}
+            self._fingerprint = self.tfidf.fingerprint
+
+    def _rebuild(self):
+        self.ids = list(self._rows)
+        self.meta = [self._meta[doc_id] for doc_id in self.ids]
+        self._file_types = np.array([m["file_type"] or "" for m in self.meta], dtype=object)
+        if not self.ids:
+            self._matrix = None
+        elif self.kind == "bert":
+            self._matrix = np.vstack([self._rows[doc_id] for doc_id in self.ids])
+        else:
+            from scipy.sparse import vstack
+            self._matrix = vstack([self._rows[doc_id] for doc_id in self.ids], format="csr")
+
+    def query(self, file_name=None, text=None, top_k=5, file_type=None, min_score=None):
+        """返回与指定文档（file_name，须已入库）或新文本（text）最相似的 top_k 个已入库文档
+
+        结果按相似度从高到低排列：[{"file_name", "file_type", "company", "similarity_score"}]；
+        file_type 只返回该类型的文档，min_score 过滤相似度低于该值的文档
+        """
+        if self._matrix is None:
+            self.refresh()
+        if self._matrix is None:
+            return []
+        exclude = None
+        if file_name is not None:
+            positions = [i for i, m in enumerate(self.meta) if m["file_name"] == file_name]
+            if not positions:
+                return []
+            exclude = positions
+            query_vector = self._matrix[positions[0]]
+        elif text:
+            query_vector = self._vectorize([text])[0]
+        else:
+            raise ValueError("需要提供 file_name 或 text")
+
+        if self.kind == "bert":
+            scores = self._matrix @ np.asarray(query_vector).ravel()
+        else:
+            scores = np.asarray((self._matrix @ query_vector.T).todense()).ravel()
+        mask = np.ones(len(scores), dtype=bool)
+        if exclude:
+            mask[exclude] = False
+        if file_type is not None:
+            mask &= self._file_types == file_type
+        if min_score is not None:
+            mask &= scores >= min_score
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > top_k:
+            best = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[best]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [dict(self.meta[i], similarity_score=float(scores[i])) for i in candidates]
+
+
+_vector_indexes = {}
+
+
+def get_vector_index(kind=VECTOR_INDEX_KIND):
+    """获取指定类型的默认向量索引"""
+    if kind not in _vector_indexes:
+        _vector_indexes[kind] = DocumentVectorIndex(kind)
+    return _vector_indexes[kind]